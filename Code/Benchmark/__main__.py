@@ -0,0 +1,26 @@
+"""File to initiate the running of the benchmarks."""
+
+# Python imports.
+import json
+import sys
+
+# User imports.
+import Benchmark.run_benchmarks
+import Utilities.json_to_ascii
+
+# Globals
+PYVERSION = sys.version_info[0]  # Determine major version number.
+
+
+# The stages benchmarked may use pools of worker processes. On platforms where the workers are spawned rather than
+# forked, this file is re-imported by each worker, so the benchmarks must only be started by the main process.
+if __name__ == "__main__":
+    fileParams = sys.argv[1]
+    readParams = open(fileParams, 'r')
+    parsedArgs = json.load(readParams)
+    if PYVERSION < 3:
+        # Convert unicode characters to ascii (needed for Python < 3).
+        parsedArgs = Utilities.json_to_ascii.json_to_ascii(parsedArgs)
+    readParams.close()
+
+    Benchmark.run_benchmarks.main(parsedArgs)
@@ -0,0 +1,73 @@
+"""Code to compare the benchmark results of two commits.
+
+Usage is "python -m Benchmark.compare Baseline.json Current.json [Tolerance]" from the Code directory. The median wall
+time and the peak memory use of each stage at each size are compared, and a stage is reported as a regression when
+either has grown by more than the tolerance (a fraction, defaulting to 0.1). The exit status is 1 if there are any
+regressions, so that the comparison can be used in scripts.
+
+"""
+
+# Python imports.
+import json
+import sys
+
+# 3rd party imports.
+import numpy as np
+
+
+def summarise(fileResults):
+    """Summarise the results of a benchmark run.
+
+    :param fileResults: The location of the results file written by Benchmark.run_benchmarks.
+    :type fileResults:  str
+    :return :           The median wall time and the largest peak memory use of each stage at each size, keyed by the
+                            stage name and size.
+    :rtype :            dict
+
+    """
+
+    with open(fileResults, 'r') as fidResults:
+        results = json.load(fidResults)["Results"]
+    summary = {}
+    for i in results:
+        summary.setdefault((i["Stage"], i["Size"]), []).append(i)
+    return {i: (np.median([j["WallTime"] for j in summary[i]]), max(j["PeakRSS"] or 0 for j in summary[i]))
+            for i in summary}
+
+
+def main(fileBaseline, fileCurrent, tolerance=0.1):
+    """Compare the results of two benchmark runs.
+
+    :param fileBaseline:    The location of the results to compare against.
+    :type fileBaseline:     str
+    :param fileCurrent:     The location of the results to compare.
+    :type fileCurrent:      str
+    :param tolerance:       The fraction by which the wall time or peak memory use of a stage can grow before it's
+                                reported as a regression.
+    :type tolerance:        float
+    :return :               The stages (and sizes) that have regressed.
+    :rtype :                list of (str, int) tuples
+
+    """
+
+    baseline = summarise(fileBaseline)
+    current = summarise(fileCurrent)
+    regressions = []
+    print("{0:<18s}{1:>7s}{2:>12s}{3:>12s}{4:>9s}{5:>12s}{6:>12s}{7:>9s}".format(
+        "Stage", "Size", "Time(s)", "Was(s)", "Ratio", "RSS(MB)", "Was(MB)", "Ratio"))
+    for stageName, size in sorted(set(baseline) & set(current)):
+        baseTime, basePeak = baseline[(stageName, size)]
+        currentTime, currentPeak = current[(stageName, size)]
+        timeRatio = currentTime / baseTime if baseTime else np.nan
+        peakRatio = currentPeak / basePeak if basePeak else np.nan
+        isRegression = timeRatio > 1 + tolerance or peakRatio > 1 + tolerance
+        if isRegression:
+            regressions.append((stageName, size))
+        print("{0:<18s}{1:>7d}{2:>12.3f}{3:>12.3f}{4:>9.2f}{5:>12.1f}{6:>12.1f}{7:>9.2f}{8:s}".format(
+            stageName, size, currentTime, baseTime, timeRatio, currentPeak / 2 ** 20, basePeak / 2 ** 20, peakRatio,
+            "  REGRESSION" if isRegression else ""))
+    return regressions
+
+
+if __name__ == "__main__":
+    sys.exit(1 if main(sys.argv[1], sys.argv[2], float(sys.argv[3]) if len(sys.argv) > 3 else 0.1) else 0)
@@ -0,0 +1,220 @@
+"""Code to benchmark the preprocessing and histogram prediction pipelines on synthetic data.
+
+Synthetic WSIs and cleaned images are generated at each of the requested sizes, and each stage is then run (in a fresh
+process) a number of times at each size. The wall time, CPU time, throughput and peak memory use of every run are
+written to a JSON file named after the git commit being benchmarked, so that the results for two commits can be
+compared with Benchmark/compare.py.
+
+"""
+
+# Python imports.
+import datetime
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+
+# 3rd party imports.
+import numpy as np
+
+# User imports.
+from . import stages
+from . import synthetic_data
+import Utilities.merge_dictionaries
+
+# Globals.
+CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # The Code directory the stages are run from.
+SLIDE_STAGES = ["generate_images", "create_image_mask"]  # The stages run at each WSI size.
+IMAGE_STAGES = ["histogram", "cross_validation"]  # The stages run at each cleaned image size.
+
+
+def git_commit():
+    """Determine the git commit of the code being benchmarked.
+
+    :return :   The hash of the commit, and whether the tracked files have uncommitted changes. Both are None if the
+                    code isn't in a git repository (or git isn't available).
+    :rtype :    str, bool
+
+    """
+
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=CODE_DIR, stderr=subprocess.DEVNULL,
+                                         universal_newlines=True).strip()
+        changes = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd=CODE_DIR,
+                                          stderr=subprocess.DEVNULL, universal_newlines=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(changes.strip())
+
+
+def run_stage(stageName, stageConfig, dirWork):
+    """Run a stage of the benchmark in a fresh process.
+
+    :param stageName:   The name of the stage (see Benchmark.stages.STAGES).
+    :type stageName:    str
+    :param stageConfig: The configuration of the stage.
+    :type stageConfig:  dict
+    :param dirWork:     The directory to write the configuration and record of the stage to.
+    :type dirWork:      str
+    :return :           The record of the stage (see Benchmark.stages), or None if the stage failed.
+    :rtype :            dict
+
+    """
+
+    fileConfig = "{0:s}/StageConfig.json".format(dirWork)
+    fileRecord = "{0:s}/StageRecord.json".format(dirWork)
+    with open(fileConfig, 'w') as fidConfig:
+        json.dump(stageConfig, fidConfig, indent=1)
+    if os.path.isfile(fileRecord):
+        os.remove(fileRecord)
+
+    # The output of the stage is only displayed if it fails.
+    stageRun = subprocess.run([sys.executable, "-m", "Benchmark.stages", stageName, fileConfig, fileRecord],
+                              cwd=CODE_DIR, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    if stageRun.returncode != 0 or not os.path.isfile(fileRecord):
+        print("Stage {0:s} failed:\n{1:s}".format(stageName, stageRun.stdout))
+        return None
+    with open(fileRecord, 'r') as fidRecord:
+        return json.load(fidRecord)
+
+
+def main(arguments):
+    """Run the benchmarks.
+
+    :param arguments:   The benchmark arguments in JSON format.
+    :type arguments:    JSON object
+    :return :           The location of the results file.
+    :rtype :            str
+
+    """
+
+    # Process the parameters.
+    dirWork = os.path.abspath(arguments["WorkLocation"])  # Directory to generate the synthetic data in.
+    dirResults = arguments["ResultsLocation"]  # Directory to save the results in.
+    for i in [dirWork, dirResults]:
+        if not os.path.exists(i):
+            os.makedirs(i)
+    stagesToRun = arguments.get("Stages", list(stages.STAGES))  # The stages to benchmark.
+    slideSizes = arguments.get("SlideSizes", [2048, 8192])  # The sizes of the (square) synthetic WSIs.
+    imageSizes = arguments.get("ImageSizes", [256, 1024])  # The sizes of the (square) synthetic cleaned images.
+    numImages = arguments.get("NumImages", 40)  # The number of cleaned images at each size.
+    numRepeats = arguments.get("Repeats", 3)  # The number of times to run each stage at each size.
+    seed = arguments.get("Seed", 0)  # The seed for generating the synthetic data.
+    dirOpenSlideBin = os.path.abspath(arguments.get("OpenSlideBinLocation", CODE_DIR))
+    preprocessingParams = arguments.get("PreprocessingParameters", {})  # Preprocessing arguments to override.
+    trainingParams = arguments.get("TrainingParameters", {})  # Training arguments to override.
+
+    # Generate the synthetic data. The data for a given size and seed is always the same, so it's only generated once.
+    if any(i in stagesToRun for i in SLIDE_STAGES):
+        for i in slideSizes:
+            dirSlides = "{0:s}/Slides_{1:d}_{2:d}".format(dirWork, i, seed)
+            if not os.path.isdir(dirSlides):
+                print("Generating the synthetic WSI of size {0:d}.".format(i))
+                os.makedirs(dirSlides + ".tmp", exist_ok=True)
+                synthetic_data.create_slide("{0:s}.tmp/1_Her2.tif".format(dirSlides), i, i, seed=seed)
+                os.replace(dirSlides + ".tmp", dirSlides)  # Only keep the data once it's been completely generated.
+            fileMaskImage = "{0:s}/MaskImage_{1:d}_{2:d}.npy".format(dirWork, i, seed)
+            if not os.path.isfile(fileMaskImage):
+                np.save(fileMaskImage + ".tmp.npy", synthetic_data.create_greyscale_image(i, i, seed=seed))
+                os.replace(fileMaskImage + ".tmp.npy", fileMaskImage)
+    if any(i in stagesToRun for i in IMAGE_STAGES):
+        for i in imageSizes:
+            dirImageSet = "{0:s}/Images_{1:d}_{2:d}_{3:d}".format(dirWork, i, numImages, seed)
+            if not os.path.isdir(dirImageSet):
+                print("Generating {0:d} synthetic images of size {1:d}.".format(numImages, i))
+                synthetic_data.create_image_set(dirImageSet + ".tmp/Images", dirImageSet + ".tmp/GroundTruth.tsv",
+                                                numImages, i, i, seed=seed)
+                os.replace(dirImageSet + ".tmp", dirImageSet)
+
+    # Run the stages.
+    results = []
+    for stageName in stagesToRun:
+        for size in (slideSizes if stageName in SLIDE_STAGES else imageSizes):
+            dirSlides = "{0:s}/Slides_{1:d}_{2:d}".format(dirWork, size, seed)
+            dirImageSet = "{0:s}/Images_{1:d}_{2:d}_{3:d}".format(dirWork, size, numImages, seed)
+            dirOutput = "{0:s}/Output".format(dirWork)  # Directory for the outputs of the stage.
+
+            # Determine the configuration of the stage, along with the number of items and pixels it processes.
+            numPixels = None
+            if stageName == "generate_images":
+                stageConfig = Utilities.merge_dictionaries.main({
+                    "RawImageLocation": dirSlides, "CleanedImageLocation": dirOutput,
+                    "OpenSlideBinLocation": dirOpenSlideBin, "RawCropLevel": 1, "Incremental": False,
+                    "CropParameters": {"1_her2": {
+                        "BackgroundThreshold": 220, "CropCoordinates": {"Left": {"X": 0.0, "Y": 0.0},
+                                                                        "Right": {"X": 1.0, "Y": 1.0}},
+                        "MaxFilter": 5, "ObjectsToKeep": [1, 2, 3], "Visualise": False}}
+                }, preprocessingParams)
+                numItems = len([i for i in os.listdir(dirSlides) if i.endswith(".tif")])
+                numPixels = numItems * size * size
+            elif stageName == "create_image_mask":
+                stageConfig = Utilities.merge_dictionaries.main({
+                    "ImageLocation": "{0:s}/MaskImage_{1:d}_{2:d}.npy".format(dirWork, size, seed),
+                    "BackgroundThreshold": 220, "MaxFilter": 5, "ObjectsToKeep": [1, 2, 3]
+                }, preprocessingParams)
+                numItems = 1
+                numPixels = size * size
+            elif stageName == "histogram":
+                stageConfig = Utilities.merge_dictionaries.main(trainingParams, {
+                    "ImageLocation": "{0:s}/Images".format(dirImageSet)})
+                numItems = numImages
+                numPixels = numImages * size * size
+            else:
+                stageConfig = Utilities.merge_dictionaries.main({
+                    "ImageLocation": "{0:s}/Images".format(dirImageSet), "BackgroundThreshold": 220,
+                    "GroundTruth": "{0:s}/GroundTruth.tsv".format(dirImageSet), "TargetHer2": True, "CVFolds": 5,
+                    "ModelToUse": "ElasticNet", "ModelParameters": {"alpha": [0.001, 0.01, 0.1],
+                                                                    "l1_ratio": [0.1, 0.5, 0.9]}
+                }, trainingParams, {
+                    "ResultsLocation": dirOutput, "ProfileLocation": "{0:s}/Profile.json".format(dirWork)})
+                # The number of models trained during the cross validation.
+                numItems = len(list(itertools.product(*stageConfig["ModelParameters"].values()))) * \
+                    stageConfig["CVFolds"] * stageConfig.get("CVRepeats", 1)
+
+            for repeat in range(numRepeats):
+                print("Running stage {0:s} at size {1:d} ({2:d}/{3:d}).".format(stageName, size, repeat + 1,
+                                                                              numRepeats))
+                if os.path.exists(dirOutput):
+                    # Start each run from scratch.
+                    shutil.rmtree(dirOutput)
+                record = run_stage(stageName, stageConfig, dirWork)
+                if record is None:
+                    continue
+                results.append({
+                    "Stage": stageName, "Size": size, "Repeat": repeat, "Items": numItems, "Pixels": numPixels,
+                    "WallTime": record["WallTime"], "CPUTime": record["CPUTime"], "PeakRSS": record["PeakRSS"],
+                    "BaselineRSS": record["BaselineRSS"], "PeakChildRSS": record["PeakChildRSS"],
+                    "ItemsPerSecond": numItems / record["WallTime"],
+                    "PixelsPerSecond": None if numPixels is None else numPixels / record["WallTime"]
+                })
+    if os.path.exists("{0:s}/Output".format(dirWork)):
+        shutil.rmtree("{0:s}/Output".format(dirWork))
+
+    # Save the results, along with the commit and machine they were generated on.
+    commit, hasChanges = git_commit()
+    fileResults = "{0:s}/Benchmark_{1:s}{2:s}.json".format(
+        dirResults, commit[:12] if commit else "unknown", "_modified" if hasChanges else "")
+    with open(fileResults, 'w') as fidResults:
+        json.dump({
+            "Commit": commit, "UncommittedChanges": hasChanges,
+            "Timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "Python": platform.python_version(), "Platform": platform.platform(), "CPUs": os.cpu_count(),
+            "Parameters": arguments, "Results": results
+        }, fidResults, indent=1)
+
+    # Display the median of each stage at each size.
+    print("\n{0:<18s}{1:>7s}{2:>12s}{3:>14s}{4:>16s}{5:>14s}".format(
+        "Stage", "Size", "WallTime(s)", "Items/s", "Pixels/s", "PeakRSS(MB)"))
+    for (stageName, size), stageResults in itertools.groupby(results, key=lambda i: (i["Stage"], i["Size"])):
+        stageResults = list(stageResults)
+        pixelsPerSecond = [i["PixelsPerSecond"] for i in stageResults if i["PixelsPerSecond"] is not None]
+        print("{0:<18s}{1:>7d}{2:>12.3f}{3:>14.2f}{4:>16s}{5:>14.1f}".format(
+            stageName, size, np.median([i["WallTime"] for i in stageResults]),
+            np.median([i["ItemsPerSecond"] for i in stageResults]),
+            "{0:.3g}".format(np.median(pixelsPerSecond)) if pixelsPerSecond else '-',
+            max(i["PeakRSS"] or 0 for i in stageResults) / 2 ** 20))
+    print("\nResults saved to {0:s}".format(fileResults))
+    return fileResults
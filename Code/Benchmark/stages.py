@@ -0,0 +1,135 @@
+"""Code to run a single stage of a benchmark, in its own process.
+
+Each stage is run in a fresh process so that the peak memory recorded for it isn't inflated by the stages run before
+it. Usage is "python -m Benchmark.stages <stage name> <stage configuration JSON> <record JSON>" from the Code
+directory, where the record of the stage is written to the record JSON file.
+
+"""
+
+# Python imports.
+import json
+import os
+import sys
+
+# 3rd party imports.
+import numpy as np
+
+# User imports.
+import Utilities.profiling
+
+
+def generate_images(config, profiler):
+    """Benchmark the preprocessing of a directory of WSIs.
+
+    :param config:      The preprocessing arguments (see Preprocessing.generate_images.main).
+    :type config:       dict
+    :param profiler:    The profiler to record the stage with.
+    :type profiler:     Utilities.profiling.Profiler
+    :return :           The peak memory use (in bytes) of the process before the stage started.
+    :rtype :            int
+
+    """
+
+    # OpenSlide has to be imported from its bin directory (see Preprocessing/__main__.py).
+    currentDir = os.getcwd()
+    os.chdir(config["OpenSlideBinLocation"])
+    import Preprocessing.generate_images
+    os.chdir(currentDir)
+    baselineRSS = Utilities.profiling.peak_rss()
+    with profiler.stage("generate_images"):
+        Preprocessing.generate_images.main(config)
+    return baselineRSS
+
+
+def create_image_mask(config, profiler):
+    """Benchmark the creation of the mask of a greyscale image.
+
+    :param config:      The location of the image (a NPY array) in ImageLocation, along with the BackgroundThreshold,
+                            MaxFilter, ObjectsToKeep, MaskChunkSize and MaskWorkers to create the mask with.
+    :type config:       dict
+    :param profiler:    The profiler to record the stage with.
+    :type profiler:     Utilities.profiling.Profiler
+    :return :           The peak memory use (in bytes) of the process before the stage started.
+    :rtype :            int
+
+    """
+
+    import Preprocessing.create_image_mask
+    imageArray = np.load(config["ImageLocation"])
+    baselineRSS = Utilities.profiling.peak_rss()
+    with profiler.stage("create_image_mask"):
+        Preprocessing.create_image_mask.main(
+            imageArray, config["BackgroundThreshold"], config["MaxFilter"], config["ObjectsToKeep"],
+            chunkSize=config.get("MaskChunkSize", 0), numWorkers=config.get("MaskWorkers", 1))
+    return baselineRSS
+
+
+def histogram(config, profiler):
+    """Benchmark histogramming a directory of cleaned images (without using a histogram store).
+
+    :param config:      The directory of images in ImageLocation, and the number of HistogramWorkers.
+    :type config:       dict
+    :param profiler:    The profiler to record the stage with.
+    :type profiler:     Utilities.profiling.Profiler
+    :return :           The peak memory use (in bytes) of the process before the stage started.
+    :rtype :            int
+
+    """
+
+    import HistogramPrediction.histogram_cache
+    filePaths = ["{0:s}/{1:s}".format(config["ImageLocation"], i) for i in sorted(os.listdir(config["ImageLocation"]))]
+    baselineRSS = Utilities.profiling.peak_rss()
+    with profiler.stage("histogram"):
+        HistogramPrediction.histogram_cache.main(filePaths, None, config.get("HistogramWorkers", 1))
+    return baselineRSS
+
+
+def cross_validation(config, profiler):
+    """Benchmark the cross validation of the histogram prediction.
+
+    The whole training is run with profiling enabled, and the grid_search stage that it records is taken as the record
+    of the cross validation (summed over the repeats of the cross validation). The memory held before the cross
+    validation is the peak recorded by the stage before it.
+
+    :param config:      The training arguments (see HistogramPrediction.histogram_predictions.main). ProfileLocation
+                            must be set.
+    :type config:       dict
+    :param profiler:    The profiler to record the stage with.
+    :type profiler:     Utilities.profiling.Profiler
+    :return :           The peak memory use (in bytes) of the process before the stage started.
+    :rtype :            int
+
+    """
+
+    import HistogramPrediction.histogram_predictions
+    HistogramPrediction.histogram_predictions.main(config)
+    with open(config["ProfileLocation"], 'r') as fidProfile:
+        records = json.load(fidProfile)
+    searchStages = [i for i in records if i["Stage"] == "grid_search"]  # One stage for each repeat of the CV.
+    profiler.extend([{
+        "Item": None, "Stage": "cross_validation", "WallTime": sum(i["WallTime"] for i in searchStages),
+        "CPUTime": sum(i["CPUTime"] for i in searchStages), "PeakRSS": searchStages[-1]["PeakRSS"]
+    }])
+    return records[records.index(searchStages[0]) - 1]["PeakRSS"]
+
+
+STAGES = {
+    "generate_images": generate_images, "create_image_mask": create_image_mask, "histogram": histogram,
+    "cross_validation": cross_validation
+}  # The function that runs each stage.
+
+
+if __name__ == "__main__":
+    stageName, fileConfig, fileRecord = sys.argv[1:4]
+    with open(fileConfig, 'r') as fidConfig:
+        stageConfig = json.load(fidConfig)
+
+    # Record the memory held before the stage starts (by the interpreter, imports and inputs), so that the memory used
+    # by the stage itself can be separated out.
+    profiler = Utilities.profiling.Profiler()
+    baselineRSS = STAGES[stageName](stageConfig, profiler)
+    record = profiler.records[-1]
+    record["BaselineRSS"] = baselineRSS
+    record["PeakChildRSS"] = Utilities.profiling.peak_rss(children=True)  # The peak of any worker processes.
+    with open(fileRecord, 'w') as fidRecord:
+        json.dump(record, fidRecord)
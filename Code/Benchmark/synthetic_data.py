@@ -0,0 +1,214 @@
+"""Code to generate synthetic WSIs and cleaned images to benchmark the pipelines on.
+
+The synthetic images are a light noisy background with a number of dark circular blobs standing in for the tissue. The
+blobs are defined in the coordinates of the full resolution image, and every resolution level of a WSI is rendered
+from them independently a tile at a time, so that WSIs far larger than memory can be generated.
+
+"""
+
+# Python imports.
+import os
+
+# 3rd party imports.
+import numpy as np
+from PIL import Image
+try:
+    import tifffile
+except ImportError:
+    # tifffile is only needed to write the synthetic WSIs.
+    tifffile = None
+
+# Globals.
+BACKGROUND_COLOR = 245  # The value of the background pixels (before noise is added).
+NOISE_LEVEL = 20  # The largest amount of noise added to or subtracted from each pixel.
+TILE_SIZE = 256  # The size of the tiles that the WSIs are stored in.
+MIN_LEVEL_SIZE = 512  # Resolution levels are added to a WSI until its smallest dimension is at most this.
+
+
+def create_blobs(numRows, numCols, numBlobs, randomState, numChannels=3, darkness=0.5):
+    """Choose the positions, sizes and colors of the blobs in an image.
+
+    :param numRows:     The number of rows in the full resolution image.
+    :type numRows:      int
+    :param numCols:     The number of columns in the full resolution image.
+    :type numCols:      int
+    :param numBlobs:    The number of blobs to create.
+    :type numBlobs:     int
+    :param randomState: The random number generator to choose the blobs with.
+    :type randomState:  numpy RandomState
+    :param numChannels: The number of color channels in the image.
+    :type numChannels:  int
+    :param darkness:    How dark the blobs are, from 0 (colors close to the background) to 1 (colors close to black).
+    :type darkness:     float
+    :return :           The center (row and column) and radius of each blob (one row per blob), and the color of each
+                            blob (one row per blob with one column per channel).
+    :rtype :            numpy array, numpy array
+
+    """
+
+    minRadius = max(1, min(numRows, numCols) // 20)
+    maxRadius = max(minRadius + 1, min(numRows, numCols) // 6)
+    blobs = np.column_stack([randomState.randint(0, numRows, numBlobs), randomState.randint(0, numCols, numBlobs),
+                             randomState.randint(minRadius, maxRadius, numBlobs)])
+
+    # The colors are spread around a mean value that gets darker as the darkness increases.
+    meanColor = BACKGROUND_COLOR - 40 - darkness * (BACKGROUND_COLOR - 80)
+    colors = np.clip(randomState.normal(meanColor, 20, (numBlobs, numChannels)), 0, 255).astype(np.uint8)
+    return blobs, colors
+
+
+def render_region(blobs, colors, rowStart, colStart, numRows, numCols, downsample, randomState):
+    """Render a region of an image at a given resolution level.
+
+    :param blobs:       The center and radius of each blob in full resolution coordinates (see create_blobs).
+    :type blobs:        numpy array
+    :param colors:      The color of each blob.
+    :type colors:       numpy array
+    :param rowStart:    The first row of the region at the resolution level being rendered.
+    :type rowStart:     int
+    :param colStart:    The first column of the region at the resolution level being rendered.
+    :type colStart:     int
+    :param numRows:     The number of rows in the region.
+    :type numRows:      int
+    :param numCols:     The number of columns in the region.
+    :type numCols:      int
+    :param downsample:  The factor by which the resolution level being rendered is smaller than the full resolution.
+    :type downsample:   int
+    :param randomState: The random number generator to add the noise with.
+    :type randomState:  numpy RandomState
+    :return :           The region, with shape (numRows, numCols, numChannels), or (numRows, numCols) when the image
+                            has one channel.
+    :rtype :            numpy array
+
+    """
+
+    numChannels = colors.shape[1]
+    region = np.full((numRows, numCols, numChannels), BACKGROUND_COLOR, dtype=np.uint8)
+
+    # Determine the full resolution coordinates of the centers of the pixels in the region.
+    pixelRows = (np.arange(rowStart, rowStart + numRows) + 0.5) * downsample
+    pixelCols = (np.arange(colStart, colStart + numCols) + 0.5) * downsample
+
+    # Draw the blobs that overlap the region. Later blobs are drawn over earlier ones.
+    for (centerRow, centerCol, radius), color in zip(blobs, colors):
+        if (pixelRows[0] > centerRow + radius or pixelRows[-1] < centerRow - radius or
+                pixelCols[0] > centerCol + radius or pixelCols[-1] < centerCol - radius):
+            continue
+        blobMask = (pixelRows[:, np.newaxis] - centerRow) ** 2 + (pixelCols[np.newaxis, :] - centerCol) ** 2 < \
+            radius ** 2
+        region[blobMask] = color
+
+    # Add noise to every pixel.
+    noise = randomState.randint(-NOISE_LEVEL, NOISE_LEVEL + 1, size=region.shape, dtype=np.int16)
+    region = np.clip(region + noise, 0, 255).astype(np.uint8)
+    return region[:, :, 0] if numChannels == 1 else region
+
+
+def create_slide(fileSlide, numRows, numCols, numBlobs=6, seed=None):
+    """Write a synthetic RGB WSI as a pyramidal tiled TIFF that OpenSlide can read.
+
+    Each resolution level is half the size of the one before it, and levels are added until the smallest dimension of
+    the WSI is at most MIN_LEVEL_SIZE. Only one tile of the WSI is held in memory at a time.
+
+    :param fileSlide:   The location to write the WSI to.
+    :type fileSlide:    str
+    :param numRows:     The number of rows in the full resolution level.
+    :type numRows:      int
+    :param numCols:     The number of columns in the full resolution level.
+    :type numCols:      int
+    :param numBlobs:    The number of blobs in the WSI.
+    :type numBlobs:     int
+    :param seed:        The seed for the random number generator. Defaults to a random seed.
+    :type seed:         int
+    :return :           The dimensions (columns, rows) of each resolution level of the WSI.
+    :rtype :            list of (int, int) tuples
+
+    """
+
+    if tifffile is None:
+        raise ImportError("tifffile is needed to write synthetic WSIs (pip install tifffile)")
+
+    randomState = np.random.RandomState(seed)
+    blobs, colors = create_blobs(numRows, numCols, numBlobs, randomState)
+
+    # Determine the dimensions of the resolution levels.
+    levelDimensions = [(numCols, numRows)]
+    while min(levelDimensions[-1]) > MIN_LEVEL_SIZE:
+        levelDimensions.append((levelDimensions[-1][0] // 2, levelDimensions[-1][1] // 2))
+
+    def level_tiles(levelCols, levelRows, downsample):
+        # Generate the (full size) tiles of a level in row-major order. The parts of the edge tiles outside the level
+        # are discarded by tifffile.
+        for i in range(0, levelRows, TILE_SIZE):
+            for j in range(0, levelCols, TILE_SIZE):
+                yield render_region(blobs, colors, i, j, TILE_SIZE, TILE_SIZE, downsample, randomState)
+
+    with tifffile.TiffWriter(fileSlide, bigtiff=numRows * numCols * 3 > 2 ** 31) as writer:
+        for ind, (levelCols, levelRows) in enumerate(levelDimensions):
+            writer.write(level_tiles(levelCols, levelRows, 2 ** ind), shape=(levelRows, levelCols, 3),
+                         dtype=np.uint8, tile=(TILE_SIZE, TILE_SIZE), photometric="rgb",
+                         subfiletype=0 if ind == 0 else 1)
+    return levelDimensions
+
+
+def create_greyscale_image(numRows, numCols, numBlobs=6, seed=None, darkness=0.5):
+    """Generate a synthetic greyscale image.
+
+    :param numRows:     The number of rows in the image.
+    :type numRows:      int
+    :param numCols:     The number of columns in the image.
+    :type numCols:      int
+    :param numBlobs:    The number of blobs in the image.
+    :type numBlobs:     int
+    :param seed:        The seed for the random number generator. Defaults to a random seed.
+    :type seed:         int
+    :param darkness:    How dark the blobs are (see create_blobs).
+    :type darkness:     float
+    :return :           The image.
+    :rtype :            numpy array
+
+    """
+
+    randomState = np.random.RandomState(seed)
+    blobs, colors = create_blobs(numRows, numCols, numBlobs, randomState, numChannels=1, darkness=darkness)
+    return render_region(blobs, colors, 0, 0, numRows, numCols, 1, randomState)
+
+
+def create_image_set(dirImages, fileGroundTruth, numImages, numRows, numCols, seed=None):
+    """Write a set of synthetic cleaned greyscale images, along with their ground truth values.
+
+    Each image is a case with a random Her2 score (0..3) and staining percentage. The blobs get darker as the Her2 score
+    increases, so that the histograms of the images carry some information about the scores.
+
+    :param dirImages:       The directory to write the images to (as PNG files named <case number>_Her2.png).
+    :type dirImages:        str
+    :param fileGroundTruth: The location to write the ground truth values to, in the format of the ground truth file
+                                used for the histogram prediction.
+    :type fileGroundTruth:  str
+    :param numImages:       The number of images to write.
+    :type numImages:        int
+    :param numRows:         The number of rows in each image.
+    :type numRows:          int
+    :param numCols:         The number of columns in each image.
+    :type numCols:          int
+    :param seed:            The seed for the random number generator. Defaults to a random seed.
+    :type seed:             int
+
+    """
+
+    if not os.path.exists(dirImages):
+        os.makedirs(dirImages)
+    randomState = np.random.RandomState(seed)
+    her2Scores = np.arange(numImages) % 4  # Spread the cases evenly over the scores, so that every fold has each score.
+    randomState.shuffle(her2Scores)
+    stainingPercents = np.round(np.clip(her2Scores * 25 + randomState.uniform(0, 25, numImages), 0, 100), 1)
+
+    with open(fileGroundTruth, 'w') as fidGroundTruth:
+        fidGroundTruth.write("CaseNo\tHeR2 SCORE\tPERCENTAGE CELLS WITH COMPLETE MEMBRANE STAINING IRRESPECTIVE OF "
+                             "INTENSITY\n")
+        for i in range(numImages):
+            caseID = i + 1
+            imageArray = create_greyscale_image(numRows, numCols, seed=randomState.randint(2 ** 31),
+                                                darkness=(her2Scores[i] + randomState.uniform(0, 1)) / 4)
+            Image.fromarray(imageArray).save("{0:s}/{1:d}_Her2.png".format(dirImages, caseID))
+            fidGroundTruth.write("{0:d}\t{1:d}\t{2:.1f}\n".format(caseID, her2Scores[i], stainingPercents[i]))
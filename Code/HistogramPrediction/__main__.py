@@ -12,12 +12,15 @@ import Utilities.json_to_ascii
 PYVERSION = sys.version_info[0]  # Determine major version number.
 
 
-fileParams = sys.argv[1]
-readParams = open(fileParams, 'r')
-parsedArgs = json.load(readParams)
-if PYVERSION < 3:
-    # Convert unicode characters to ascii (needed for Python < 3).
-    parsedArgs = Utilities.json_to_ascii.json_to_ascii(parsedArgs)
-readParams.close()
+# The images may be histogrammed in a pool of worker processes. On platforms where the workers are spawned rather than
+# forked, this file is re-imported by each worker, so the training must only be started by the main process.
+if __name__ == "__main__":
+    fileParams = sys.argv[1]
+    readParams = open(fileParams, 'r')
+    parsedArgs = json.load(readParams)
+    if PYVERSION < 3:
+        # Convert unicode characters to ascii (needed for Python < 3).
+        parsedArgs = Utilities.json_to_ascii.json_to_ascii(parsedArgs)
+    readParams.close()
 
-HistogramPrediction.histogram_predictions.main(parsedArgs)
+    HistogramPrediction.histogram_predictions.main(parsedArgs)
@@ -0,0 +1,272 @@
+"""Code to evaluate every combination of model parameters with cross validation, potentially in parallel."""
+
+# Python imports.
+import concurrent.futures
+import shutil
+import tempfile
+
+# 3rd party imports.
+import numpy as np
+from sklearn.metrics import mean_squared_error, r2_score
+
+# User imports.
+import Utilities.partition_dataset
+
+# Globals.
+FOLD_ARRAYS = ["TrainingData", "TrainingTarget", "TestingData", "TestingTarget"]  # The arrays saved for each fold.
+# The model parameters (other than alpha) that are passed on to the path functions in path mode.
+PATH_PARAMETERS = ["l1_ratio", "eps", "max_iter", "tol", "positive", "selection", "random_state", "precompute"]
+_loadedFolds = {}  # The folds that have been memory-mapped by this (worker) process.
+
+
+def _fit_fold(modelClass, params, foldData):
+    """Train a model on the training examples of a fold and score it on the testing examples.
+
+    :param modelClass:  The type of model to train.
+    :type modelClass:   class
+    :param params:      The parameters to create the model with.
+    :type params:       dict
+    :param foldData:    The training data, training targets, testing data and testing targets of the fold.
+    :type foldData:     tuple of numpy arrays
+    :return :           The mean squared error and coefficient of determination (R^2) of the model's predictions on
+                            the testing examples.
+    :rtype :            float, float
+
+    """
+
+    trainingDataSubset, trainingTargetVector, testingDataSubset, testingTargetVector = foldData
+
+    # Create and train the model.
+    model = modelClass(**params)
+    model.fit(trainingDataSubset, trainingTargetVector)
+
+    # Test the model.
+    predictions = model.predict(testingDataSubset)
+    r2 = r2_score(testingTargetVector, predictions) if testingTargetVector.size > 1 else np.nan
+    return mean_squared_error(testingTargetVector, predictions), r2
+
+
+def _fit_fold_path(modelClass, params, alphas, foldData):
+    """Train a model along a regularisation path on the training examples of a fold, and score it for each alpha.
+
+    The whole path is fitted in one call to the model's path function, with each alpha warm started from the solution
+    for the previous (larger) alpha. The path functions don't fit an intercept, so unless fit_intercept is false the
+    data is centred on the means of the training examples first, as the models do when fitting an intercept.
+
+    :param modelClass:  The type of model to train. This must have a path function (e.g. ElasticNet or Lasso).
+    :type modelClass:   class
+    :param params:      The parameters other than alpha. Only fit_intercept and those in PATH_PARAMETERS are used.
+    :type params:       dict
+    :param alphas:      The values of alpha to fit.
+    :type alphas:       list
+    :param foldData:    The training data, training targets, testing data and testing targets of the fold.
+    :type foldData:     tuple of numpy arrays
+    :return :           The mean squared error and coefficient of determination (R^2) for each alpha, in the same order
+                            as alphas.
+    :rtype :            list of tuples
+
+    """
+
+    trainingDataSubset, trainingTargetVector, testingDataSubset, testingTargetVector = foldData
+
+    # Fit the path on the centred data (or on the data as it is when no intercept is fitted).
+    if params.get("fit_intercept", True):
+        dataMeans = trainingDataSubset.mean(axis=0)
+        targetMean = trainingTargetVector.mean()
+    else:
+        dataMeans = np.zeros(trainingDataSubset.shape[1])
+        targetMean = 0.0
+    pathParams = {i: params[i] for i in params if i in PATH_PARAMETERS}
+    pathAlphas, coefficients, _ = modelClass.path(trainingDataSubset - dataMeans, trainingTargetVector - targetMean,
+                                                  alphas=alphas, **pathParams)
+
+    # Test the model for each alpha. The path is returned in order of decreasing alpha.
+    predictions = (testingDataSubset - dataMeans).dot(coefficients) + targetMean
+    scores = {}
+    for alpha, i in zip(pathAlphas, predictions.T):
+        r2 = r2_score(testingTargetVector, i) if testingTargetVector.size > 1 else np.nan
+        scores[alpha] = (mean_squared_error(testingTargetVector, i), r2)
+    return [scores[i] for i in alphas]
+
+
+def _fit_shared_fold(fitFunction, fitArguments, dirFolds, fold):
+    """Train and score a model on a fold that has been saved to disk, in a worker process.
+
+    Each fold is memory-mapped the first time a worker needs it, and reused for every later fit in that worker.
+
+    :param fitFunction:     The function to train and score the model with (_fit_fold or _fit_fold_path).
+    :type fitFunction:      function
+    :param fitArguments:    The arguments to call the function with, other than the fold data.
+    :type fitArguments:     tuple
+    :param dirFolds:        The directory containing the saved folds.
+    :type dirFolds:         str
+    :param fold:            The fold to train and score the model on.
+    :type fold:             int
+    :return :               The scores returned by the function.
+    :rtype :                tuple or list
+
+    """
+
+    if (dirFolds, fold) not in _loadedFolds:
+        _loadedFolds[(dirFolds, fold)] = tuple(
+            np.load("{0:s}/Fold{1:d}_{2:s}.npy".format(dirFolds, fold, i), mmap_mode='r') for i in FOLD_ARRAYS)
+    return fitFunction(*fitArguments, _loadedFolds[(dirFolds, fold)])
+
+
+def slice_folds(dataMatrix, targetVector, partition, numFolds, augmentation=None):
+    """Split a dataset into the training and testing examples of each CV fold.
+
+    Augmented examples are only ever trained on, and are left out of the fold that the example they were generated from
+    is tested in.
+
+    :param dataMatrix:      The feature vectors of the examples.
+    :type dataMatrix:       numpy array
+    :param targetVector:    The target value of each example.
+    :type targetVector:     numpy array
+    :param partition:       The fold (from 0..numFolds-1) that each example is tested in.
+    :type partition:        numpy array
+    :param numFolds:        The number of folds.
+    :type numFolds:         int
+    :param augmentation:    The feature vectors, target values and folds (those of the examples they were generated
+                                from) of the augmented examples. Defaults to no augmented examples.
+    :type augmentation:     tuple of numpy arrays
+    :return :               The training data, training targets, testing data and testing targets of each fold.
+    :rtype :                list of tuples
+
+    """
+
+    folds = []
+    for i, (trainingExamples, testingExamples) in enumerate(
+            Utilities.partition_dataset.fold_indices(partition, numFolds)):
+        trainingDataSubset = dataMatrix[trainingExamples]
+        trainingTargetVector = targetVector[trainingExamples]
+        if augmentation is not None:
+            augmentedMatrix, augmentedTargetVector, augmentedPartition = augmentation
+            trainingDataSubset = np.concatenate([trainingDataSubset, augmentedMatrix[augmentedPartition != i]])
+            trainingTargetVector = np.concatenate([trainingTargetVector,
+                                                   augmentedTargetVector[augmentedPartition != i]])
+        folds.append((trainingDataSubset, trainingTargetVector,
+                      dataMatrix[testingExamples], targetVector[testingExamples]))
+    return folds
+
+
+def supports_path(modelParams):
+    """Determine whether a grid of model parameters can be searched over in path mode.
+
+    :param modelParams: The values of each model parameter to try.
+    :type modelParams:  dict
+    :return :           Whether there are alpha values to search over, and every other parameter is either
+                            fit_intercept or one that the path functions accept (see PATH_PARAMETERS).
+    :rtype :            bool
+
+    """
+
+    otherParams = [i for i in modelParams if i not in ["alpha", "fit_intercept"]]
+    return "alpha" in modelParams and all(i in PATH_PARAMETERS for i in otherParams)
+
+
+def write_results(results, fileResults):
+    """Save the results of a grid search as a tab separated table.
+
+    :param results:     The results of the grid search, with one entry per combination of parameters and fold.
+    :type results:      list of dicts
+    :param fileResults: The location to save the results.
+    :type fileResults:  str
+
+    """
+
+    columns = list(results[0]) if results else []
+    with open(fileResults, 'w') as fidResults:
+        fidResults.write("{0:s}\n".format('\t'.join(columns)))
+        for i in results:
+            fidResults.write("{0:s}\n".format('\t'.join(str(i[j]) for j in columns)))
+
+
+def main(dataMatrix, targetVector, partition, numFolds, modelClass, paramList, numWorkers=1, usePath=False,
+         augmentation=None):
+    """Train and score a model for every combination of parameters and CV fold.
+
+    The training and testing subsets of each fold are sliced out of the dataset once, rather than once per
+    combination of parameters. With more than one worker, the folds are saved to disk and memory-mapped by a pool of
+    worker processes, so that the workers share the fold data rather than each being sent its own copy, and each
+    (parameters, fold) fit is run as a separate task.
+
+    In path mode, the combinations of parameters that differ only in their value of alpha are grouped together, and
+    the model is fitted for every alpha in the group along one regularisation path. Each (group, fold) path is then
+    run as a separate task. The fits use the model's default values for any parameters not being searched over, and
+    the parameters must be ones that can be fitted along a path (see supports_path).
+
+    :param dataMatrix:      The feature vectors of the examples.
+    :type dataMatrix:       numpy array
+    :param targetVector:    The target value of each example.
+    :type targetVector:     numpy array
+    :param partition:       The fold (from 0..numFolds-1) that each example is tested in.
+    :type partition:        numpy array
+    :param numFolds:        The number of folds.
+    :type numFolds:         int
+    :param modelClass:      The type of model to train.
+    :type modelClass:       class
+    :param paramList:       The combinations of parameters to train the model with.
+    :type paramList:        list of dicts
+    :param numWorkers:      The number of processes to train the models with.
+    :type numWorkers:       int
+    :param usePath:         Whether to fit the values of alpha along a regularisation path. The model must have a path
+                                function and every combination of parameters must contain alpha.
+    :type usePath:          bool
+    :param augmentation:    The feature vectors, target values and folds of any augmented examples (see slice_folds).
+    :type augmentation:     tuple of numpy arrays
+    :return :               The results of the grid search, with one entry per combination of parameters and fold
+                                recording the parameters, the fold, and the mean squared error (MSE) and coefficient of
+                                determination (R2) on the fold's testing examples.
+    :rtype :                list of dicts
+
+    """
+
+    folds = slice_folds(dataMatrix, targetVector, partition, numFolds, augmentation)
+
+    # Determine the fits to perform. Each fit is the function to perform it with, its arguments (other than the fold
+    # data), the fold, and the combinations of parameters it scores.
+    fits = []
+    if usePath:
+        # Group the combinations of parameters by their values of the parameters other than alpha.
+        groups = {}
+        for ind, i in enumerate(paramList):
+            otherParams = tuple(sorted((j, k) for j, k in i.items() if j != "alpha"))
+            groups.setdefault(otherParams, []).append(ind)
+        for otherParams, paramIndices in groups.items():
+            alphas = [paramList[i]["alpha"] for i in paramIndices]
+            fits.extend((_fit_fold_path, (modelClass, dict(otherParams), alphas), j, paramIndices)
+                        for j in range(numFolds))
+    else:
+        fits = [(_fit_fold, (modelClass, paramList[i]), j, [i]) for i in range(len(paramList)) for j in range(numFolds)]
+
+    if numWorkers < 2:
+        fitScores = [function(*arguments, folds[fold]) for function, arguments, fold, _ in fits]
+    else:
+        dirFolds = tempfile.mkdtemp(prefix="Folds")
+        try:
+            # Save the folds so that they can be memory-mapped by the workers.
+            for ind, i in enumerate(folds):
+                for name, array in zip(FOLD_ARRAYS, i):
+                    np.save("{0:s}/Fold{1:d}_{2:s}.npy".format(dirFolds, ind, name), array)
+            with concurrent.futures.ProcessPoolExecutor(max_workers=numWorkers) as executor:
+                futures = [executor.submit(_fit_shared_fold, function, arguments, dirFolds, fold)
+                           for function, arguments, fold, _ in fits]
+                fitScores = [i.result() for i in futures]
+        finally:
+            shutil.rmtree(dirFolds, ignore_errors=True)
+
+    # Collect the scores of each combination of parameters on each fold.
+    scores = {}
+    for (function, _, fold, paramIndices), i in zip(fits, fitScores):
+        if function is _fit_fold:
+            i = [i]
+        scores.update({(j, fold): k for j, k in zip(paramIndices, i)})
+
+    results = []
+    for i in range(len(paramList)):
+        for j in range(numFolds):
+            entry = dict(sorted(paramList[i].items()))
+            entry.update({"Fold": j, "MSE": scores[(i, j)][0], "R2": scores[(i, j)][1]})
+            results.append(entry)
+    return results
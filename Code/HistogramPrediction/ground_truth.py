@@ -0,0 +1,68 @@
+"""Code to load the ground truth values of the cases and match them to the images."""
+
+# 3rd party imports.
+import numpy as np
+
+# Globals.
+GROUND_TRUTH_COLUMNS = [  # The name and type of each column in the ground truth file.
+    ("CaseID", np.int64), ("Her2Score", np.int64), ("StainingPercent", np.float64)
+]
+
+
+def load(fileGroundTruth):
+    """Load the ground truth values of the cases.
+
+    The file is expected to be tab separated with a header line, followed by one line per case containing the case
+    number, the Her2 score and the percentage of cells with complete membrane staining.
+
+    :param fileGroundTruth: The location of the ground truth file.
+    :type fileGroundTruth:  str
+    :return :               The ground truth values, with one record per case and one field per column.
+    :rtype :                numpy structured array
+    :raises ValueError:     If any case number appears more than once.
+
+    """
+
+    groundTruth = np.loadtxt(fileGroundTruth, dtype=GROUND_TRUTH_COLUMNS, delimiter='\t', skiprows=1,
+                             usecols=range(len(GROUND_TRUTH_COLUMNS)), ndmin=1)
+
+    # Check that each case only appears once.
+    caseIDs, caseCounts = np.unique(groundTruth["CaseID"], return_counts=True)
+    if (caseCounts > 1).any():
+        raise ValueError("Duplicate case numbers in the ground truth file {0:s}: {1:s}".format(
+            fileGroundTruth, ", ".join(str(i) for i in caseIDs[caseCounts > 1])))
+
+    return groundTruth
+
+
+def main(fileGroundTruth, caseIDs):
+    """Determine the ground truth values for a set of cases.
+
+    The cases are looked up in the ground truth values by sorting the case numbers once and binary searching them,
+    rather than scanning all the ground truth values for each case.
+
+    :param fileGroundTruth: The location of the ground truth file.
+    :type fileGroundTruth:  str
+    :param caseIDs:         The case numbers to determine the ground truth values of. A case may appear more than once
+                                (e.g. when a case has several images).
+    :type caseIDs:          numpy array
+    :return :               The ground truth values of each case, in the same order as caseIDs.
+    :rtype :                numpy structured array
+    :raises ValueError:     If any case number appears more than once in the ground truth file, or any of the cases
+                                is missing from it.
+
+    """
+
+    groundTruth = load(fileGroundTruth)
+    caseIDs = np.asarray(caseIDs, dtype=np.int64)
+
+    # Find each case in the sorted ground truth case numbers.
+    sortedOrder = np.argsort(groundTruth["CaseID"], kind="stable")
+    sortedCaseIDs = groundTruth["CaseID"][sortedOrder]
+    positions = np.minimum(np.searchsorted(sortedCaseIDs, caseIDs), max(sortedCaseIDs.size - 1, 0))
+    isFound = sortedCaseIDs[positions] == caseIDs if sortedCaseIDs.size > 0 else np.zeros(caseIDs.size, dtype="bool")
+    if not isFound.all():
+        raise ValueError("Case numbers missing from the ground truth file {0:s}: {1:s}".format(
+            fileGroundTruth, ", ".join(str(i) for i in np.unique(caseIDs[~isFound]))))
+
+    return groundTruth[sortedOrder[positions]]
@@ -0,0 +1,128 @@
+"""Code to augment the training images with the histograms of randomly transformed versions of them.
+
+Flips and integer translations only move pixels around, so they leave the histogram of an image unchanged (other than
+a translation clipping off part of the image), and are therefore not applied. Scaling, rotation and shear change the
+histogram only through the interpolation of the pixel values and the background filled in around the image. Rather
+than rendering the whole transformed image, it is sampled at a random subset of its pixels, and the histogram of the
+samples (scaled up to the size of the transformed image) is used as the histogram of the transformed image. This makes
+augmenting an image cost about as much as histogramming it.
+
+"""
+
+# Python imports.
+import os
+
+# 3rd party imports.
+import numpy as np
+import PIL.Image
+import scipy.ndimage
+
+# User imports.
+import Utilities.image_permutation
+
+
+def load_pixels(filePath):
+    """Load the pixels of a cleaned greyscale image to augment.
+
+    :param filePath:    The location of the image. This can be an image file or a NPY array (which is memory-mapped).
+    :type filePath:     str
+    :return :           The image.
+    :rtype :            numpy array
+    :raises ValueError: If the image is a directory of tiles, a NPY array that isn't a greyscale image (e.g. a saved
+                            histogram), or an image file that isn't greyscale (e.g. a color crop).
+
+    """
+
+    if os.path.isdir(filePath):
+        raise ValueError("images saved as directories of tiles can't be augmented")
+    if filePath.endswith(".npy"):
+        imageArray = np.load(filePath, mmap_mode='r')
+        if imageArray.ndim != 2:
+            raise ValueError("NPY array with shape {0:s} is not a greyscale image".format(str(imageArray.shape)))
+        return imageArray
+    with PIL.Image.open(filePath) as image:
+        if image.mode != 'L':
+            raise ValueError("{0:s} image is not a greyscale image".format(image.mode))
+        return np.array(image)
+
+
+def augment_histogram(imageArray, parameters, numSamples, randomState, backgroundColor=255, order=1):
+    """Estimate the histogram of an image after it has been scaled, rotated and sheared.
+
+    :param imageArray:      The greyscale image.
+    :type imageArray:       numpy array
+    :param parameters:      The transformations to apply (see Utilities.image_permutation.sample_parameters). Any
+                                inversion or translation is ignored.
+    :type parameters:       dict
+    :param numSamples:      The number of pixels of the transformed image to sample (at most).
+    :type numSamples:       int
+    :param randomState:     The random number generator to choose the pixels to sample with.
+    :type randomState:      numpy RandomState
+    :param backgroundColor: The value to give the pixels that don't come from the image.
+    :type backgroundColor:  int
+    :param order:           The order of the spline used to interpolate the image. Orders above 1 require the whole
+                                image to be filtered first, and so are much slower.
+    :type order:            int
+    :return :               The estimated number of pixels in the transformed image equal to each of 0..255.
+    :rtype :                numpy array
+
+    """
+
+    keptRegion, inverseMatrix, offset, outputShape = Utilities.image_permutation.affine_mapping(
+        imageArray.shape, parameters["scale"], parameters["rotation"], parameters["shear"])
+
+    # Sample pixels of the transformed image, and interpolate their values from the image. If the transformed image
+    # has no more pixels than are to be sampled, then every pixel is used instead.
+    numPixels = outputShape[0] * outputShape[1]
+    if numSamples >= numPixels:
+        sampledPixels = np.indices(outputShape).reshape(2, -1)
+        numSamples = numPixels
+    else:
+        sampledPixels = np.vstack([randomState.randint(0, outputShape[0], numSamples),
+                                   randomState.randint(0, outputShape[1], numSamples)])
+    sampledValues = scipy.ndimage.map_coordinates(
+        imageArray[keptRegion], inverseMatrix.dot(sampledPixels) + offset[:, np.newaxis], order=order,
+        cval=backgroundColor)
+
+    # Histogram the samples, scaling the counts up to the number of pixels in the transformed image.
+    sampledValues = np.clip(np.round(sampledValues), 0, 255).astype(np.intp)
+    return np.bincount(sampledValues, minlength=256) * (numPixels / numSamples)
+
+
+def main(filePaths, numAugmentations, numSamples=100000, seed=None, backgroundColor=255, **permutationRanges):
+    """Generate the histograms of randomly transformed versions of a set of images.
+
+    :param filePaths:           The locations of the images.
+    :type filePaths:            list
+    :param numAugmentations:    The number of transformed versions of each image to generate.
+    :type numAugmentations:     int
+    :param numSamples:          The number of pixels to sample from each transformed image.
+    :type numSamples:           int
+    :param seed:                The seed for the random number generator. Defaults to a random seed.
+    :type seed:                 int
+    :param backgroundColor:     The value to give the pixels that don't come from the images.
+    :type backgroundColor:      int
+    :param permutationRanges:   The ranges to choose the scaling, rotation and shear from (see
+                                    Utilities.image_permutation.sample_parameters).
+    :type permutationRanges:    keyword arguments
+    :return :                   The histogram of each transformed image (one row per transformed image), and the
+                                    index in filePaths of the image that each was generated from. Images that can't be
+                                    augmented are skipped.
+    :rtype :                    numpy array, numpy array
+
+    """
+
+    randomState = np.random.RandomState(seed)
+    histograms = []
+    sourceImages = []
+    for ind, i in enumerate(filePaths):
+        try:
+            imageArray = load_pixels(i)
+        except ValueError as err:
+            print("Not augmenting image {0:s}: {1:s}.".format(i, str(err)))
+            continue
+        for _ in range(numAugmentations):
+            parameters = Utilities.image_permutation.sample_parameters(randomState, **permutationRanges)
+            histograms.append(augment_histogram(imageArray, parameters, numSamples, randomState, backgroundColor))
+            sourceImages.append(ind)
+    return np.array(histograms).reshape(-1, 256), np.array(sourceImages, dtype=np.int64)
@@ -0,0 +1,303 @@
+"""Code to store the histograms of the cleaned images on disk, so that reruns only need to histogram changed images.
+
+The histograms are kept in an appendable feature store made up of two files in the cache directory:
+
+- Histograms.dat - A matrix of int64 histogram counts with one row of 256 counts per image, that is memory-mapped
+rather than read into memory. New images are appended to the end of the matrix, and changed images have their row
+overwritten in place.
+- HistogramIndex.tsv - An index recording the row, case number, size, modification time, content hash and path of
+each image in the store.
+
+"""
+
+# Python imports.
+import hashlib
+import os
+
+# 3rd party imports.
+import numpy as np
+
+# User imports.
+from . import image_histogram
+
+# Globals.
+STORE_FILE = "Histograms.dat"  # The name of the histogram matrix in the cache directory.
+INDEX_FILE = "HistogramIndex.tsv"  # The name of the index of the histogram matrix in the cache directory.
+LEGACY_CACHE_FILE = "HistogramCache.npz"  # The name of the cache file used before the store was appendable.
+INDEX_COLUMNS = ["Row", "CaseID", "Size", "MTime", "Hash", "Path"]  # The columns of the index.
+HASH_BLOCK_SIZE = 1 << 20  # The number of bytes of an image to hash at once.
+ROW_BYTES = 256 * np.dtype(np.int64).itemsize  # The number of bytes in each row of the histogram matrix.
+
+
+def _image_files(filePath):
+    """Determine the files that make up an image.
+
+    :param filePath:    The location of the image.
+    :type filePath:     str
+    :return :           The files making up the image. This is the image itself, unless it was saved as a directory of
+                            tiles, in which case it's the tiles in sorted order.
+    :rtype :            list
+
+    """
+
+    if os.path.isdir(filePath):
+        return ["{0:s}/{1:s}".format(filePath, i) for i in sorted(os.listdir(filePath))]
+    return [filePath]
+
+
+def _case_id(filePath):
+    """Determine the case number of an image from its name.
+
+    :param filePath:    The location of the image.
+    :type filePath:     str
+    :return :           The part of the image's name before the first underscore, or -1 if this isn't a number.
+    :rtype :            int
+
+    """
+
+    try:
+        return int(os.path.basename(filePath).split('_')[0])
+    except ValueError:
+        return -1
+
+
+def image_signature(filePath):
+    """Determine the size and modification time of an image.
+
+    :param filePath:    The location of the image.
+    :type filePath:     str
+    :return :           The size in bytes of the image (summed over its tiles) and its most recent modification time.
+    :rtype :            int, float
+
+    """
+
+    fileStats = [os.stat(i) for i in _image_files(filePath)]
+    return sum(i.st_size for i in fileStats), max([i.st_mtime for i in fileStats], default=0.0)
+
+
+def image_hash(filePath):
+    """Hash the contents of an image.
+
+    :param filePath:    The location of the image.
+    :type filePath:     str
+    :return :           The hash of the image (including the names of its tiles).
+    :rtype :            str
+
+    """
+
+    contentHash = hashlib.sha1()
+    for i in _image_files(filePath):
+        contentHash.update(os.path.basename(i).encode("utf-8"))
+        with open(i, 'rb') as fidImage:
+            for block in iter(lambda: fidImage.read(HASH_BLOCK_SIZE), b''):
+                contentHash.update(block)
+    return contentHash.hexdigest()
+
+
+def load_index(dirCache):
+    """Load the index of the histogram store.
+
+    :param dirCache:    The directory containing the store.
+    :type dirCache:     str
+    :return :           The index entry for each image, keyed by the absolute path of the image. Each entry is the row
+                            of the image's histogram, its case number, size, modification time and content hash. This
+                            is empty if there is no store.
+    :rtype :            dict
+
+    """
+
+    fileIndex = "{0:s}/{1:s}".format(dirCache, INDEX_FILE)
+    index = {}
+    if not os.path.isfile(fileIndex):
+        return index
+    with open(fileIndex, 'r') as fidIndex:
+        fidIndex.readline()  # Strip off the header.
+        for line in fidIndex:
+            row, caseID, size, mtime, contentHash, path = line.rstrip('\n').split('\t', 5)
+            index[path] = (int(row), int(caseID), int(size), float(mtime), contentHash)
+    return index
+
+
+def save_index(index, dirCache):
+    """Save the index of the histogram store.
+
+    The index is written to a temporary file that then replaces the existing index, so that a run that is interrupted
+    while saving can't leave a corrupt index behind.
+
+    :param index:       The index entry for each image, keyed by the absolute path of the image.
+    :type index:        dict
+    :param dirCache:    The directory containing the store.
+    :type dirCache:     str
+
+    """
+
+    fileIndex = "{0:s}/{1:s}".format(dirCache, INDEX_FILE)
+    with open(fileIndex + ".tmp", 'w') as fidIndex:
+        fidIndex.write("{0:s}\n".format('\t'.join(INDEX_COLUMNS)))
+        for path, (row, caseID, size, mtime, contentHash) in sorted(index.items(), key=lambda i: i[1][0]):
+            fidIndex.write("{0:d}\t{1:d}\t{2:d}\t{3:s}\t{4:s}\t{5:s}\n".format(
+                row, caseID, size, repr(mtime), contentHash, path))
+    os.replace(fileIndex + ".tmp", fileIndex)
+
+
+def open_store(dirCache, mode='r'):
+    """Memory-map the histogram matrix of the store.
+
+    :param dirCache:    The directory containing the store.
+    :type dirCache:     str
+    :param mode:        The mode to open the matrix in ('r' to read or 'r+' to update rows in place).
+    :type mode:         str
+    :return :           The histogram matrix, with one row of 256 counts per image.
+    :rtype :            numpy memmap (or numpy array if the store is empty)
+
+    """
+
+    fileStore = "{0:s}/{1:s}".format(dirCache, STORE_FILE)
+    numRows = os.path.getsize(fileStore) // ROW_BYTES if os.path.isfile(fileStore) else 0
+    if numRows == 0:
+        return np.empty((0, 256), dtype=np.int64)
+    return np.memmap(fileStore, dtype=np.int64, mode=mode, shape=(numRows, 256))
+
+
+def _append_rows(histograms, dirCache):
+    """Append histograms to the end of the histogram matrix of the store.
+
+    :param histograms:  The histograms to append (one row per image).
+    :type histograms:   numpy array
+    :param dirCache:    The directory containing the store.
+    :type dirCache:     str
+    :return :           The row of the matrix that the first appended histogram was written to.
+    :rtype :            int
+
+    """
+
+    fileStore = "{0:s}/{1:s}".format(dirCache, STORE_FILE)
+    with open(fileStore, 'ab') as fidStore:
+        firstRow = fidStore.tell() // ROW_BYTES
+        fidStore.write(np.ascontiguousarray(histograms, dtype=np.int64).tobytes())
+    return firstRow
+
+
+def _compact(index, dirCache):
+    """Remove the rows of images that are no longer in the index from the histogram matrix of the store.
+
+    :param index:       The index entry for each image in the store. The rows of the entries are updated.
+    :type index:        dict
+    :param dirCache:    The directory containing the store.
+    :type dirCache:     str
+
+    """
+
+    fileStore = "{0:s}/{1:s}".format(dirCache, STORE_FILE)
+    store = open_store(dirCache)
+    paths = sorted(index, key=lambda i: index[i][0])
+    with open(fileStore + ".tmp", 'wb') as fidStore:
+        for newRow, i in enumerate(paths):
+            fidStore.write(np.asarray(store[index[i][0]]).tobytes())
+            index[i] = (newRow,) + index[i][1:]
+    del store  # Close the memory map before replacing the file.
+    os.replace(fileStore + ".tmp", fileStore)
+
+
+def _migrate_legacy_cache(dirCache):
+    """Move the histograms in a cache file from before the store was appendable into the store.
+
+    :param dirCache:    The directory containing the cache.
+    :type dirCache:     str
+
+    """
+
+    fileLegacyCache = "{0:s}/{1:s}".format(dirCache, LEGACY_CACHE_FILE)
+    with np.load(fileLegacyCache) as cache:
+        paths = [str(i) for i in cache["Paths"]]
+        firstRow = _append_rows(cache["Histograms"].reshape(len(paths), 256), dirCache)
+        index = {path: (firstRow + ind, _case_id(path), int(size), float(mtime), str(contentHash))
+                 for ind, (path, size, mtime, contentHash) in
+                 enumerate(zip(paths, cache["Sizes"], cache["MTimes"], cache["Hashes"]))}
+    save_index(index, dirCache)
+    os.remove(fileLegacyCache)
+
+
+def main(filePaths, dirCache=None, numWorkers=1, profiler=None):
+    """Generate the histogram of the pixel values in each of a set of images, using the store where possible.
+
+    An image is histogrammed if it isn't in the store, or if its size or modification time have changed and its
+    contents no longer match the stored hash. New images are appended to the store, and changed images have their
+    histogram overwritten in place. Images that no longer exist are evicted from the index, and their rows are removed
+    once they make up more than half of the store.
+
+    :param filePaths:   The locations of the images.
+    :type filePaths:    list
+    :param dirCache:    The directory containing the store. If this is None, then every image is histogrammed and no
+                            store is used.
+    :type dirCache:     str
+    :param numWorkers:  The number of processes to histogram the new or changed images with.
+    :type numWorkers:   int
+    :param profiler:    The profiler to record the time and memory used to histogram each image with.
+    :type profiler:     Utilities.profiling.Profiler
+    :return :           The histogram of each image (one row per image, in the same order as filePaths). When the
+                            images occupy consecutive rows of the store (e.g. when they were added in the same order),
+                            this is a memory-mapped view of the store rather than a copy.
+    :rtype :            numpy array or numpy memmap
+
+    """
+
+    if dirCache is None:
+        return image_histogram.histogram_images(filePaths, numWorkers, profiler)
+    if not os.path.exists(dirCache):
+        os.makedirs(dirCache)
+    if os.path.isfile("{0:s}/{1:s}".format(dirCache, LEGACY_CACHE_FILE)):
+        _migrate_legacy_cache(dirCache)
+
+    # Evict the entries for images that have been removed.
+    index = load_index(dirCache)
+    index = {i: index[i] for i in index if os.path.exists(i)}
+
+    # Find the images that need histogramming.
+    imagesToHistogram = []
+    for i in filePaths:
+        cacheKey = os.path.abspath(i)
+        size, mtime = image_signature(i)
+        indexEntry = index.get(cacheKey)
+        if indexEntry is not None and indexEntry[2:4] == (size, mtime):
+            # The image is unchanged, so there's no need to check its contents.
+            continue
+        contentHash = image_hash(i)
+        if indexEntry is not None and indexEntry[4] == contentHash:
+            # Only the modification time of the image has changed (e.g. it was rewritten with the same contents).
+            index[cacheKey] = indexEntry[:2] + (size, mtime, contentHash)
+        else:
+            imagesToHistogram.append((i, cacheKey, size, mtime, contentHash))
+
+    # Histogram the new and changed images. The histograms of changed images are overwritten in place, and those of
+    # new images are appended to the store.
+    newHistograms = image_histogram.histogram_images([i[0] for i in imagesToHistogram], numWorkers, profiler)
+    changedImages = [ind for ind, i in enumerate(imagesToHistogram) if i[1] in index]
+    newImages = [ind for ind, i in enumerate(imagesToHistogram) if i[1] not in index]
+    if changedImages:
+        store = open_store(dirCache, mode='r+')
+        for i in changedImages:
+            store[index[imagesToHistogram[i][1]][0]] = newHistograms[i]
+        store.flush()
+        del store
+    newRows = {}  # The row of the store that each new image's histogram was appended to.
+    if newImages:
+        firstRow = _append_rows(newHistograms[newImages], dirCache)
+        newRows = {ind: firstRow + k for k, ind in enumerate(newImages)}
+    for ind, (filePath, cacheKey, size, mtime, contentHash) in enumerate(imagesToHistogram):
+        row = index[cacheKey][0] if cacheKey in index else newRows[ind]
+        index[cacheKey] = (row, _case_id(filePath), size, mtime, contentHash)
+
+    # Remove the rows of evicted images once they make up most of the store.
+    if open_store(dirCache).shape[0] > 2 * len(index):
+        _compact(index, dirCache)
+    save_index(index, dirCache)
+    print("Histogrammed {0:d} images, loaded {1:d} from the store.".format(
+        len(imagesToHistogram), len(filePaths) - len(imagesToHistogram)))
+
+    # Select the histograms of the images from the store.
+    store = open_store(dirCache)
+    rows = np.array([index[os.path.abspath(i)][0] for i in filePaths], dtype=np.int64)
+    if rows.size > 0 and np.array_equal(rows, np.arange(rows[0], rows[0] + rows.size)):
+        return store[rows[0]:rows[0] + rows.size]
+    return np.asarray(store[rows]) if rows.size > 0 else np.empty((0, 256), dtype=np.int64)
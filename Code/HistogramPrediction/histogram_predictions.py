@@ -6,23 +6,28 @@ import sys
 
 # 3rd party imports.
 import numpy as np
-import scipy.ndimage
 from sklearn.linear_model import ElasticNet
 
 # User imports.
+from . import grid_search
+from . import histogram_augmentation
+from . import ground_truth
+from . import histogram_cache
+from . import model_artefact
 import Utilities.merge_dictionaries
 import Utilities.partition_dataset
+import Utilities.profiling
 
 # Globals.
 modelChoices = {  # The choices of models available to use.
-    "ElasticNet": {"Model": ElasticNet, "Stratified": True}
+    "ElasticNet": {"Model": ElasticNet, "Stratified": True, "Path": True}
 }
 
 
 def main(arguments):
     """
 
-    Assumes 8 bit greyscale or color images.
+    Assumes 8 bit greyscale or color images, saved either as image files, NPY arrays or directories of tiles.
 
     :param arguments:   The Her2 histogram prediction arguments in JSON format.
     :type arguments:    JSON object
@@ -38,6 +43,8 @@ def main(arguments):
     backgroundThreshold = arguments["BackgroundThreshold"]  # The lowest pixel value that makes up the background.
     isPredictingHer2 = arguments["TargetHer2"]  # Whether we are attempting to predict Her2 or cell staining percentage.
     foldsToUse = arguments["CVFolds"]  # The number of CV folds to use.
+    numCVRepeats = arguments.get("CVRepeats", 1)  # The number of times to repeat the CV with different partitions.
+    partitionSeed = arguments.get("PartitionSeed", 0)  # The seed for shuffling the examples into the CV folds.
     dirResults = arguments["ResultsLocation"]  # Directory to save the results in.
     if not os.path.exists(dirResults):
         # The results directory doesn't exist, so try and create it.
@@ -48,56 +55,74 @@ def main(arguments):
             sys.exit()
     modelToUse = arguments["ModelToUse"]  # The type of model to train.
     modelParams = arguments["ModelParameters"]
+    dirHistogramCache = arguments.get("HistogramCacheLocation")  # Directory to cache the image histograms in.
+    numHistogramWorkers = arguments.get("HistogramWorkers", 1)  # The number of processes to histogram images with.
+    numTrainingWorkers = arguments.get("TrainingWorkers", 1)  # The number of processes to train the models with.
+    isPathMode = arguments.get("PathMode", False)  # Whether to fit the alpha values along a regularisation path.
+    binWidth = arguments.get("BinWidth", 1)  # The number of neighbouring pixel values to combine into each feature.
+    binCount = arguments.get("BinCount")  # The number of features to combine the pixel values into.
+    featureType = np.dtype(arguments.get("FeatureType", "float64"))  # The type to store the features as.
+    numAugmentations = arguments.get("Augmentations", 0)  # The number of transformed versions of each image to add.
+    numAugmentationSamples = arguments.get("AugmentationSamples", 100000)  # Pixels sampled per transformed image.
+    augmentationSeed = arguments.get("AugmentationSeed", 0)  # The seed for choosing the transformations.
+    augmentationParams = arguments.get("AugmentationParameters", {})  # The ranges of the transformations.
+    fileProfile = arguments.get("ProfileLocation")  # The file to write the time and memory used by each stage to.
+    profiler = Utilities.profiling.Profiler(enabled=bool(fileProfile))
+
+    # Determine the case number of each image, and extract the ground truth values for the cases. This is done before
+    # any images are histogrammed, so that cases missing from the ground truth are reported straight away.
+    imageFiles = sorted(os.listdir(dirImages))
+    caseIDs = np.array([int(i.split('_')[0]) for i in imageFiles], dtype=np.int64)
+    try:
+        with profiler.stage("ground_truth"):
+            caseGroundTruth = ground_truth.main(fileGroundTruth, caseIDs)  # The ground truth values for each image.
+    except ValueError as err:
+        print("Error loading ground truth: {0:s}".format(str(err)))
+        sys.exit()
+
+    # Determine the mask for removing the background pixel colors, and the bins the remaining pixel values are combined
+    # into. A bin count takes precedence over a bin width.
+    backgroundMask = np.arange(256) < backgroundThreshold
+    try:
+        binStarts = model_artefact.bin_starts(np.count_nonzero(backgroundMask), binWidth, binCount)
+    except ValueError as err:
+        print("Error binning the pixel values: {0:s}".format(str(err)))
+        sys.exit()
 
-    # Extract the ground truth values.
-    caseNumbers = []
-    her2Scores = []
-    stainingPercent = []
-    with open(fileGroundTruth, 'r') as fidGroundTruth:
-        fidGroundTruth.readline()  # Strip off the header.
-        for line in fidGroundTruth:
-            chunks = (line.strip()).split('\t')
-            caseNumbers.append(int(chunks[0]))
-            her2Scores.append(int(chunks[1]))
-            stainingPercent.append(float(chunks[2]))
-    groundTruth = np.array([caseNumbers, her2Scores, stainingPercent])
-
-    # Determine the mask for removing the background pixel colors.
-    backgroundMask = np.array([(False if i >= backgroundThreshold else True) for i in range(256)])
-
-    # Initalise the matrix that will hold the histogram data.
-    # There will be one row per image and one column for each of the non-background pixel values, one
-    # for the case number, one for the Her2 score and one for the percentage of stained cells).
-    dataMatrix = np.empty((len(os.listdir(dirImages)), (backgroundMask.sum() + 3)))
-
-    # Generate the matrix of histogram feature vectors.
-    for ind, i in enumerate(os.listdir(dirImages)):
-        # Read in the file.
-        filePath = "{0:s}/{1:s}".format(dirImages, i)
-        image = scipy.ndimage.imread(filePath)
-
-        # Generate the histogram. One bin per color value.
-        histogram = scipy.ndimage.histogram(image, 0, 255, 256)
-
-        # Strip out the background color.
-        histogram = histogram[backgroundMask]
-
-        # Convert histogram to relative values. This will remove issues with image sizes being different.
-        histogram = histogram / histogram.sum()
-
-        # Determine the number case identifier for the image.
-        caseID = int(i.split('_')[0])
-
-        # Create the feature vector.
-        caseGroundTruth = groundTruth[:, groundTruth[0, :] == caseID]  # The ground truth values for this image.
-        dataMatrix[ind, 0] = caseID
-        dataMatrix[ind, 1] = caseGroundTruth[1]
-        dataMatrix[ind, 2] = caseGroundTruth[2]
-        dataMatrix[ind, 3:] = histogram
-
-    # Determine the target vector and the subset of the dataset used for training.
-    trainingDataMatrix = dataMatrix[:, 3:]
-    targetVector = dataMatrix[:, 1] if isPredictingHer2 else dataMatrix[:, 2]
+    # Generate the histogram of each image. One bin per color value. Only the images that have changed since the
+    # histograms were cached need to be histogrammed.
+    with profiler.stage("histogram"):
+        histograms = histogram_cache.main(["{0:s}/{1:s}".format(dirImages, i) for i in imageFiles], dirHistogramCache,
+                                          numHistogramWorkers, profiler)
+
+    # Create the matrix of histogram feature vectors, with one row per image and one column for each bin of
+    # non-background pixel values. The background color is stripped out, and the histograms converted to relative
+    # values. The case numbers and ground truth values of the images are kept in their own typed arrays.
+    with profiler.stage("create_features"):
+        trainingDataMatrix = model_artefact.create_features(histograms, backgroundMask, binStarts, featureType)
+
+    # Determine the target vector.
+    targetVector = caseGroundTruth["Her2Score"] if isPredictingHer2 else caseGroundTruth["StainingPercent"]
+
+    # Augment the training data with the histograms of randomly scaled, rotated and sheared versions of the images.
+    # Each augmented example has the target value of the image it was generated from. The final models are trained on
+    # both the images and the augmented examples.
+    fittingDataMatrix = trainingDataMatrix
+    fittingTargetVector = targetVector
+    if numAugmentations > 0:
+        with profiler.stage("augment"):
+            augmentedHistograms, augmentedSources = histogram_augmentation.main(
+                ["{0:s}/{1:s}".format(dirImages, i) for i in imageFiles], numAugmentations, numAugmentationSamples,
+                augmentationSeed, maxRotation=augmentationParams.get("MaxRotation", 0),
+                maxShear=tuple(augmentationParams.get("MaxShear", [0])),
+                maxScale=tuple(augmentationParams.get("MaxScale", [1])),
+                scaleUpProb=tuple(augmentationParams.get("ScaleUpProb", [0.5])),
+                jointScale=augmentationParams.get("JointScale", False))
+            augmentedMatrix = model_artefact.create_features(augmentedHistograms, backgroundMask, binStarts,
+                                                            featureType)
+            augmentedTargetVector = targetVector[augmentedSources]
+        fittingDataMatrix = np.concatenate([trainingDataMatrix, augmentedMatrix])
+        fittingTargetVector = np.concatenate([targetVector, augmentedTargetVector])
 
     # Determine all combinations of the model parameters. The parameters to be considered are stored as a dictionary,
     # with the value for each dictionary entry being a list of the values to use when training the model.
@@ -120,38 +145,72 @@ def main(arguments):
             # containing one dict for each list element.
             paramList = [{i: j} for j in modelParams[i]]
 
+    # Determine the settings needed to recreate the features and model when scoring new images.
+    featureSettings = {"BackgroundThreshold": backgroundThreshold, "TargetHer2": isPredictingHer2,
+                       "ModelToUse": modelToUse, "BinStarts": binStarts.tolist(), "FeatureType": featureType.name}
+
     # Perform the model training.
     if foldsToUse < 2:
-        # Train on the entire dataset and predict on the test observations.
-        for params in paramList:
+        # Train on the entire dataset and predict on the test observations. Each trained model is saved.
+        for ind, params in enumerate(paramList):
             # Create the model.
             model = modelChoices[modelToUse]["Model"](**params)
 
             # Train the model.
-            model.fit(trainingDataMatrix, targetVector)
+            with profiler.stage("fit", "Model_{0:d}".format(ind)):
+                model.fit(fittingDataMatrix, fittingTargetVector)
+
+            # Save the model.
+            with profiler.stage("save_model", "Model_{0:d}".format(ind)):
+                model_artefact.save("{0:s}/Model_{1:d}.pkl".format(dirResults, ind), model, backgroundMask,
+                                    Utilities.merge_dictionaries.main(featureSettings, {"ModelParameters": params}))
     else:
         # Train using cross validation. With two folds this is equivalent to hold out testing.
 
-        # Partition the dataset.
-        partition = Utilities.partition_dataset.main(trainingDataMatrix, targetVector, foldsToUse,
-                                                     modelChoices[modelToUse]["Stratified"])
-
-        # Perform cross validation.
-        for params in paramList:
-            for i in range(foldsToUse):
-                # Determine the subset of data to use for training and testing in this fold.
-                trainingExamples = partition != i
-                trainingDataSubset = trainingDataMatrix[trainingExamples]
-                trainingTargetVector = targetVector[trainingExamples]
-                testingExamples = partition == i
-                testingDataSubset = trainingDataMatrix[testingExamples]
-                testingTargetVector = targetVector[testingExamples]
-
-                # Create the model.
-                model = modelChoices[modelToUse]["Model"](**params)
-
-                # Train the model.
-                model.fit(trainingDataSubset, trainingTargetVector)
-
-                # Test the model.
-                model.predict(testingDataSubset)
+        # Partition the dataset, once for each repeat of the cross validation.
+        with profiler.stage("partition"):
+            partitions = Utilities.partition_dataset.repeated(
+                trainingDataMatrix, targetVector, foldsToUse, numCVRepeats, modelChoices[modelToUse]["Stratified"],
+                partitionSeed)
+
+        # Determine whether the alpha values can be fitted along a regularisation path.
+        if isPathMode and not (modelChoices[modelToUse]["Path"] and grid_search.supports_path(modelParams)):
+            print("Path mode requires a model with a regularisation path, alpha values to search over and only "
+                  "parameters that the path can be fitted with. Fitting each model separately.")
+            isPathMode = False
+
+        # Perform cross validation, training a model for every combination of parameters and fold of each repeat. The
+        # augmented examples are only trained on, and never in the fold that the image they were generated from is
+        # tested in. When the cross validation is repeated, the repeat of each result is recorded.
+        results = []
+        for repeat, partition in enumerate(partitions):
+            augmentation = None
+            if numAugmentations > 0:
+                augmentation = (augmentedMatrix, augmentedTargetVector, partition[augmentedSources])
+            with profiler.stage("grid_search", "Repeat_{0:d}".format(repeat)):
+                repeatResults = grid_search.main(
+                    trainingDataMatrix, targetVector, partition, foldsToUse, modelChoices[modelToUse]["Model"],
+                    paramList, numTrainingWorkers, isPathMode, augmentation)
+            if numCVRepeats > 1:
+                repeatResults = [Utilities.merge_dictionaries.main(
+                    {j: i[j] for j in i if j not in ["Fold", "MSE", "R2"]},
+                    {"Repeat": repeat, "Fold": i["Fold"], "MSE": i["MSE"], "R2": i["R2"]}) for i in repeatResults]
+            results.extend(repeatResults)
+        grid_search.write_results(results, "{0:s}/CVResults.tsv".format(dirResults))
+
+        # Train the combination of parameters with the lowest mean squared error (averaged over the folds and repeats)
+        # on the entire dataset, and save the model.
+        meanErrors = np.array([i["MSE"] for i in results]).reshape(
+            numCVRepeats, len(paramList), foldsToUse).mean(axis=(0, 2))
+        bestParams = paramList[int(np.argmin(meanErrors))]
+        print("Best parameters {0:s} with mean squared error {1:.4f}.".format(str(bestParams), meanErrors.min()))
+        model = modelChoices[modelToUse]["Model"](**bestParams)
+        with profiler.stage("fit", "Model"):
+            model.fit(fittingDataMatrix, fittingTargetVector)
+        with profiler.stage("save_model", "Model"):
+            model_artefact.save("{0:s}/Model.pkl".format(dirResults), model, backgroundMask,
+                                Utilities.merge_dictionaries.main(featureSettings, {"ModelParameters": bestParams}))
+
+    # Write out the time and memory used by each stage.
+    if fileProfile:
+        profiler.write(fileProfile)
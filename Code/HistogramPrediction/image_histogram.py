@@ -0,0 +1,132 @@
+"""Code to generate the histogram of pixel values of a cleaned image, whatever format it was saved in."""
+
+# Python imports.
+import concurrent.futures
+from multiprocessing import shared_memory
+import os
+
+# 3rd party imports.
+import numpy as np
+import PIL.Image
+import scipy.ndimage
+
+# User imports.
+import Utilities.profiling
+
+# Globals.
+ROWS_PER_BLOCK = 1024  # The number of rows of a memory-mapped image to bin at once.
+EIGHT_BIT_MODES = {"L", "LA", "RGB", "RGBA"}  # The PIL modes of images with 8 bit bands of pixel values.
+
+
+def _histogram_into(sharedName, numImages, row, filePath, isProfiled=False):
+    """Histogram an image and write the histogram into a row of a shared matrix.
+
+    :param sharedName:  The name of the shared memory block holding the matrix of histograms.
+    :type sharedName:   str
+    :param numImages:   The number of rows in the matrix of histograms.
+    :type numImages:    int
+    :param row:         The row of the matrix to write the histogram into.
+    :type row:          int
+    :param filePath:    The location of the image.
+    :type filePath:     str
+    :param isProfiled:  Whether to record the time and memory used to histogram the image.
+    :type isProfiled:   bool
+    :return :           The profiled stages (empty if the image isn't profiled).
+    :rtype :            list of dict
+
+    """
+
+    profiler = Utilities.profiling.Profiler(enabled=isProfiled)
+    sharedBlock = shared_memory.SharedMemory(name=sharedName)
+    try:
+        histograms = np.ndarray((numImages, 256), dtype=np.int64, buffer=sharedBlock.buf)
+        with profiler.stage("histogram_image", os.path.basename(filePath)):
+            histograms[row] = main(filePath)
+        del histograms  # Release the view of the shared memory so that the block can be closed.
+    finally:
+        sharedBlock.close()
+    return profiler.records
+
+
+def histogram_images(filePaths, numWorkers=1, profiler=None):
+    """Generate the histogram of the pixel values in each of a set of images, potentially in parallel.
+
+    With more than one worker, the images are decoded and histogrammed in a pool of processes. Each process writes
+    its histograms straight into a matrix in shared memory, so that no histograms need to be sent back.
+
+    :param filePaths:   The locations of the images.
+    :type filePaths:    list
+    :param numWorkers:  The number of processes to histogram the images with.
+    :type numWorkers:   int
+    :param profiler:    The profiler to record the time and memory used to histogram each image with.
+    :type profiler:     Utilities.profiling.Profiler
+    :return :           The histogram of each image (one row per image, in the same order as filePaths).
+    :rtype :            numpy array
+
+    """
+
+    profiler = profiler or Utilities.profiling.Profiler(enabled=False)
+    numImages = len(filePaths)
+    if numWorkers < 2 or numImages < 2:
+        histograms = np.empty((numImages, 256), dtype=np.int64)
+        for ind, i in enumerate(filePaths):
+            with profiler.stage("histogram_image", os.path.basename(i)):
+                histograms[ind] = main(i)
+        return histograms
+
+    sharedBlock = shared_memory.SharedMemory(create=True, size=numImages * 256 * np.dtype(np.int64).itemsize)
+    try:
+        sharedHistograms = np.ndarray((numImages, 256), dtype=np.int64, buffer=sharedBlock.buf)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(numWorkers, numImages)) as executor:
+            futures = [executor.submit(_histogram_into, sharedBlock.name, numImages, ind, i, profiler.enabled)
+                       for ind, i in enumerate(filePaths)]
+            for future in futures:
+                profiler.extend(future.result())
+        histograms = sharedHistograms.copy()
+        del sharedHistograms  # Release the view of the shared memory so that the block can be closed.
+    finally:
+        sharedBlock.close()
+        sharedBlock.unlink()
+    return histograms
+
+
+def main(filePath):
+    """Generate a histogram of the pixel values in a cleaned image.
+
+    Histograms saved by the preprocessing (as NPY arrays of 256 counts) are returned as they are. Images saved as NPY
+    arrays are memory-mapped and binned a block of rows at a time, so they never need to be
+    decoded or read fully into memory. Images saved as directories of tiles have the histograms of their tiles summed.
+    Any other file is decoded as an image. The histograms of 8 bit images are computed by PIL directly from the decoded
+    image, without converting it to an array. Palette images are converted to RGB (or RGBA if they have transparency)
+    first, as their pixels are indices into the palette rather than pixel values.
+
+    :param filePath:    The location of the image.
+    :type filePath:     str
+    :return :           The number of pixel values equal to each of 0..255.
+    :rtype :            numpy array
+
+    """
+
+    if os.path.isdir(filePath):
+        # The image was saved as a directory of tiles.
+        return sum((main("{0:s}/{1:s}".format(filePath, i)) for i in sorted(os.listdir(filePath))),
+                   np.zeros(256, dtype=np.int64))
+    elif filePath.endswith(".npy"):
+        image = np.load(filePath, mmap_mode='r')
+        if image.shape == (256,):
+            # The histogram of the image was saved by the preprocessing instead of the image itself.
+            return np.array(image, dtype=np.int64)
+        histogram = np.zeros(256, dtype=np.int64)
+        for i in range(0, image.shape[0], ROWS_PER_BLOCK):
+            histogram += np.bincount(np.ravel(image[i:i + ROWS_PER_BLOCK]), minlength=256)
+        return histogram
+    else:
+        with PIL.Image.open(filePath) as image:
+            decodedImage = image
+            if image.mode == "P":
+                decodedImage = image.convert("RGBA" if "transparency" in image.info else "RGB")
+            if decodedImage.mode in EIGHT_BIT_MODES:
+                # Sum the 256 bin histograms of each band.
+                return np.array(decodedImage.histogram(), dtype=np.int64).reshape(-1, 256).sum(axis=0)
+            imageArray = np.asarray(decodedImage)
+        return scipy.ndimage.histogram(imageArray, 0, 255, 256).astype(np.int64)
@@ -0,0 +1,116 @@
+"""Code to save a trained model along with everything needed to score new images with it."""
+
+# Python imports.
+import pickle
+
+# 3rd party imports.
+import numpy as np
+import sklearn
+
+# Globals.
+ARTEFACT_VERSION = 2  # The version of the artefact format. Increase this whenever the contents of the artefact change.
+ROWS_PER_BLOCK = 4096  # The number of histograms to convert to features at once.
+
+
+def bin_starts(numPixelValues, binWidth=1, binCount=None):
+    """Determine how the non-background pixel values are combined into bins of neighbouring values.
+
+    :param numPixelValues:  The number of non-background pixel values.
+    :type numPixelValues:   int
+    :param binWidth:        The number of pixel values in each bin (the last bin may hold fewer values than the others).
+    :type binWidth:         int
+    :param binCount:        The number of bins. If set, this takes precedence over binWidth, and the pixel values are
+                                spread as evenly as possible over exactly this many bins.
+    :type binCount:         int
+    :return :               The index (among the non-background pixel values) of the first pixel value in each bin.
+    :rtype :                numpy array
+    :raises ValueError:     If there are more bins than non-background pixel values.
+
+    """
+
+    if not binCount:
+        return np.arange(0, numPixelValues, binWidth)
+    if binCount > numPixelValues:
+        raise ValueError("can't combine {0:d} pixel values into {1:d} bins".format(numPixelValues, binCount))
+    return np.linspace(0, numPixelValues, binCount + 1).round().astype(np.int64)[:-1]
+
+
+def create_features(histograms, backgroundMask, binStarts=None, featureType=np.float64):
+    """Convert the histograms of a set of images into feature vectors.
+
+    The background pixel values are stripped out, and the remaining pixel values are combined into bins of
+    neighbouring values (see bin_starts). The histograms are then converted to relative values. This removes issues
+    with image sizes being different.
+
+    The histograms are converted a block of rows at a time, so that a memory-mapped histogram matrix is never read into
+    memory all at once.
+
+    :param histograms:      The histogram of each image (one row per image).
+    :type histograms:       numpy array
+    :param backgroundMask:  Whether each pixel value is kept (i.e. isn't part of the background).
+    :type backgroundMask:   numpy array
+    :param binStarts:       The index (among the non-background pixel values) of the first pixel value in each bin.
+                                Defaults to one bin per pixel value.
+    :type binStarts:        numpy array
+    :param featureType:     The type of the feature vectors.
+    :type featureType:      numpy dtype
+    :return :               The feature vector of each image (one row per image).
+    :rtype :                numpy array
+
+    """
+
+    numPixelValues = np.count_nonzero(backgroundMask)
+    binStarts = np.arange(numPixelValues) if binStarts is None else np.asarray(binStarts, dtype=np.int64)
+    features = np.empty((histograms.shape[0], binStarts.size), dtype=featureType)
+    for i in range(0, histograms.shape[0], ROWS_PER_BLOCK):
+        block = np.asarray(histograms[i:i + ROWS_PER_BLOCK])[:, backgroundMask]
+        if binStarts.size < numPixelValues:
+            block = np.add.reduceat(block, binStarts, axis=1)
+        np.divide(block, block.sum(axis=1, keepdims=True), out=features[i:i + ROWS_PER_BLOCK], casting="same_kind")
+    return features
+
+
+def save(fileArtefact, model, backgroundMask, featureSettings):
+    """Save a trained model artefact.
+
+    :param fileArtefact:    The location to save the artefact.
+    :type fileArtefact:     str
+    :param model:           The trained model.
+    :type model:            sklearn estimator
+    :param backgroundMask:  Whether each pixel value was kept when creating the feature vectors.
+    :type backgroundMask:   numpy array
+    :param featureSettings: The settings used to create the features and train the model (e.g. the background
+                                threshold, the bin starts, the target and the model parameters).
+    :type featureSettings:  dict
+
+    """
+
+    artefact = {
+        "Version": ARTEFACT_VERSION, "SklearnVersion": sklearn.__version__, "Model": model,
+        "BackgroundMask": np.asarray(backgroundMask, dtype="bool"), "FeatureSettings": featureSettings
+    }
+    with open(fileArtefact, 'wb') as fidArtefact:
+        pickle.dump(artefact, fidArtefact, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load(fileArtefact):
+    """Load a trained model artefact.
+
+    :param fileArtefact:    The location of the artefact.
+    :type fileArtefact:     str
+    :return :               The artefact, containing the trained model (Model), the background mask (BackgroundMask)
+                                and the settings used to create the features and train the model (FeatureSettings).
+    :rtype :                dict
+    :raises ValueError:     If the artefact was saved with a different version of the artefact format.
+
+    """
+
+    with open(fileArtefact, 'rb') as fidArtefact:
+        artefact = pickle.load(fidArtefact)
+    if not isinstance(artefact, dict) or artefact.get("Version") != ARTEFACT_VERSION:
+        raise ValueError("Model artefact {0:s} has version {1:s}, but version {2:d} is required.".format(
+            fileArtefact, str(artefact.get("Version") if isinstance(artefact, dict) else None), ARTEFACT_VERSION))
+    if artefact["SklearnVersion"] != sklearn.__version__:
+        print("Warning: model artefact {0:s} was saved with scikit-learn {1:s}, but {2:s} is installed.".format(
+            fileArtefact, artefact["SklearnVersion"], sklearn.__version__))
+    return artefact
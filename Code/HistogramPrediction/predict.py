@@ -0,0 +1,90 @@
+"""Score new images with a model trained by the histogram prediction.
+
+To score a directory of images run the command "python -m HistogramPrediction.predict Params.json" from the Code
+directory, where Params.json is a prediction parameter file (see README.md).
+
+"""
+
+# Python imports.
+import json
+import os
+import sys
+import time
+
+# 3rd party imports.
+import numpy as np
+
+# User imports.
+from HistogramPrediction import histogram_cache
+from HistogramPrediction import model_artefact
+import Utilities.json_to_ascii
+
+# Globals
+PYVERSION = sys.version_info[0]  # Determine major version number.
+
+
+def main(arguments):
+    """Predict the Her2 score (or percentage of stained cells) of each image in a directory.
+
+    The images are processed in batches. Each batch is histogrammed (using the histogram cache if one is given),
+    converted to features in the same way as when the model was trained, and scored, and its scores are written out
+    before the next batch is started.
+
+    :param arguments:   The prediction arguments in JSON format.
+    :type arguments:    JSON object
+
+    """
+
+    # Process the parameters.
+    dirImages = arguments["ImageLocation"]
+    if not os.path.isdir(dirImages):
+        print("Image location {0:s} is not a directory.".format(dirImages))
+        sys.exit()
+    fileModel = arguments["ModelLocation"]  # The model artefact saved by the training.
+    fileScores = arguments["ScoresLocation"]  # The file to write the scores to.
+    dirHistogramCache = arguments.get("HistogramCacheLocation")  # Directory to cache the image histograms in.
+    numHistogramWorkers = arguments.get("HistogramWorkers", 1)  # The number of processes to histogram images with.
+    batchSize = arguments.get("BatchSize", 256)  # The number of images to score at once.
+
+    # Load the model.
+    try:
+        artefact = model_artefact.load(fileModel)
+    except (OSError, ValueError) as err:
+        print("Error loading model: {0:s}".format(str(err)))
+        sys.exit()
+    model = artefact["Model"]
+    backgroundMask = artefact["BackgroundMask"]
+    binStarts = artefact["FeatureSettings"]["BinStarts"]
+    featureType = np.dtype(artefact["FeatureSettings"].get("FeatureType", "float64"))
+    target = "Her2Score" if artefact["FeatureSettings"]["TargetHer2"] else "StainingPercent"
+
+    # Score the images one batch at a time.
+    imageFiles = sorted(os.listdir(dirImages))
+    startTime = time.time()
+    with open(fileScores, 'w') as fidScores:
+        fidScores.write("Image\t{0:s}\n".format(target))
+        for i in range(0, len(imageFiles), batchSize):
+            batchFiles = imageFiles[i:i + batchSize]
+            histograms = histogram_cache.main(["{0:s}/{1:s}".format(dirImages, j) for j in batchFiles],
+                                              dirHistogramCache, numHistogramWorkers)
+            predictions = model.predict(
+                model_artefact.create_features(histograms, backgroundMask, binStarts, featureType))
+            for j, k in zip(batchFiles, predictions):
+                fidScores.write("{0:s}\t{1:f}\n".format(j, k))
+            fidScores.flush()
+            print("Scored {0:d} of {1:d} images ({2:.1f} images/sec).".format(
+                i + len(batchFiles), len(imageFiles), (i + len(batchFiles)) / max(time.time() - startTime, 1e-9)))
+
+
+# The images may be histogrammed in a pool of worker processes. On platforms where the workers are spawned rather than
+# forked, this file is re-imported by each worker, so the scoring must only be started by the main process.
+if __name__ == "__main__":
+    fileParams = sys.argv[1]
+    readParams = open(fileParams, 'r')
+    parsedArgs = json.load(readParams)
+    if PYVERSION < 3:
+        # Convert unicode characters to ascii (needed for Python < 3).
+        parsedArgs = Utilities.json_to_ascii.json_to_ascii(parsedArgs)
+    readParams.close()
+
+    main(parsedArgs)
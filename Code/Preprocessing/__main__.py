@@ -12,23 +12,26 @@ import Utilities.json_to_ascii
 PYVERSION = sys.version_info[0]  # Determine major version number.
 
 
-# Get the openslide bin directory.
-fileParams = sys.argv[1]
-readParams = open(fileParams, 'r')
-parsedArgs = json.load(readParams)
-if PYVERSION < 3:
-    # Convert unicode characters to ascii (needed for Python < 3).
-    parsedArgs = Utilities.json_to_ascii.json_to_ascii(parsedArgs)
-readParams.close()
+# The preprocessing may be run in a pool of worker processes. On platforms where the workers are spawned rather than
+# forked, this file is re-imported by each worker, so the preprocessing must only be started by the main process.
+if __name__ == "__main__":
+    # Get the openslide bin directory.
+    fileParams = sys.argv[1]
+    readParams = open(fileParams, 'r')
+    parsedArgs = json.load(readParams)
+    if PYVERSION < 3:
+        # Convert unicode characters to ascii (needed for Python < 3).
+        parsedArgs = Utilities.json_to_ascii.json_to_ascii(parsedArgs)
+    readParams.close()
 
-# Run the preprocessing.
-# OpenSlide depends on DLLs in the OpenSlide bin directory. Loading these in a relative manner (as OpenSlide does)
-# relies on the DLLs being either on the path of the working directory, or in system defined locations.
-# You can't add paths to be looked in from outside OpenSlide. In order to circumvent this, temporarily swap to
-# the bin directory of OpenSlide when it's imported and then swap back to the directory that the program was
-# called from.
-currentDir = os.getcwd()
-os.chdir(parsedArgs["OpenSlideBinLocation"])
-import Preprocessing.generate_images  # Have to import this after the OpenSlide bin directory is added to the path.
-os.chdir(currentDir)
-Preprocessing.generate_images.main(parsedArgs)
+    # Run the preprocessing.
+    # OpenSlide depends on DLLs in the OpenSlide bin directory. Loading these in a relative manner (as OpenSlide does)
+    # relies on the DLLs being either on the path of the working directory, or in system defined locations.
+    # You can't add paths to be looked in from outside OpenSlide. In order to circumvent this, temporarily swap to
+    # the bin directory of OpenSlide when it's imported and then swap back to the directory that the program was
+    # called from.
+    currentDir = os.getcwd()
+    os.chdir(parsedArgs["OpenSlideBinLocation"])
+    import Preprocessing.generate_images  # Have to import this after the OpenSlide bin directory is added to the path.
+    os.chdir(currentDir)
+    Preprocessing.generate_images.main(parsedArgs)
@@ -0,0 +1,249 @@
+"""Function to generate an image mask by segmenting a greyscale image in chunks."""
+
+# Python imports.
+import collections
+import concurrent.futures
+
+# 3rd party imports.
+import numpy as np
+import scipy.ndimage
+import skimage.measure
+
+# User imports.
+from . import object_selection
+
+
+def _label_chunk(paddedChunk, coreSlice, backgroundThreshold, maxFilterSize):
+    """Threshold, dilate and label one chunk of an image.
+
+    :param paddedChunk:         The chunk of the greyscale image along with the halo of pixels surrounding it.
+    :type paddedChunk:          numpy array
+    :param coreSlice:           The slice of the padded chunk that contains the chunk itself.
+    :type coreSlice:            tuple of slices
+    :param backgroundThreshold: The pixel value at which the background starts.
+    :type backgroundThreshold:  int
+    :param maxFilterSize:       The size of the max filter used to dilate the thresholded image.
+    :type maxFilterSize:        int
+    :return :                   The thresholded chunk and the labeled (dilated) chunk.
+    :rtype :                    numpy array, numpy array
+
+    """
+
+    binaryChunk = paddedChunk < backgroundThreshold
+    dilatedChunk = scipy.ndimage.maximum_filter(binaryChunk, size=maxFilterSize, mode="constant", cval=0)[coreSlice]
+    labeledChunk = skimage.measure.label(dilatedChunk, background=0, connectivity=None)
+    return binaryChunk[coreSlice], labeledChunk
+
+
+def _summarise_chunk(paddedChunk, coreSlice, backgroundThreshold, maxFilterSize):
+    """Label a chunk and summarise the labels needed to join objects across chunk borders.
+
+    :return :   The number of pixels with each label in the chunk (index 0 is the background) and the labels along the
+                    top, bottom, left and right edges of the chunk.
+    :rtype :    numpy array, tuple of numpy arrays
+
+    """
+
+    _, labeledChunk = _label_chunk(paddedChunk, coreSlice, backgroundThreshold, maxFilterSize)
+    labelCounts = np.bincount(labeledChunk.ravel())
+    borders = (labeledChunk[0, :].copy(), labeledChunk[-1, :].copy(),
+               labeledChunk[:, 0].copy(), labeledChunk[:, -1].copy())
+    return labelCounts, borders
+
+
+def _mask_chunk(paddedChunk, coreSlice, backgroundThreshold, maxFilterSize, keepLookup):
+    """Label a chunk and select the pixels belonging to the objects being kept.
+
+    :param keepLookup:  Whether each label in the chunk belongs to an object being kept.
+    :type keepLookup:   numpy array
+    :return :           The mask for the chunk.
+    :rtype :            numpy array
+
+    """
+
+    binaryChunk, labeledChunk = _label_chunk(paddedChunk, coreSlice, backgroundThreshold, maxFilterSize)
+    maskChunk = keepLookup[labeledChunk]
+    maskChunk &= binaryChunk
+    return maskChunk
+
+
+def _map_chunks(function, chunkArguments, numWorkers):
+    """Apply a function to each chunk of an image, potentially in parallel.
+
+    At most twice as many chunks as there are workers are submitted to the pool at any one time, so that the whole
+    image is never copied into the pool's task queue at once.
+
+    :param function:        The function to apply to each chunk.
+    :type function:         function
+    :param chunkArguments:  The arguments to call the function with for each chunk.
+    :type chunkArguments:   iterable of tuples
+    :param numWorkers:      The number of worker processes to use. With 1 worker the chunks are processed in the
+                                calling process.
+    :type numWorkers:       int
+    :return :               The result of the function for each chunk, in the same order as the chunks.
+    :rtype :                generator
+
+    """
+
+    if numWorkers < 2:
+        for i in chunkArguments:
+            yield function(*i)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=numWorkers) as executor:
+        pendingChunks = collections.deque()
+        for i in chunkArguments:
+            pendingChunks.append(executor.submit(function, *i))
+            if len(pendingChunks) >= 2 * numWorkers:
+                yield pendingChunks.popleft().result()
+        while pendingChunks:
+            yield pendingChunks.popleft().result()
+
+
+def _find_root(parents, label):
+    """Find the root label of the set containing a label, compressing the path to the root along the way.
+
+    :param parents: The parent of each label in the union-find forest.
+    :type parents:  numpy array
+    :param label:   The label to find the root of.
+    :type label:    int
+    :return :       The root label.
+    :rtype :        int
+
+    """
+
+    root = label
+    while parents[root] != root:
+        root = parents[root]
+    while parents[label] != root:
+        parents[label], label = root, parents[label]
+    return root
+
+
+def main(imageArray, backgroundThreshold=255, maxFilterSize=5, objectsToUse=(1,), chunkSize=1024, numWorkers=1,
+         minObjectSize=0):
+    """Select pixels in regions of interest of a greyscale image by segmenting it in chunks.
+
+    This produces the same mask as Preprocessing.create_image_mask.main, but never creates a full size thresholded,
+    dilated or labeled image. Instead, the image is split into square chunks. Each chunk is dilated along with a halo
+    of pixels around it that is large enough for the max filter to give the same result as it would on the whole
+    image, and then labeled. Labels that touch across chunk borders are joined with a union-find pass to give the
+    objects in the whole image. The chunks are then labeled a second time in order to create the mask, so that the
+    labeled chunks don't need to be kept in memory. When several objects have the same number of pixels, the order in
+    which they are ranked may differ from that of the unchunked segmentation.
+
+    :param imageArray:          The greyscale image to segment.
+    :type imageArray:           numpy array
+    :param backgroundThreshold: The pixel value at which the background starts.
+    :type backgroundThreshold:  int
+    :param maxFilterSize:       The size of the max filter used to dilate the thresholded image.
+    :type maxFilterSize:        int
+    :param objectsToUse:        The ranks (by number of pixels) of the objects to keep.
+    :type objectsToUse:         list or tuple
+    :param chunkSize:           The height and width of the chunks.
+    :type chunkSize:            int
+    :param numWorkers:          The number of processes to label the chunks with.
+    :type numWorkers:           int
+    :param minObjectSize:       The minimum number of pixels (after dilation) an object must contain to be kept.
+    :type minObjectSize:        int
+    :return :                   The mask with True values for the pixels in regions of interest.
+    :rtype :                    numpy array
+
+    """
+
+    # Determine the chunks. The halo around each chunk needs to cover the furthest that the max filter reaches.
+    halo = maxFilterSize // 2
+    numRows, numCols = imageArray.shape
+    chunkRows = list(range(0, numRows, chunkSize))
+    chunkCols = list(range(0, numCols, chunkSize))
+
+    def chunk_arguments(keepLookups=None):
+        # Generate the arguments for processing each chunk in row major order. Each chunk is passed along with its
+        # halo, and the location of the chunk within the padded chunk.
+        chunkIndex = 0
+        for i in chunkRows:
+            for j in chunkCols:
+                paddedTop = max(i - halo, 0)
+                paddedLeft = max(j - halo, 0)
+                paddedChunk = imageArray[paddedTop:min(i + chunkSize + halo, numRows),
+                                         paddedLeft:min(j + chunkSize + halo, numCols)]
+                coreSlice = (slice(i - paddedTop, i - paddedTop + min(chunkSize, numRows - i)),
+                             slice(j - paddedLeft, j - paddedLeft + min(chunkSize, numCols - j)))
+                arguments = (paddedChunk, coreSlice, backgroundThreshold, maxFilterSize)
+                yield arguments if keepLookups is None else arguments + (keepLookups[chunkIndex],)
+                chunkIndex += 1
+
+    # Label each chunk, and give every label in the image a unique value by offsetting each chunk's labels by the
+    # number of labels in the chunks before it. Label 0 is the background in every chunk.
+    chunkSummaries = list(_map_chunks(_summarise_chunk, chunk_arguments(), numWorkers))
+    labelOffsets = np.cumsum([0] + [i.size - 1 for i, _ in chunkSummaries])
+    numLabels = labelOffsets[-1] + 1
+    labelCounts = np.zeros(numLabels, dtype=np.int64)
+    for (counts, _), offset in zip(chunkSummaries, labelOffsets):
+        labelCounts[0] += counts[0]
+        labelCounts[offset + 1:offset + counts.size] = counts[1:]
+
+    # Find the labels that are connected across chunk borders. Pixels are connected to all 8 of their neighbours, so
+    # a pixel on one side of a border is connected to three pixels on the other side.
+    def global_labels(chunkIndex, border):
+        labels = chunkSummaries[chunkIndex][1][border]
+        return np.where(labels > 0, labels + labelOffsets[chunkIndex], 0)
+
+    connectedPairs = []
+    for i in range(len(chunkRows)):
+        for j in range(len(chunkCols)):
+            chunkIndex = i * len(chunkCols) + j
+            neighbours = []
+            if j + 1 < len(chunkCols):
+                # Right hand border.
+                neighbours.append((global_labels(chunkIndex, 3), global_labels(chunkIndex + 1, 2)))
+            if i + 1 < len(chunkRows):
+                # Bottom border.
+                neighbours.append((global_labels(chunkIndex, 1), global_labels(chunkIndex + len(chunkCols), 0)))
+                if j + 1 < len(chunkCols):
+                    # Bottom right corner.
+                    neighbours.append((global_labels(chunkIndex, 1)[-1:],
+                                       global_labels(chunkIndex + len(chunkCols) + 1, 0)[:1]))
+                if j > 0:
+                    # Bottom left corner.
+                    neighbours.append((global_labels(chunkIndex, 1)[:1],
+                                       global_labels(chunkIndex + len(chunkCols) - 1, 0)[-1:]))
+            for borderLabels, neighbourLabels in neighbours:
+                for k in [-1, 0, 1]:
+                    # Pair each border pixel with the neighbouring pixel k positions along the border.
+                    first = borderLabels[max(-k, 0):borderLabels.size - max(k, 0)]
+                    second = neighbourLabels[max(k, 0):neighbourLabels.size - max(-k, 0)]
+                    isConnected = (first > 0) & (second > 0)
+                    connectedPairs.append(np.stack([first[isConnected], second[isConnected]], axis=1))
+
+    # Join the connected labels into objects using a union-find forest. Each object is rooted at its smallest label.
+    parents = np.arange(numLabels)
+    connectedPairs = np.unique(np.concatenate(connectedPairs), axis=0) if connectedPairs else np.empty((0, 2))
+    for first, second in connectedPairs:
+        firstRoot = _find_root(parents, first)
+        secondRoot = _find_root(parents, second)
+        if firstRoot != secondRoot:
+            parents[max(firstRoot, secondRoot)] = min(firstRoot, secondRoot)
+    while True:
+        # Point every label directly at its root.
+        grandparents = parents[parents]
+        if np.array_equal(grandparents, parents):
+            break
+        parents = grandparents
+    objectRoots, objectOfLabel = np.unique(parents, return_inverse=True)
+    objectCounts = np.bincount(objectOfLabel, weights=labelCounts).astype(np.int64)
+
+    # Determine which objects to keep. The background is object 0, and is ranked along with the true objects.
+    keepObject = object_selection.main(objectCounts, objectsToUse, minObjectSize)
+    keepLabel = keepObject[objectOfLabel]
+
+    # Create the mask, one chunk at a time.
+    keepLookups = [np.concatenate([keepLabel[:1], keepLabel[offset + 1:offset + counts.size]])
+                   for (counts, _), offset in zip(chunkSummaries, labelOffsets)]
+    mask = np.empty(imageArray.shape, dtype="bool")
+    chunkPositions = [(i, j) for i in chunkRows for j in chunkCols]
+    for (i, j), maskChunk in zip(chunkPositions,
+                                 _map_chunks(_mask_chunk, chunk_arguments(keepLookups), numWorkers)):
+        mask[i:i + maskChunk.shape[0], j:j + maskChunk.shape[1]] = maskChunk
+
+    return mask
@@ -6,8 +6,14 @@ import numpy as np
 import scipy.ndimage
 import skimage.measure
 
+# User imports.
+from . import chunked_labelling
+from . import object_selection
+import Utilities.profiling
 
-def main(imageArray, backgroundThreshold=255, maxFilterSize=5, objectsToUse=(1,), visualise=False):
+
+def main(imageArray, backgroundThreshold=255, maxFilterSize=5, objectsToUse=(1,), visualise=False, chunkSize=0,
+         numWorkers=1, minObjectSize=0, profiler=None):
     """Select pixels in regions of interest of a greyscale image.
 
     This function assumes that the image is dark regions of interest on a light background. In order
@@ -19,10 +25,26 @@ def main(imageArray, backgroundThreshold=255, maxFilterSize=5, objectsToUse=(1,)
     object 0 is always the backgournd, so unless you want that in it do not put 0 in objectsToUse
     objects to use is done by size, so 1 means keep the biggest object, 2 the 2nd biggest etc.
 
+    minObjectSize drops any object in objectsToUse with fewer pixels than it (counted after the dilation)
+
+    chunkSize greater than 0 segments the image in chunks of that size (see Preprocessing.chunked_labelling) using
+    numWorkers processes, so that no full size dilated or labeled image is needed. Only the final mask can be
+    visualised when segmenting in chunks.
+
+    profiler records the time and memory used by the max filter and labelling (when not segmenting in chunks)
+
     returns a image mask with True values for the pixels in regions of interest and False values everywhere else
 
     """
 
+    profiler = profiler or Utilities.profiling.Profiler(enabled=False)
+    if chunkSize > 0:
+        mask = chunked_labelling.main(imageArray, backgroundThreshold, maxFilterSize, objectsToUse, chunkSize,
+                                      numWorkers, minObjectSize)
+        if visualise:
+            visualise_mask(imageArray, mask)
+        return mask
+
     # First convert the greyscale image to a binary image by thresholding the image based on pixel value.
     # This will convert the image to white pixels on a black background.
     binaryImageArray = imageArray < backgroundThreshold
@@ -31,26 +53,28 @@ def main(imageArray, backgroundThreshold=255, maxFilterSize=5, objectsToUse=(1,)
     # pixels. This is not needed, but will make the segmenter have an easier time locating large regions of interest.
     # If the regions of interest have few 'holes' in them, then a small max filter can be used. For images where the
     # regions have large 'holes' a larger filter is needed.
-    dilatedImageArray = scipy.ndimage.maximum_filter(binaryImageArray, size=maxFilterSize, mode="constant", cval=0)
+    with profiler.stage("maximum_filter"):
+        dilatedImageArray = scipy.ndimage.maximum_filter(binaryImageArray, size=maxFilterSize, mode="constant", cval=0)
 
     # Label all 'objects' in the image in order to segment it. The labeled image is the same size as the input image,
     # but each pixel belonging to an object is numbered with the numeric value given to that object.
     # Use a full 8 neighbour neighbourhood to determine whether pixels belong to the same object.
-    labeledObjectArray = skimage.measure.label(dilatedImageArray, background=0, connectivity=None)
+    with profiler.stage("label"):
+        labeledObjectArray = skimage.measure.label(dilatedImageArray, background=0, connectivity=None)
 
-    # Next get the actual integers used to label the objects, and the number of pixels in the corresponding object.
-    labels, labelCounts = np.unique(labeledObjectArray, return_counts=True)
+    # Next get the number of pixels in each object. The labels are consecutive integers starting at 0 (the
+    # background), so they can be counted in a single pass without sorting the labeled image.
+    labelCounts = np.bincount(labeledObjectArray.ravel())
 
-    # Determine the ordering of objects in terms of the number of pixels in them. Use descending order.
-    objectsSortedByPixels = labels[labelCounts.argsort()[::-1]]
+    # Create the mask used to select only the regions of interest. The objects to keep are ranked by size and
+    # recorded in a lookup table, so the mask is created in one pass however many objects are kept.
+    keepObject = object_selection.main(labelCounts, objectsToUse, minObjectSize)
+    mask = keepObject[labeledObjectArray]
 
-    # Create the mask used to select only the regions of interest.
-    mask = np.zeros(imageArray.shape, dtype="bool")
-    for i in objectsToUse:
-        mask += labeledObjectArray == objectsSortedByPixels[i]
-
-        if visualise:
-            # Visualise the mask as it develops.
+    if visualise:
+        # Visualise each object being kept.
+        objectsSortedByPixels = labelCounts.argsort()[::-1]
+        for i in objectsToUse:
             fig = plt.figure()
             axes = fig.add_subplot(1, 2, 1)
             axes.set_title("Input Image")
@@ -65,18 +89,31 @@ def main(imageArray, backgroundThreshold=255, maxFilterSize=5, objectsToUse=(1,)
 
     # View the final image containing only the selected regions of interest.
     if visualise:
-        finalImage = imageArray * mask
-        finalImage[finalImage == 0] = 255
-        fig = plt.figure()
-        axes = fig.add_subplot(1, 3, 1)
-        axes.set_title("Input Image")
-        plt.imshow(imageArray, cmap="Greys_r")
-        axes = fig.add_subplot(1, 3, 2)
-        axes.set_title("Final Mask")
-        plt.imshow(mask, cmap='Greys_r')
-        axes = fig.add_subplot(1, 3, 3)
-        axes.set_title("Final Image")
-        plt.imshow(finalImage, cmap='Greys_r')
-        plt.show()
+        visualise_mask(imageArray, mask)
 
     return mask
+
+
+def visualise_mask(imageArray, mask):
+    """Display an image alongside its mask and the image with only the selected regions of interest remaining.
+
+    :param imageArray:  The greyscale image.
+    :type imageArray:   numpy array
+    :param mask:        The mask with True values for the pixels in regions of interest.
+    :type mask:         numpy array
+
+    """
+
+    finalImage = imageArray * mask
+    finalImage[finalImage == 0] = 255
+    fig = plt.figure()
+    axes = fig.add_subplot(1, 3, 1)
+    axes.set_title("Input Image")
+    plt.imshow(imageArray, cmap="Greys_r")
+    axes = fig.add_subplot(1, 3, 2)
+    axes.set_title("Final Mask")
+    plt.imshow(mask, cmap='Greys_r')
+    axes = fig.add_subplot(1, 3, 3)
+    axes.set_title("Final Image")
+    plt.imshow(finalImage, cmap='Greys_r')
+    plt.show()
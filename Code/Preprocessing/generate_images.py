@@ -8,154 +8,555 @@ import os
 from matplotlib import pyplot as plt
 import numpy as np
 import openslide
-import PIL.Image
-import PIL.ImageOps
-import scipy.ndimage
 
 # User imports.
 from . import create_image_mask
+from . import output_manifest
+from . import output_writer
+from . import pyramid_mask
+from . import slide_pool
+from . import slide_tiles
+import Utilities.profiling
 
+# Globals.
+VISUALISATION_TILE_SIZE = 2048  # The size of the tiles used to histogram the desired level image when visualising.
+HISTOGRAM_TILE_SIZE = 2048  # The default size of the tiles used to read the crop when only its histogram is saved.
+
+
+def clean_images(colorImageArray, greyImageArray, mask):
+    """Remove the pixels that are not in regions of interest from a color and greyscale image.
+
+    The images are cleaned in place. The alpha channel of the color image is set to invisible for all background
+    pixels, and background pixels in the greyscale image are set to white.
+
+    :param colorImageArray:     The RGBA image to clean.
+    :type colorImageArray:      numpy array
+    :param greyImageArray:      The greyscale image to clean.
+    :type greyImageArray:       numpy array
+    :param mask:                The mask with True values for the pixels in regions of interest.
+    :type mask:                 numpy array
 
-def main(arguments):
     """
 
-    :param arguments:   The preprocessing arguments in JSON format.
-    :type arguments:    JSON object
+    colorImageArray[:, :, -1] *= mask  # Set alpha to invisible to hide the background.
+    greyImageArray *= mask
+    greyImageArray[greyImageArray == 0] = 255  # Set all pixels that aren't of interest to white.
+
+
+def crop_dimensions(cropCoordinates, levelDimensions):
+    """Determine the dimensions of a crop in one level of a WSI.
+
+    :param cropCoordinates:     The fractional coordinates of the crop (the CropCoordinates crop parameter).
+    :type cropCoordinates:      JSON object
+    :param levelDimensions:     The (width, height) of the level image.
+    :type levelDimensions:      tuple
+    :return :                   The (width, height) of the crop in the level image.
+    :rtype :                    list
 
     """
 
-    # Parse parameters and set up result directories.
+    # Determine the pixel in the level image where the crop should start and end.
+    cropStart = (cropCoordinates["Left"]["X"] * levelDimensions[0], cropCoordinates["Left"]["Y"] * levelDimensions[1])
+    cropEnd = (cropCoordinates["Right"]["X"] * levelDimensions[0], cropCoordinates["Right"]["Y"] * levelDimensions[1])
+
+    # Determine the dimensions of the crop in the level image.
+    cropDimensions = (cropEnd[0] - cropStart[0], cropEnd[1] - cropStart[1])
+    return [int(i) for i in cropDimensions]
+
+
+def write_tiled_crop(slide, cropStart, cropLevel, mask, backgroundThreshold, tileSize, colorOutput, greyOutput,
+                     greyInvertedOutput, maskOutput, outputFormat="png", writer=None):
+    """Clean and save a crop of a WSI one tile at a time.
+
+    Only the tiles covering the bounding box of the regions of interest are read, and each one is cleaned and saved
+    before the next is read. When saving as PNG, each output is a directory containing one image per tile. Each tile
+    is saved as Y<row>_X<column>.png, where the row and column give the offset of the tile's top left pixel from the
+    top left of the bounding box. When saving as NPY, each output is a single memory-mapped array that the tiles are
+    written into, and the mask is saved alongside the images.
+
+    :param slide:                   The WSI to crop.
+    :type slide:                    openslide.OpenSlide
+    :param cropStart:               The (X, Y) location of the top left of the crop in the level 0 image.
+    :type cropStart:                list or tuple
+    :param cropLevel:               The level of the WSI to crop.
+    :type cropLevel:                int
+    :param mask:                    The mask for the crop with True values for the pixels in regions of interest.
+    :type mask:                     numpy array or Preprocessing.pyramid_mask.UpsampledMask
+    :param backgroundThreshold:     The pixel value at which the background starts. Pixels in the mask at or above
+                                        this value in the greyscale tile are removed from the mask.
+    :type backgroundThreshold:      int
+    :param tileSize:                The width and height of the tiles to process the crop in.
+    :type tileSize:                 int
+    :param colorOutput:             The location to save the color crop.
+    :type colorOutput:              str
+    :param greyOutput:              The location to save the greyscale crop.
+    :type greyOutput:               str
+    :param greyInvertedOutput:      The location to save the inverted greyscale crop.
+    :type greyInvertedOutput:       str
+    :param maskOutput:              The location to save the mask (only used when saving as NPY).
+    :type maskOutput:               str
+    :param outputFormat:            The format to save the crop in, either "png" or "npy".
+    :type outputFormat:             str
+    :param writer:                  The writer to save the PNG tiles with. Defaults to saving each tile immediately.
+    :type writer:                   Preprocessing.output_writer.OutputWriter
+
+    """
+
+    writer = writer or output_writer.OutputWriter(0)
+
+    # Determine the bounding box of the regions of interest. Rows and columns outside it contain only background.
+    nonBackgroundRows = np.flatnonzero(mask.any(axis=1))
+    nonBackgroundCols = np.flatnonzero(mask.any(axis=0))
+    if nonBackgroundRows.size == 0:
+        raise ValueError("No regions of interest found in the crop.")
+    boxTop = nonBackgroundRows[0]
+    boxLeft = nonBackgroundCols[0]
+    boxDimensions = (nonBackgroundCols[-1] + 1 - boxLeft, nonBackgroundRows[-1] + 1 - boxTop)
+
+    # Set up the outputs.
+    if outputFormat == "npy":
+        boxShape = (int(boxDimensions[1]), int(boxDimensions[0]))
+        colorCrop = np.lib.format.open_memmap(colorOutput, mode="w+", dtype=np.uint8, shape=boxShape + (4,))
+        greyCrop = np.lib.format.open_memmap(greyOutput, mode="w+", dtype=np.uint8, shape=boxShape)
+        greyInvertedCrop = np.lib.format.open_memmap(greyInvertedOutput, mode="w+", dtype=np.uint8, shape=boxShape)
+        maskCrop = np.lib.format.open_memmap(maskOutput, mode="w+", dtype="bool", shape=boxShape)
+    else:
+        for i in [colorOutput, greyOutput, greyInvertedOutput]:
+            try:
+                os.makedirs(i)
+            except FileExistsError:
+                # Directory already exists.
+                pass
+
+    # Clean and save each tile.
+    for x, y, width, height in slide_tiles.tile_grid(boxDimensions, tileSize):
+        tileColor = slide_tiles.read_tile(slide, cropStart, cropLevel, (boxLeft + x, boxTop + y), (width, height))
+        tileColorArray = np.array(tileColor)
+        tileGreyArray = np.array(tileColor.convert(mode='L'))
+        tileMask = mask[boxTop + y:boxTop + y + height, boxLeft + x:boxLeft + x + width]
+        tileMask = tileMask & (tileGreyArray < backgroundThreshold)
+        clean_images(tileColorArray, tileGreyArray, tileMask)
+
+        if outputFormat == "npy":
+            colorCrop[y:y + height, x:x + width] = tileColorArray
+            greyCrop[y:y + height, x:x + width] = tileGreyArray
+            np.subtract(255, tileGreyArray, out=greyInvertedCrop[y:y + height, x:x + width])
+            maskCrop[y:y + height, x:x + width] = tileMask
+        else:
+            fileTile = "Y{0:d}_X{1:d}.png".format(y, x)
+            writer.save(tileColorArray, "{0:s}/{1:s}".format(colorOutput, fileTile))
+            writer.save(tileGreyArray, "{0:s}/{1:s}".format(greyOutput, fileTile))
+            writer.save(255 - tileGreyArray, "{0:s}/{1:s}".format(greyInvertedOutput, fileTile))
+
+    if outputFormat == "npy":
+        for i in [colorCrop, greyCrop, greyInvertedCrop, maskCrop]:
+            i.flush()
+
+
+def histogram_crop(slide, cropStart, cropLevel, mask, backgroundThreshold, tileSize, greyImageArray=None):
+    """Generate the histogram of the cleaned greyscale crop of a WSI, without creating the cleaned crop.
+
+    The histogram is that of the greyscale image that would be saved as the cleaned crop when the crop is cleaned in
+    memory (with a CropTileSize of 0). This contains the pixel values in the regions of interest (other than those with
+    value 0, which clean_images sets to the background), along with a background pixel (with value 255) for every other
+    pixel in the rows and columns that contain any regions of interest. A tiled crop also keeps the rows and columns
+    of background between the regions of interest, and so can contain more background pixels.
+
+    If the greyscale crop isn't already in memory, only the tiles covering the bounding box of the regions of interest
+    are read, and the masked pixel values of each tile are added to the histogram before the next tile is read.
+
+    :param slide:                   The WSI to crop.
+    :type slide:                    openslide.OpenSlide
+    :param cropStart:               The (X, Y) location of the top left of the crop in the level 0 image.
+    :type cropStart:                list or tuple
+    :param cropLevel:               The level of the WSI to crop.
+    :type cropLevel:                int
+    :param mask:                    The mask for the crop with True values for the pixels in regions of interest.
+    :type mask:                     numpy array or Preprocessing.pyramid_mask.UpsampledMask
+    :param backgroundThreshold:     The pixel value at which the background starts. Pixels in the mask at or above
+                                        this value in the greyscale tile are removed from the mask.
+    :type backgroundThreshold:      int
+    :param tileSize:                The width and height of the tiles to read the crop in.
+    :type tileSize:                 int
+    :param greyImageArray:          The greyscale crop, if it has already been read. The mask must then be an array
+                                        that has already been refined by removing the background pixels.
+    :type greyImageArray:           numpy array
+    :return :                       The number of pixels in the cleaned greyscale crop equal to each of 0..255.
+    :rtype :                        numpy array
+
+    """
+
+    if greyImageArray is not None:
+        rowsOfInterest = mask.any(axis=1)
+        colsOfInterest = mask.any(axis=0)
+        histogram = np.bincount(greyImageArray[mask & (greyImageArray > 0)], minlength=256)
+    else:
+        # Histogram the crop one tile at a time. Rows and columns outside the bounding box contain only background.
+        nonBackgroundRows = np.flatnonzero(mask.any(axis=1))
+        nonBackgroundCols = np.flatnonzero(mask.any(axis=0))
+        if nonBackgroundRows.size == 0:
+            raise ValueError("No regions of interest found in the crop.")
+        boxTop = nonBackgroundRows[0]
+        boxLeft = nonBackgroundCols[0]
+        boxDimensions = (nonBackgroundCols[-1] + 1 - boxLeft, nonBackgroundRows[-1] + 1 - boxTop)
+
+        # The rows and columns of the bounding box that contain regions of interest are determined from the mask once
+        # the background pixels of each tile have been removed from it, as they are for an in memory crop.
+        rowsOfInterest = np.zeros(boxDimensions[1], dtype="bool")
+        colsOfInterest = np.zeros(boxDimensions[0], dtype="bool")
+        histogram = np.zeros(256, dtype=np.int64)
+        for x, y, width, height in slide_tiles.tile_grid(boxDimensions, tileSize):
+            tileColor = slide_tiles.read_tile(slide, cropStart, cropLevel, (boxLeft + x, boxTop + y), (width, height))
+            tileGreyArray = np.asarray(tileColor.convert(mode='L'))
+            tileMask = mask[boxTop + y:boxTop + y + height, boxLeft + x:boxLeft + x + width]
+            tileMask = tileMask & (tileGreyArray < backgroundThreshold)
+            rowsOfInterest[y:y + height] |= tileMask.any(axis=1)
+            colsOfInterest[x:x + width] |= tileMask.any(axis=0)
+            histogram += np.bincount(tileGreyArray[tileMask & (tileGreyArray > 0)], minlength=256)
+    if not rowsOfInterest.any():
+        raise ValueError("No regions of interest found in the crop.")
+
+    # Every pixel of the cleaned crop that isn't in a region of interest (or has value 0) is set to the background.
+    histogram[255] += rowsOfInterest.sum() * colsOfInterest.sum() - histogram.sum()
+    return histogram.astype(np.int64)
+
+
+def process_image(fileName, arguments, allowVisualise=True, previousEntry=None, writer=None, profiler=None):
+    """Generate the thumbnails and cleaned crop of a single WSI.
+
+    Only the outputs that are stale according to the WSI's previous manifest entry are generated. Every output is
+    derived from the single thumbnail or crop read from the WSI, and handed to the writer to be saved. When the writer
+    saves in the background, the outputs may still be being saved when this returns.
+
+    :param fileName:        The name of the WSI file in the raw image directory.
+    :type fileName:         str
+    :param arguments:       The preprocessing arguments in JSON format.
+    :type arguments:        JSON object
+    :param allowVisualise:  Whether the intermediate images should be displayed for WSIs that request it.
+    :type allowVisualise:   bool
+    :param previousEntry:   The manifest entry recorded when the WSI was last processed, or None to generate all
+                                outputs.
+    :type previousEntry:    dict
+    :param writer:          The writer to save the outputs with. Defaults to saving each output immediately.
+    :type writer:           Preprocessing.output_writer.OutputWriter
+    :param profiler:        The profiler to record the time and memory used by each stage with. The stages are
+                                recorded against the name of the WSI. Defaults to no profiling.
+    :type profiler:         Utilities.profiling.Profiler
+    :return :               The manifest entry for the WSI.
+    :rtype :                dict
+
+    """
+
+    writer = writer or output_writer.OutputWriter(0)
+    profiler = profiler or Utilities.profiling.Profiler(enabled=False)
+    profiler.item = fileName
+
+    # Determine the locations of the result directories.
     dirInputImages = arguments["RawImageLocation"]
     dirOutputImages = arguments["CleanedImageLocation"]
     dirColorImages = dirOutputImages + "/Color"
     dirColorThumbnails = dirColorImages + "/Thumbnails"
-    try:
-        os.makedirs(dirColorThumbnails)
-    except FileExistsError:
-        # Directory already exists.
-        pass
     dirColorCrops = dirColorImages + "/CroppedImages"
-    try:
-        os.makedirs(dirColorCrops)
-    except FileExistsError:
-        # Directory already exists.
-        pass
     dirGreyImages = dirOutputImages + "/Greyscale"
     dirGreyThumbnails = dirGreyImages + "/Thumbnails"
-    try:
-        os.makedirs(dirGreyThumbnails)
-    except FileExistsError:
-        # Directory already exists.
-        pass
     dirGreyCrops = dirGreyImages + "/CroppedImages"
-    try:
-        os.makedirs(dirGreyCrops)
-    except FileExistsError:
-        # Directory already exists.
-        pass
     dirGreyInvertedCrops = dirGreyImages + "/InvertedCroppedImages"
-    try:
-        os.makedirs(dirGreyInvertedCrops)
-    except FileExistsError:
-        # Directory already exists.
-        pass
+    dirMasks = dirOutputImages + "/Masks"
+    dirHistograms = dirOutputImages + "/Histograms"
     cropParameters = arguments["CropParameters"]  # The parameters for cropping each image.
     rawCropLevel = arguments["RawCropLevel"]  # The resolution level at which you want to perform the cropping.
+    cropTileSize = arguments.get("CropTileSize", 0)  # The size of the tiles to crop in. 0 means crop in one read.
+    maskChunkSize = arguments.get("MaskChunkSize", 0)  # The size of the chunks to segment in. 0 means no chunking.
+    maskWorkers = arguments.get("MaskWorkers", 1)  # The number of processes to segment the chunks with.
+    maskLevel = arguments.get("MaskLevel", rawCropLevel)  # The resolution level at which to create the mask.
+    if maskLevel < rawCropLevel:
+        raise ValueError("MaskLevel ({0:d}) can't be a higher resolution level than RawCropLevel ({1:d}).".format(
+            maskLevel, rawCropLevel))
+    outputFormat = arguments.get("OutputFormat", "png").lower()  # The format to save the cropped images in.
+    isHistogramOnly = outputFormat == "histogram"  # Whether only the histogram of each cleaned crop is saved.
+
+    # Determine the file being processed, and where to save the processed images.
+    nameOfFile = fileName.split('.')[0].lower()  # Strip off the file extension.
+    fileRawImage = "{0:s}/{1:s}".format(dirInputImages, fileName)  # Location of the raw WSI.
+    fileColorThumbnail = "{0:s}/{1:s}.png".format(dirColorThumbnails, nameOfFile)  # Loc to save the color thumbnail.
+    fileGreyThumbnail = "{0:s}/{1:s}.png".format(dirGreyThumbnails, nameOfFile)  # Loc to save the greyscale thumbnail.
+    fileColorCrop = "{0:s}/{1:s}_crop.{2:s}".format(dirColorCrops, nameOfFile, outputFormat)  # Loc to save color crop.
+    fileGreyCrop = "{0:s}/{1:s}_crop.{2:s}".format(dirGreyCrops, nameOfFile, outputFormat)  # Loc to save grey crop.
+    fileGreyCropInverse = "{0:s}/{1:s}_inverted_crop.{2:s}".format(
+        dirGreyInvertedCrops, nameOfFile, outputFormat)  # Loc to save inverted color greyscale crop.
+    fileMask = "{0:s}/{1:s}_mask.npy".format(dirMasks, nameOfFile)  # Loc to save the mask (NPY output only).
+    fileHistogram = "{0:s}/{1:s}_histogram.npy".format(dirHistograms, nameOfFile)  # Loc to save the crop histogram.
+    cropParams = cropParameters.get(nameOfFile)  # Locations defining the cropped area.
+
+    # Determine which outputs need to be generated, and record the outputs in the manifest entry for the WSI.
+    # Tiled PNG crops are saved as directories of tiles rather than single images.
+    signature = output_manifest.source_signature(fileRawImage)
+    paramsHash = output_manifest.parameters_hash(cropParams, arguments)
+    areThumbnailsStale, areCropsStale = output_manifest.stale_outputs(
+        previousEntry, signature, paramsHash, dirOutputImages)
+    if outputFormat == "png" and cropTileSize > 0:
+        fileColorCrop, fileGreyCrop, fileGreyCropInverse = [
+            os.path.splitext(i)[0] for i in [fileColorCrop, fileGreyCrop, fileGreyCropInverse]]
+    cropOutputs = [fileColorCrop, fileGreyCrop, fileGreyCropInverse] if cropParams is not None else []
+    cropOutputs = cropOutputs + [fileMask] if (cropParams is not None and outputFormat == "npy") else cropOutputs
+    cropOutputs = [fileHistogram] if (cropParams is not None and isHistogramOnly) else cropOutputs
+    manifestEntry = {
+        "Source": signature, "ParametersHash": paramsHash,
+        "Thumbnails": [os.path.relpath(i, dirOutputImages) for i in [fileColorThumbnail, fileGreyThumbnail]],
+        "Crops": [os.path.relpath(i, dirOutputImages) for i in cropOutputs]
+    }
+
+    # Generate a thumbnail of the file. The thumbnail returned by get_thumbnail is RGB.
+    slide = openslide.OpenSlide(fileRawImage)
+    if areThumbnailsStale:
+        with profiler.stage("thumbnail"):
+            thumbnailColor = slide.get_thumbnail((1000, 1000))
+        writer.save(np.asarray(thumbnailColor), fileColorThumbnail)
+        writer.save(np.asarray(thumbnailColor.convert(mode='L')), fileGreyThumbnail)
+
+    if cropParams is not None and areCropsStale:
+        # If the file is an IHC slide, then generate a cropped thumbnail of it. The cropping is based
+        # on visual inspection.
+        fullSlideDimensions = slide.level_dimensions[0]  # Dimensions of the level 0 image.
+
+        # Determine the pixel in the full size level 0 image where the crop should start.
+        fullCropStart = (cropParams["CropCoordinates"]["Left"]["X"] * fullSlideDimensions[0],
+                         cropParams["CropCoordinates"]["Left"]["Y"] * fullSlideDimensions[1])
+        fullCropStart = [int(i) for i in fullCropStart]
+
+        # Determine the dimensions of the crop in the desired level image.
+        cropDimensions = crop_dimensions(cropParams["CropCoordinates"], slide.level_dimensions[rawCropLevel])
+
+        # Read the crop from the (lower resolution) level used to create the mask.
+        if maskLevel > rawCropLevel:
+            maskCropDimensions = crop_dimensions(cropParams["CropCoordinates"], slide.level_dimensions[maskLevel])
+            with profiler.stage("read_mask_crop"):
+                maskGreyImageArray = slide_tiles.read_greyscale(
+                    slide, fullCropStart, maskLevel, maskCropDimensions,
+                    cropTileSize if cropTileSize > 0 else max(maskCropDimensions))
+
+        # Generate the crop.
+        # The starting location of the crop is relative to the level 0 image, while the dimension of the crop
+        # is relative to the desired level image.
+        # The read_region function returns a non-premultiplied image (only in the Python API).
+        if cropTileSize > 0 or isHistogramOnly:
+            # Only build the greyscale crop if it's needed for the mask. The color crop is never held in memory in
+            # full.
+            rawGreyImageArray = None
+            readTileSize = cropTileSize if cropTileSize > 0 else HISTOGRAM_TILE_SIZE
+            if maskLevel <= rawCropLevel:
+                with profiler.stage("read_crop"):
+                    rawGreyImageArray = slide_tiles.read_greyscale(
+                        slide, fullCropStart, rawCropLevel, cropDimensions, readTileSize)
+        else:
+            with profiler.stage("read_crop"):
+                rawCropColor = slide.read_region(fullCropStart, rawCropLevel, cropDimensions)  # Cropped image.
+                rawColorImageArray = np.array(rawCropColor)
+                rawCropGrey = rawCropColor.convert(mode='L')  # Create the greyscale image.
+                rawGreyImageArray = np.array(rawCropGrey)
+
+        # Visualise the crop compared to the original thumbnail.
+        if cropParams["Visualise"] and allowVisualise:
+            fig = plt.figure()
+            axes = fig.add_subplot(1, 3, 1)
+            axes.set_title("Raw Image at Lowest Resolution Level")
+            previewLevel = slide.level_count - 1
+            previewImage = np.array(slide.read_region((0, 0), previewLevel, slide.level_dimensions[previewLevel]))
+            plt.imshow(previewImage, cmap="Greys_r")
+            axes = fig.add_subplot(1, 3, 2)
+            axes.set_title("Cropped Image")
+            plt.imshow(rawGreyImageArray if rawGreyImageArray is not None else maskGreyImageArray, cmap='Greys_r')
+            axes = fig.add_subplot(1, 3, 3)
+            axes.set_title("Pixel Intensities at Desired Level")
+            histogram = slide_tiles.histogram(
+                slide, rawCropLevel, cropTileSize if cropTileSize > 0 else VISUALISATION_TILE_SIZE)
+            plt.plot(np.arange(256), histogram, color="black")
+            plt.show()
+
+        # Create the mask needed to clean up the image. Do this by identifying the regions in the original image
+        # that contain pixels of interest, and creating a boolean mask to apply to the raw images.
+        with profiler.stage("create_mask"):
+            if maskLevel > rawCropLevel:
+                # Segment the low resolution crop, scaling the max filter down to cover the same area of the slide.
+                # The mask is then upsampled to the desired level, and refined at the object edges by removing the
+                # background pixels in the desired level crop.
+                levelScale = slide.level_downsamples[maskLevel] / slide.level_downsamples[rawCropLevel]
+                mask = create_image_mask.main(
+                    maskGreyImageArray, backgroundThreshold=cropParams["BackgroundThreshold"],
+                    maxFilterSize=max(1, int(round(cropParams["MaxFilter"] / levelScale))),
+                    objectsToUse=cropParams["ObjectsToKeep"], visualise=cropParams["Visualise"] and allowVisualise,
+                    chunkSize=maskChunkSize, numWorkers=maskWorkers,
+                    minObjectSize=int(cropParams.get("MinObjectSize", 0) / levelScale ** 2), profiler=profiler)
+                mask = pyramid_mask.UpsampledMask(mask, (cropDimensions[1], cropDimensions[0]))
+                if rawGreyImageArray is not None:
+                    mask = mask[:, :] & (rawGreyImageArray < cropParams["BackgroundThreshold"])
+            else:
+                mask = create_image_mask.main(
+                    rawGreyImageArray, backgroundThreshold=cropParams["BackgroundThreshold"],
+                    maxFilterSize=cropParams["MaxFilter"], objectsToUse=cropParams["ObjectsToKeep"],
+                    visualise=cropParams["Visualise"] and allowVisualise, chunkSize=maskChunkSize,
+                    numWorkers=maskWorkers, minObjectSize=cropParams.get("MinObjectSize", 0), profiler=profiler)
+
+        if outputFormat == "npy" or isHistogramOnly:
+            try:
+                os.makedirs(dirHistograms if isHistogramOnly else dirMasks)
+            except FileExistsError:
+                # Directory already exists.
+                pass
+
+        if isHistogramOnly:
+            # Save the histogram of the cleaned greyscale crop, without creating any cleaned crops.
+            with profiler.stage("histogram_crop"):
+                histogram = histogram_crop(slide, fullCropStart, rawCropLevel, mask, cropParams["BackgroundThreshold"],
+                                           readTileSize, rawGreyImageArray)
+            writer.save(histogram, fileHistogram)
+            return manifestEntry
+
+        if cropTileSize > 0:
+            # Clean and save the crop one tile at a time.
+            with profiler.stage("write_tiled_crop"):
+                write_tiled_crop(slide, fullCropStart, rawCropLevel, mask, cropParams["BackgroundThreshold"],
+                                 cropTileSize, fileColorCrop, fileGreyCrop, fileGreyCropInverse, fileMask, outputFormat,
+                                 writer)
+            return manifestEntry
+
+        with profiler.stage("clean_crop"):
+            # Determine the bounding box of the regions of interest. All rows and columns outside it contain only
+            # background pixels, and so will be removed from the cleaned images.
+            rowsOfInterest = mask.any(axis=1)
+            colsOfInterest = mask.any(axis=0)
+            nonBackgroundRows = np.flatnonzero(rowsOfInterest)
+            nonBackgroundCols = np.flatnonzero(colsOfInterest)
+            if nonBackgroundRows.size == 0:
+                raise ValueError("No regions of interest found in the crop.")
+            boundingBox = (slice(nonBackgroundRows[0], nonBackgroundRows[-1] + 1),
+                           slice(nonBackgroundCols[0], nonBackgroundCols[-1] + 1))
+
+            # Create the cleaned images. Only the bounding box is cleaned, and this is done in place on views of the
+            # crops, so no full size temporary images are needed.
+            rawColorImageArray = rawColorImageArray[boundingBox]
+            rawGreyImageArray = rawGreyImageArray[boundingBox]
+            clean_images(rawColorImageArray, rawGreyImageArray, mask[boundingBox])
+
+            # Remove the rows and columns inside the bounding box that contain only background pixels (e.g. those
+            # between two separate regions of interest). This will shrink the final size of the image.
+            rowsOfInterest = rowsOfInterest[boundingBox[0]]
+            colsOfInterest = colsOfInterest[boundingBox[1]]
+            mask = mask[boundingBox]
+            if not (rowsOfInterest.all() and colsOfInterest.all()):
+                selection = np.ix_(rowsOfInterest, colsOfInterest)
+                rawColorImageArray = rawColorImageArray[selection]
+                rawGreyImageArray = rawGreyImageArray[selection]
+                mask = mask[selection]
+
+        # Save the images. The inverted crop is derived directly from the cleaned greyscale crop. When saving as NPY,
+        # the mask is saved alongside the images.
+        writer.save(rawColorImageArray, fileColorCrop)
+        writer.save(rawGreyImageArray, fileGreyCrop)
+        writer.save(255 - rawGreyImageArray, fileGreyCropInverse)
+        if outputFormat == "npy":
+            writer.save(mask, fileMask)
+
+    return manifestEntry
+
+
+def main(arguments):
+    """
+
+    :param arguments:   The preprocessing arguments in JSON format.
+    :type arguments:    JSON object
+
+    """
+
+    # Parse parameters and set up result directories.
+    dirInputImages = arguments["RawImageLocation"]
+    dirOutputImages = arguments["CleanedImageLocation"]
+    for i in ["/Color/Thumbnails", "/Color/CroppedImages", "/Greyscale/Thumbnails", "/Greyscale/CroppedImages",
+              "/Greyscale/InvertedCroppedImages"]:
+        try:
+            os.makedirs(dirOutputImages + i)
+        except FileExistsError:
+            # Directory already exists.
+            pass
+    numWorkers = arguments.get("Workers", 1)  # The number of processes to preprocess the WSIs with.
+    numWriterThreads = arguments.get("WriterThreads", 2)  # The number of threads to save the outputs with.
+    isIncremental = arguments.get("Incremental", True)  # Whether to skip WSIs whose outputs are up to date.
+    fileProfile = arguments.get("ProfileLocation")  # The file to write the time and memory used by each stage to.
+    profiler = Utilities.profiling.Profiler(enabled=bool(fileProfile))
+
+    # Determine the images that need processing. The manifest records the outputs generated for each WSI the last
+    # time it was processed, so that WSIs whose outputs are all still valid can be skipped.
+    imageFiles = sorted(os.listdir(dirInputImages))
+    manifest = output_manifest.load(dirOutputImages) if isIncremental else {}
+    manifest = {i: manifest[i] for i in manifest if i in imageFiles}  # Forget WSIs that have been removed.
+    imagesToProcess = []
+    for i in imageFiles:
+        staleOutputs = output_manifest.stale_outputs(
+            manifest.get(i), output_manifest.source_signature("{0:s}/{1:s}".format(dirInputImages, i)),
+            output_manifest.parameters_hash(arguments["CropParameters"].get(i.split('.')[0].lower()), arguments),
+            dirOutputImages)
+        if any(staleOutputs):
+            imagesToProcess.append(i)
+    if len(imagesToProcess) < len(imageFiles):
+        print("Skipping {0:d} images whose outputs are up to date.".format(len(imageFiles) - len(imagesToProcess)))
+
+    def record_result(fileName, manifestEntry, profileRecords=()):
+        # Update the manifest as soon as each image is processed, so that an interrupted run loses no work.
+        manifest[fileName] = manifestEntry
+        output_manifest.save(manifest, dirOutputImages)
+        profiler.extend(profileRecords)  # Stages profiled in a worker process.
 
     # Process images.
-    for i in os.listdir(dirInputImages):
-        # Determine the file being processed, and where to save the processed images.
-        nameOfFile = i.split('.')[0].lower()  # Strip off the file extension.
-        fileRawImage = "{0:s}/{1:s}".format(dirInputImages, i)  # Location of the raw WSI.
-        fileColorThumbnail = "{0:s}/{1:s}.png".format(dirColorThumbnails, nameOfFile)  # Loc to save the color thumbnail.
-        fileGreyThumbnail = "{0:s}/{1:s}.png".format(dirGreyThumbnails, nameOfFile)  # Loc to save the greyscale thumbnail.
-
-        # Display status message.
-        print("Now processing image {0:s}".format(nameOfFile))
-
-        # Generate a thumbnail of the file. The thumbnail returned by get_thumbnail is RGB.
-        slide = openslide.OpenSlide(fileRawImage)
-        thumbnailColor = slide.get_thumbnail((1000, 1000))
-        thumbnailColor.save(fileColorThumbnail)
-        thumbnailGrey = thumbnailColor.convert(mode='L')
-        thumbnailGrey.save(fileGreyThumbnail)
-
-        if nameOfFile in cropParameters:
-            # If the file is an IHC slide, then generate a cropped thumbnail of it. The cropping is based
-            # on visual inspection.
-            fileColorCrop = "{0:s}/{1:s}_crop.png".format(dirColorCrops, nameOfFile)  # Loc to save color crop.
-            fileGreyCrop = "{0:s}/{1:s}_crop.png".format(dirGreyCrops, nameOfFile)  # Loc to save greyscale crop.
-            fileGreyCropInverse = "{0:s}/{1:s}_inverted_crop.png".format(
-                dirGreyInvertedCrops, nameOfFile)  # Loc to save inverted color greyscale crop.
-            cropParams = cropParameters[nameOfFile]  # Locations defining the cropped area.
-            fullSlideDimensions = slide.level_dimensions[0]  # Dimensions of the level 0 image.
-            desiredSlideDimensions = slide.level_dimensions[rawCropLevel]  # Dimensions of the desired level image.
-
-            # Determine the pixel in the full size level 0 image where the crop should start.
-            fullCropStart = (cropParams["CropCoordinates"]["Left"]["X"] * fullSlideDimensions[0],
-                             cropParams["CropCoordinates"]["Left"]["Y"] * fullSlideDimensions[1])
-            fullCropStart = [int(i) for i in fullCropStart]
-
-            # Determine the pixel in the desired level image where the crop should start and end.
-            desiredCropStart = (cropParams["CropCoordinates"]["Left"]["X"] * desiredSlideDimensions[0],
-                                cropParams["CropCoordinates"]["Left"]["Y"] * desiredSlideDimensions[1])
-            desiredCropEnd = (cropParams["CropCoordinates"]["Right"]["X"] * desiredSlideDimensions[0],
-                              cropParams["CropCoordinates"]["Right"]["Y"] * desiredSlideDimensions[1])
-
-            # Determine the dimensions of the crop in the desired level image.
-            cropDimensions = (desiredCropEnd[0] - desiredCropStart[0], desiredCropEnd[1] - desiredCropStart[1])
-            cropDimensions = [int(i) for i in cropDimensions]
-
-            # Generate the crop.
-            # The starting location of the crop is relative to the level 0 image, while the dimension of the crop
-            # is relative to the desired level image.
-            # The read_region function returns a non-premultiplied image (only in the Python API).
-            rawCropColor = slide.read_region(fullCropStart, rawCropLevel, cropDimensions)  # Cropped image.
-            rawColorImageArray = np.array(rawCropColor)
-            rawCropGrey = rawCropColor.convert(mode='L')  # Create the greyscale image.
-            rawGreyImageArray = np.array(rawCropGrey)
-
-            # Visualise the crop compared to the original thumbnail.
-            if cropParams["Visualise"]:
-                fig = plt.figure()
-                axes = fig.add_subplot(1, 3, 1)
-                axes.set_title("Raw Image at Desired Level")
-                desiredLevelImage = slide.read_region((0, 0), rawCropLevel, slide.level_dimensions[rawCropLevel])
-                desiredLevelImage = np.array(desiredLevelImage)
-                plt.imshow(desiredLevelImage, cmap="Greys_r")
-                axes = fig.add_subplot(1, 3, 2)
-                axes.set_title("Cropped Image")
-                plt.imshow(rawGreyImageArray, cmap='Greys_r')
-                axes = fig.add_subplot(1, 3, 3)
-                axes.set_title("Pixel Intensities")
-                histogram = scipy.ndimage.histogram(desiredLevelImage, 0, 255, 256)
-                plt.plot(np.arange(256), histogram, color="black")
-                plt.show()
-
-            # Create the mask needed to clean up the image. Do this by identifying the regions in the original image
-            # that contain pixels of interest, and creating a boolean mask to apply to the raw images.
-            mask = create_image_mask.main(
-                rawGreyImageArray, backgroundThreshold=cropParams["BackgroundThreshold"],
-                maxFilterSize=cropParams["MaxFilter"], objectsToUse=cropParams["ObjectsToKeep"],
-                visualise=cropParams["Visualise"])
-
-            # Create the cleaned images.
-            rawColorImageArray[:, :, -1] *= mask  # Set alpha to invisible to hide the background.
-            rawGreyImageArray *= mask
-            rawGreyImageArray[rawGreyImageArray == 0] = 255  # Set all pixels that aren't of interest to white.
-
-            # Process the cleaned images to remove all rows and columns containing only background pixels.
-            # This will shrink the final size of the image.
-            backgroundRows = np.all(mask == False, axis=1)
-            backgroundCols = np.all(mask == False, axis=0)
-            rawColorImageArray = rawColorImageArray[~backgroundRows, :][:, ~backgroundCols]
-            rawGreyImageArray = rawGreyImageArray[~backgroundRows, :][:, ~backgroundCols]
-
-            # Save the images.
-            cleanCropColor = PIL.Image.fromarray(rawColorImageArray)
-            cleanCropColor.save(fileColorCrop)
-            cleanCropGrey = PIL.Image.fromarray(rawGreyImageArray)
-            cleanCropGrey = cleanCropGrey.convert(mode='L')
-            cleanCropGrey.save(fileGreyCrop)
-            cleanCropGreyInverse = PIL.ImageOps.invert(cleanCropGrey)
-            cleanCropGreyInverse.save(fileGreyCropInverse)
+    if numWorkers > 1:
+        # Process the images in a pool of worker processes. Visualisation is not possible from the workers.
+        if any(i.get("Visualise", False) for i in arguments["CropParameters"].values()):
+            print("Visualisation is disabled when preprocessing with multiple workers.")
+        failures = slide_pool.main(imagesToProcess, arguments, numWorkers, manifest, record_result)
+    else:
+        failures = []
+        writer = output_writer.OutputWriter(numWriterThreads, profiler=profiler)
+
+        def finish_image(fileName, manifestEntry, pendingWrites):
+            # Only record an image once all of its outputs have been saved.
+            try:
+                output_writer.wait(pendingWrites)
+            except Exception as err:
+                print("Failed to save the outputs of image {0:s}: {1:s}".format(fileName, str(err)))
+                failures.append((fileName, str(err)))
+                return
+            record_result(fileName, manifestEntry)
+
+        # The outputs of each image are saved while the next image is being processed.
+        previousImage = None
+        for ind, i in enumerate(imagesToProcess):
+            # Display status message.
+            print("[{0:d}/{1:d}] Now processing image {2:s}".format(ind + 1, len(imagesToProcess), i))
+
+            # Process the image. A failure to process one image should not stop the remaining images being processed.
+            try:
+                with profiler.stage("process_image", i):
+                    manifestEntry = process_image(
+                        i, arguments, previousEntry=manifest.get(i), writer=writer, profiler=profiler)
+            except Exception as err:
+                print("Failed to process image {0:s}: {1:s}".format(i, str(err)))
+                failures.append((i, str(err)))
+                manifestEntry = None
+            pendingWrites = writer.take_pending()
+
+            # Record the previous image now that this image has been read and cleaned.
+            if previousImage is not None:
+                finish_image(*previousImage)
+            previousImage = (i, manifestEntry, pendingWrites) if manifestEntry is not None else None
+        if previousImage is not None:
+            finish_image(*previousImage)
+        writer.shutdown()
+
+    # Summarise any failures.
+    if failures:
+        print("Failed to process {0:d} of {1:d} images:".format(len(failures), len(imagesToProcess)))
+        for i, j in failures:
+            print("\t{0:s}: {1:s}".format(i, j))
+
+    # Write out the time and memory used by each stage.
+    if fileProfile:
+        profiler.write(fileProfile)
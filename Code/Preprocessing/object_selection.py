@@ -0,0 +1,33 @@
+"""Function to select the objects in a segmented image to keep."""
+
+# 3rd party imports.
+import numpy as np
+
+
+def main(objectCounts, objectsToUse=(1,), minObjectSize=0):
+    """Determine which objects in a segmented image should be kept, based on their size.
+
+    Objects are ranked in descending order of the number of pixels in them, with the background (object 0) ranked
+    along with the other objects. The result is a lookup table, so that the mask of the kept objects can be created
+    from a labeled image in one pass with lookupTable[labeledImage].
+
+    :param objectCounts:    The number of pixels in each object, indexed by the label of the object.
+    :type objectCounts:     numpy array
+    :param objectsToUse:    The ranks of the objects to keep, so 1 means keep the biggest object, 2 the 2nd biggest etc.
+    :type objectsToUse:     list or tuple
+    :param minObjectSize:   The minimum number of pixels an object must contain in order to be kept.
+    :type minObjectSize:    int
+    :return :               Whether each object (indexed by its label) should be kept.
+    :rtype :                numpy array
+
+    """
+
+    # Determine the ordering of objects in terms of the number of pixels in them. Use descending order.
+    objectsSortedByPixels = objectCounts.argsort()[::-1]
+
+    # Create the lookup table.
+    keepObject = np.zeros(objectCounts.size, dtype="bool")
+    keepObject[objectsSortedByPixels[list(objectsToUse)]] = True
+    if minObjectSize > 0:
+        keepObject &= objectCounts >= minObjectSize
+    return keepObject
@@ -0,0 +1,120 @@
+"""Code to record the outputs of the preprocessing, so that reruns only redo changed or missing work."""
+
+# Python imports.
+import hashlib
+import json
+import os
+
+# Globals.
+MANIFEST_FILE = "Manifest.json"  # The name of the manifest file in the cleaned image directory.
+# Global parameters that change the cropped images, along with their default values. The default of MaskLevel is
+# RawCropLevel (represented by None).
+CROP_SETTINGS = {"RawCropLevel": None, "MaskLevel": None, "CropTileSize": 0, "OutputFormat": "png"}
+
+
+def load(dirOutputImages):
+    """Load the manifest from a cleaned image directory.
+
+    :param dirOutputImages: The cleaned image directory.
+    :type dirOutputImages:  str
+    :return :               The manifest entry for each WSI, keyed by the WSI file name. This is empty if there is no
+                                manifest.
+    :rtype :                dict
+
+    """
+
+    fileManifest = "{0:s}/{1:s}".format(dirOutputImages, MANIFEST_FILE)
+    if not os.path.isfile(fileManifest):
+        return {}
+    with open(fileManifest, 'r') as fidManifest:
+        return json.load(fidManifest)
+
+
+def save(manifest, dirOutputImages):
+    """Save the manifest to a cleaned image directory.
+
+    The manifest is written to a temporary file that then replaces the existing manifest, so that a run that is
+    interrupted while saving can't leave a corrupt manifest behind.
+
+    :param manifest:        The manifest entry for each WSI, keyed by the WSI file name.
+    :type manifest:         dict
+    :param dirOutputImages: The cleaned image directory.
+    :type dirOutputImages:  str
+
+    """
+
+    fileManifest = "{0:s}/{1:s}".format(dirOutputImages, MANIFEST_FILE)
+    with open(fileManifest + ".tmp", 'w') as fidManifest:
+        json.dump(manifest, fidManifest, indent=2, sort_keys=True)
+    os.replace(fileManifest + ".tmp", fileManifest)
+
+
+def source_signature(fileRawImage):
+    """Determine the signature of a WSI that is used to tell whether it has changed.
+
+    :param fileRawImage:    The location of the WSI.
+    :type fileRawImage:     str
+    :return :               The size (in bytes) and modification time of the WSI.
+    :rtype :                dict
+
+    """
+
+    fileStats = os.stat(fileRawImage)
+    return {"Size": fileStats.st_size, "MTime": fileStats.st_mtime}
+
+
+def parameters_hash(cropParams, arguments):
+    """Hash the parameters that determine the cropped images of a WSI.
+
+    :param cropParams:  The crop parameters of the WSI, or None if the WSI isn't being cropped.
+    :type cropParams:   JSON object
+    :param arguments:   The preprocessing arguments in JSON format.
+    :type arguments:    JSON object
+    :return :           The hash of the parameters, or None if the WSI isn't being cropped.
+    :rtype :            str
+
+    """
+
+    if cropParams is None:
+        return None
+
+    # Visualisation has no effect on the cropped images, so changing it shouldn't cause the WSI to be reprocessed.
+    parameters = {i: cropParams[i] for i in cropParams if i != "Visualise"}
+
+    # Hash the values of the global settings that are actually used, so that setting one explicitly to its default
+    # value doesn't cause the WSI to be reprocessed. Settings at their default value are left out of the hash, so that
+    # the hashes recorded before a setting was introduced stay valid.
+    cropSettings = {i: arguments.get(i, CROP_SETTINGS[i]) for i in CROP_SETTINGS}
+    cropSettings["OutputFormat"] = str(cropSettings["OutputFormat"]).lower()
+    if cropSettings["MaskLevel"] == cropSettings["RawCropLevel"]:
+        cropSettings["MaskLevel"] = None
+    parameters.update({i: cropSettings[i] for i in CROP_SETTINGS
+                       if i == "RawCropLevel" or cropSettings[i] != CROP_SETTINGS[i]})
+    return hashlib.sha1(json.dumps(parameters, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def stale_outputs(entry, signature, paramsHash, dirOutputImages):
+    """Determine which outputs of a WSI need to be regenerated.
+
+    The thumbnails need regenerating when the WSI has changed or any thumbnail is missing. The cropped images need
+    regenerating when the WSI or its crop parameters have changed or any cropped image is missing.
+
+    :param entry:           The manifest entry for the WSI, or None if the WSI has no entry.
+    :type entry:            dict
+    :param signature:       The current signature of the WSI.
+    :type signature:        dict
+    :param paramsHash:      The hash of the current crop parameters for the WSI.
+    :type paramsHash:       str
+    :param dirOutputImages: The cleaned image directory.
+    :type dirOutputImages:  str
+    :return :               Whether the thumbnails are stale, and whether the cropped images are stale.
+    :rtype :                bool, bool
+
+    """
+
+    if entry is None or entry["Source"] != signature:
+        return True, True
+    areThumbnailsStale = not all(os.path.exists("{0:s}/{1:s}".format(dirOutputImages, i)) for i in entry["Thumbnails"])
+    areCropsStale = entry["ParametersHash"] != paramsHash or \
+        not all(os.path.exists("{0:s}/{1:s}".format(dirOutputImages, i)) for i in entry["Crops"])
+    return areThumbnailsStale, areCropsStale
@@ -0,0 +1,118 @@
+"""Code to save the preprocessing outputs in the background while the next WSI is being read."""
+
+# Python imports.
+import concurrent.futures
+import threading
+
+# 3rd party imports.
+import numpy as np
+import PIL.Image
+
+# User imports.
+import Utilities.profiling
+
+
+def _save_image(imageArray, fileName):
+    """Encode and save an image.
+
+    :param imageArray:  The image to save.
+    :type imageArray:   numpy array
+    :param fileName:    The location to save the image. Images are saved as NPY arrays if this ends with .npy, and
+                            otherwise in the format given by the extension.
+    :type fileName:     str
+
+    """
+
+    if fileName.endswith(".npy"):
+        np.save(fileName, imageArray)
+    else:
+        PIL.Image.fromarray(imageArray).save(fileName)
+
+
+def wait(pendingWrites):
+    """Wait for a set of writes to finish.
+
+    :param pendingWrites:   The writes to wait for.
+    :type pendingWrites:    list of concurrent.futures.Future
+    :raises :               The first exception raised by any of the writes, once they have all finished.
+
+    """
+
+    concurrent.futures.wait(pendingWrites)
+    for i in pendingWrites:
+        i.result()
+
+
+class OutputWriter(object):
+    """A pool of threads that encode and save images in the background.
+
+    Encoding (e.g. PNG compression) releases the GIL, so the images can be saved while the main thread carries on
+    reading and cleaning the next WSI. The number of images waiting to be saved is bounded, so that a slow disk can't
+    cause an unbounded number of images to be held in memory. Saving blocks until there is room for another image.
+
+    The images passed to the writer must not be modified until they have been saved.
+
+    """
+
+    def __init__(self, numThreads=2, maxPending=None, profiler=None):
+        """Initialise the writer.
+
+        :param numThreads:  The number of threads to save the images with. With 0 threads each image is saved before
+                                save returns.
+        :type numThreads:   int
+        :param maxPending:  The maximum number of images that can be waiting to be saved. Defaults to four per thread.
+        :type maxPending:   int
+        :param profiler:    The profiler to record the time and memory used to save each image with.
+        :type profiler:     Utilities.profiling.Profiler
+
+        """
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=numThreads) if numThreads > 0 else None
+        self.slots = threading.BoundedSemaphore(maxPending or 4 * max(numThreads, 1))
+        self.pendingWrites = []
+        self.profiler = profiler or Utilities.profiling.Profiler(enabled=False)
+
+    def _save_profiled(self, imageArray, fileName, item):
+        """Save an image, recording the time and memory used against the item it was saved for."""
+
+        with self.profiler.stage("save", item, threadCPUTime=self.executor is not None):
+            _save_image(imageArray, fileName)
+
+    def save(self, imageArray, fileName):
+        """Save an image in the background.
+
+        :param imageArray:  The image to save.
+        :type imageArray:   numpy array
+        :param fileName:    The location to save the image.
+        :type fileName:     str
+
+        """
+
+        if self.executor is None:
+            self._save_profiled(imageArray, fileName, self.profiler.item)
+            return
+        self.slots.acquire()
+        future = self.executor.submit(self._save_profiled, imageArray, fileName, self.profiler.item)
+        future.add_done_callback(lambda _: self.slots.release())
+        self.pendingWrites.append(future)
+
+    def take_pending(self):
+        """Take the writes that have been started since this was last called.
+
+        This is used to group the writes by the WSI they were made for, so that a WSI is only recorded as processed
+        once all of its outputs have been saved.
+
+        :return :   The writes started since this was last called.
+        :rtype :    list of concurrent.futures.Future
+
+        """
+
+        pendingWrites = self.pendingWrites
+        self.pendingWrites = []
+        return pendingWrites
+
+    def shutdown(self):
+        """Wait for all writes to finish and stop the threads."""
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
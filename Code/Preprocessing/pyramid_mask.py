@@ -0,0 +1,62 @@
+"""Code to use a mask created at a low resolution level of a WSI at a higher resolution level."""
+
+# 3rd party imports.
+import numpy as np
+import scipy.ndimage
+
+
+class UpsampledMask(object):
+    """A mask created at a coarse level of a WSI, upsampled on demand to a finer level.
+
+    The full size fine level mask is never created unless it's asked for. Instead, the windows of the fine level mask
+    that are needed (e.g. one tile at a time) are created by nearest neighbour upsampling of the coarse mask.
+
+    The coarse mask is grown by one coarse pixel before being upsampled, so that the fine level pixels at the edges
+    of the objects are included. The upsampled mask therefore over-selects at object edges, and should be refined by
+    removing the fine level background pixels (i.e. combining it with the thresholded fine level image).
+
+    Windows are selected by indexing with a pair of slices with unit steps, e.g. mask[top:bottom, left:right].
+
+    """
+
+    def __init__(self, coarseMask, fineShape):
+        """Initialise the upsampled mask.
+
+        :param coarseMask:  The mask created from the coarse level image.
+        :type coarseMask:   numpy array
+        :param fineShape:   The (rows, columns) shape of the fine level image.
+        :type fineShape:    tuple
+
+        """
+
+        self.shape = tuple(fineShape)
+        self.coarseMask = scipy.ndimage.binary_dilation(coarseMask, structure=np.ones((3, 3), dtype="bool"))
+
+        # Determine the coarse row and column that each fine row and column lies in.
+        self.coarseRows = np.arange(self.shape[0]) * coarseMask.shape[0] // self.shape[0]
+        self.coarseCols = np.arange(self.shape[1]) * coarseMask.shape[1] // self.shape[1]
+
+    def __getitem__(self, window):
+        """Create a window of the fine level mask.
+
+        :param window:  The (row slice, column slice) defining the window.
+        :type window:   tuple of slices
+        :return :       The window of the upsampled mask.
+        :rtype :        numpy array
+
+        """
+
+        rowSlice, colSlice = window
+        return self.coarseMask[np.ix_(self.coarseRows[rowSlice], self.coarseCols[colSlice])]
+
+    def any(self, axis):
+        """Determine the fine level rows or columns that contain any pixels in regions of interest.
+
+        :param axis:    1 to test each row, 0 to test each column.
+        :type axis:     int
+        :return :       Whether each row or column contains any pixels in regions of interest.
+        :rtype :        numpy array
+
+        """
+
+        return self.coarseMask.any(axis=axis)[self.coarseRows if axis == 1 else self.coarseCols]
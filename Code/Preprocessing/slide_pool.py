@@ -0,0 +1,149 @@
+"""Code to preprocess WSIs in parallel using a pool of worker processes."""
+
+# Python imports.
+import concurrent.futures
+import os
+
+
+def _initialise_worker(dirOpenSlideBin):
+    """Import OpenSlide in a newly started worker process.
+
+    OpenSlide loads its DLLs relative to the working directory (see Preprocessing/__main__.py), so it must be imported
+    from within its bin directory. Worker processes that are spawned rather than forked start without OpenSlide
+    imported, so it needs to be imported here before any WSIs are processed.
+
+    :param dirOpenSlideBin:     The OpenSlide bin directory.
+    :type dirOpenSlideBin:      str
+
+    """
+
+    currentDir = os.getcwd()
+    os.chdir(dirOpenSlideBin)
+    import openslide
+    os.chdir(currentDir)
+
+
+def _process_image(fileName, arguments, previousEntry):
+    """Process a single WSI in a worker process.
+
+    :param fileName:        The name of the WSI file in the raw image directory.
+    :type fileName:         str
+    :param arguments:       The preprocessing arguments in JSON format.
+    :type arguments:        JSON object
+    :param previousEntry:   The manifest entry recorded when the WSI was last processed.
+    :type previousEntry:    dict
+    :return :               The manifest entry for the WSI, and the stages profiled while processing it (empty if
+                                profiling is disabled).
+    :rtype :                dict, list
+
+    """
+
+    # Import here rather than at the top of the file so that OpenSlide has already been imported by the initialiser.
+    from . import generate_images
+    from . import output_writer
+    import Utilities.profiling
+
+    # The outputs are saved in parallel, and must all be saved before the WSI is reported as processed.
+    profiler = Utilities.profiling.Profiler(enabled=bool(arguments.get("ProfileLocation")))
+    writer = output_writer.OutputWriter(arguments.get("WriterThreads", 2), profiler=profiler)
+    try:
+        with profiler.stage("process_image", fileName):
+            manifestEntry = generate_images.process_image(
+                fileName, arguments, allowVisualise=False, previousEntry=previousEntry, writer=writer,
+                profiler=profiler)
+        output_writer.wait(writer.take_pending())
+    finally:
+        writer.shutdown()
+    return manifestEntry, profiler.records
+
+
+def _run_pool(imageFiles, arguments, numWorkers, manifest, recordResult, numProcessed, numImages):
+    """Process a set of WSIs in a single pool of worker processes.
+
+    :param imageFiles:      The names of the WSI files in the raw image directory to process.
+    :type imageFiles:       list
+    :param arguments:       The preprocessing arguments in JSON format.
+    :type arguments:        JSON object
+    :param numWorkers:      The number of worker processes to use.
+    :type numWorkers:       int
+    :param manifest:        The manifest entry recorded for each WSI when it was last processed.
+    :type manifest:         dict
+    :param recordResult:    The function called with the file name, new manifest entry and profiled stages of each
+                                processed WSI.
+    :type recordResult:     function
+    :param numProcessed:    The number of WSIs that have already been processed (used for progress messages).
+    :type numProcessed:     int
+    :param numImages:       The total number of WSIs being processed (used for progress messages).
+    :type numImages:        int
+    :return :               The (file name, error message) pairs for the WSIs that failed to be processed, and the
+                                names of the WSIs whose worker process terminated abruptly.
+    :rtype :                list, list
+
+    """
+
+    failures = []
+    brokenFiles = []
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=numWorkers, initializer=_initialise_worker,
+            initargs=(arguments["OpenSlideBinLocation"],)) as executor:
+        futureToFile = {executor.submit(_process_image, i, arguments, manifest.get(i)): i for i in imageFiles}
+        for future in concurrent.futures.as_completed(futureToFile):
+            fileName = futureToFile[future]
+            try:
+                recordResult(fileName, *future.result())
+            except concurrent.futures.process.BrokenProcessPool:
+                # A worker died (e.g. a crash in the OpenSlide C library). This takes down every image that was
+                # still waiting to be processed, so these can't be recorded as failures yet.
+                brokenFiles.append(fileName)
+                continue
+            except Exception as err:
+                failures.append((fileName, str(err)))
+                numProcessed += 1
+                print("[{0:d}/{1:d}] Failed to process image {2:s}: {3:s}".format(
+                    numProcessed, numImages, fileName, str(err)))
+                continue
+            numProcessed += 1
+            print("[{0:d}/{1:d}] Finished processing image {2:s}".format(numProcessed, numImages, fileName))
+
+    return failures, brokenFiles
+
+
+def main(imageFiles, arguments, numWorkers, manifest, recordResult):
+    """Generate the thumbnails and cleaned crops of a set of WSIs in parallel.
+
+    Each WSI is processed in its own task, and each task opens its own handle to the WSI. An exception while
+    processing one WSI is recorded as a failure for that WSI and does not stop the others from being processed.
+    If a worker process dies outright, the WSIs that were affected are retried one at a time in their own process,
+    so that a single WSI that crashes OpenSlide can't take down the rest of the batch.
+
+    :param imageFiles:      The names of the WSI files in the raw image directory to process.
+    :type imageFiles:       list
+    :param arguments:       The preprocessing arguments in JSON format.
+    :type arguments:        JSON object
+    :param numWorkers:      The number of worker processes to use.
+    :type numWorkers:       int
+    :param manifest:        The manifest entry recorded for each WSI when it was last processed.
+    :type manifest:         dict
+    :param recordResult:    The function called with the file name, new manifest entry and profiled stages of each
+                                processed WSI.
+    :type recordResult:     function
+    :return :               The (file name, error message) pairs for the WSIs that failed to be processed.
+    :rtype :                list
+
+    """
+
+    numImages = len(imageFiles)
+    failures, brokenFiles = _run_pool(imageFiles, arguments, numWorkers, manifest, recordResult, 0, numImages)
+
+    # Retry the images caught up in a worker dying, isolating each one in its own process.
+    numProcessed = numImages - len(brokenFiles)
+    for i in sorted(brokenFiles):
+        retryFailures, retryBrokenFiles = _run_pool([i], arguments, 1, manifest, recordResult, numProcessed, numImages)
+        failures.extend(retryFailures)
+        if retryBrokenFiles:
+            failures.append((i, "worker process terminated abruptly"))
+            print("[{0:d}/{1:d}] Failed to process image {2:s}: worker process terminated abruptly".format(
+                numProcessed + 1, numImages, i))
+        numProcessed += 1
+
+    return failures
@@ -0,0 +1,110 @@
+"""Code to read a region of a WSI one tile at a time."""
+
+# 3rd party imports.
+import numpy as np
+
+
+def tile_grid(regionDimensions, tileSize):
+    """Generate the tiles that cover a region of an image.
+
+    Tiles are generated in row major order. The tiles on the right and bottom edges of the region are truncated
+    so that no tile extends beyond the region.
+
+    :param regionDimensions:    The (width, height) of the region to tile.
+    :type regionDimensions:     list or tuple
+    :param tileSize:            The width and height of each (untruncated) tile.
+    :type tileSize:             int
+    :return :                   The (X offset, Y offset, width, height) of each tile relative to the top left of the
+                                    region.
+    :rtype :                    generator of tuples
+
+    """
+
+    regionWidth, regionHeight = regionDimensions
+    for y in range(0, regionHeight, tileSize):
+        for x in range(0, regionWidth, tileSize):
+            yield x, y, min(tileSize, regionWidth - x), min(tileSize, regionHeight - y)
+
+
+def read_tile(slide, regionStart, level, tileOffset, tileDimensions):
+    """Read one tile of a region of a WSI.
+
+    :param slide:           The WSI to read from.
+    :type slide:            openslide.OpenSlide
+    :param regionStart:     The (X, Y) location of the top left of the region in the level 0 image.
+    :type regionStart:      list or tuple
+    :param level:           The level of the WSI to read the tile from.
+    :type level:            int
+    :param tileOffset:      The (X, Y) offset of the tile from the top left of the region in the desired level image.
+    :type tileOffset:       list or tuple
+    :param tileDimensions:  The (width, height) of the tile in the desired level image.
+    :type tileDimensions:   list or tuple
+    :return :               The RGBA tile.
+    :rtype :                PIL.Image
+
+    """
+
+    # The location passed to read_region is relative to the level 0 image, so the offset of the tile within the
+    # desired level image needs to be scaled up.
+    downsample = slide.level_downsamples[level]
+    tileStart = (regionStart[0] + int(tileOffset[0] * downsample), regionStart[1] + int(tileOffset[1] * downsample))
+    return slide.read_region(tileStart, level, tileDimensions)
+
+
+def read_greyscale(slide, regionStart, level, regionDimensions, tileSize):
+    """Read a region of a WSI as a greyscale image, one tile at a time.
+
+    Only a single RGBA tile is held in memory at once, so the peak memory needed is the size of the 8 bit greyscale
+    region plus that of one tile.
+
+    :param slide:               The WSI to read from.
+    :type slide:                openslide.OpenSlide
+    :param regionStart:         The (X, Y) location of the top left of the region in the level 0 image.
+    :type regionStart:          list or tuple
+    :param level:               The level of the WSI to read the region from.
+    :type level:                int
+    :param regionDimensions:    The (width, height) of the region in the desired level image.
+    :type regionDimensions:     list or tuple
+    :param tileSize:            The width and height of the tiles to read the region in.
+    :type tileSize:             int
+    :return :                   The greyscale region.
+    :rtype :                    numpy array
+
+    """
+
+    greyImageArray = np.empty((regionDimensions[1], regionDimensions[0]), dtype=np.uint8)
+    for x, y, width, height in tile_grid(regionDimensions, tileSize):
+        tile = read_tile(slide, regionStart, level, (x, y), (width, height))
+        greyImageArray[y:y + height, x:x + width] = np.asarray(tile.convert(mode='L'))
+    return greyImageArray
+
+
+def histogram(slide, level, tileSize, regionStart=(0, 0), regionDimensions=None):
+    """Generate a histogram of the pixel values in a region of a WSI, one tile at a time.
+
+    The histogram covers the values in all four RGBA channels, with one bin per value. Only a single tile is held in
+    memory at once.
+
+    :param slide:               The WSI to read from.
+    :type slide:                openslide.OpenSlide
+    :param level:               The level of the WSI to generate the histogram for.
+    :type level:                int
+    :param tileSize:            The width and height of the tiles to read the region in.
+    :type tileSize:             int
+    :param regionStart:         The (X, Y) location of the top left of the region in the level 0 image.
+    :type regionStart:          list or tuple
+    :param regionDimensions:    The (width, height) of the region in the desired level image. Defaults to the whole
+                                    level image.
+    :type regionDimensions:     list or tuple
+    :return :                   The number of pixel values equal to each of 0..255.
+    :rtype :                    numpy array
+
+    """
+
+    if regionDimensions is None:
+        regionDimensions = slide.level_dimensions[level]
+    histogramCounts = np.zeros(256, dtype=np.int64)
+    for x, y, width, height in tile_grid(regionDimensions, tileSize):
+        tile = read_tile(slide, regionStart, level, (x, y), (width, height))
+        histogramCounts += np.bincount(np.asarray(tile).ravel(), minlength=256)
+    return histogramCounts
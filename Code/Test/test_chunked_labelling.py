@@ -0,0 +1,48 @@
+"""Test the chunked segmentation of images.
+
+To run this unittest run the command "python -m unittest Test.test_chunked_labelling" from the Code directory.
+
+"""
+
+# Python imports.
+import unittest
+
+# 3rd party imports.
+import numpy as np
+
+# User imports.
+import Preprocessing.chunked_labelling
+import Preprocessing.create_image_mask
+
+
+class EquivalenceTest(unittest.TestCase):
+    """Test whether segmenting in chunks gives the same mask as segmenting the whole image."""
+
+    def test_squares(self):
+        # Create an image of dark squares of distinct sizes on a light background. The distinct sizes mean that there
+        # are no ties when ranking the objects, and so the masks should be identical.
+        imageArray = np.full((300, 400), 240, dtype=np.uint8)
+        for ind, (i, j) in enumerate([(10, 10), (50, 150), (120, 30), (200, 250), (90, 330), (250, 60)]):
+            imageArray[i:i + 20 + 5 * ind, j:j + 15 + 7 * ind] = 100
+        imageArray[::7, ::11] = 50  # Add isolated dark pixels that the max filter joins up.
+
+        for maxFilterSize in [1, 3, 4, 9]:
+            for objectsToUse in [(1,), (1, 2, 3), (0, 2, 4)]:
+                expectedMask = Preprocessing.create_image_mask.main(
+                    imageArray, backgroundThreshold=220, maxFilterSize=maxFilterSize, objectsToUse=objectsToUse)
+                for chunkSize in [29, 128, 1000]:
+                    mask = Preprocessing.chunked_labelling.main(
+                        imageArray, backgroundThreshold=220, maxFilterSize=maxFilterSize, objectsToUse=objectsToUse,
+                        chunkSize=chunkSize)
+                    self.assertTrue(np.array_equal(expectedMask, mask))
+
+    def test_diagonal_join(self):
+        # Create an object that only connects across the corner shared by four chunks.
+        imageArray = np.full((64, 64), 240, dtype=np.uint8)
+        imageArray[np.arange(64), np.arange(64)] = 0
+        imageArray[np.arange(64), 63 - np.arange(64)] = 0
+        imageArray[5, 40] = 0  # A single pixel object.
+        expectedMask = Preprocessing.create_image_mask.main(imageArray, backgroundThreshold=220, maxFilterSize=1)
+        mask = Preprocessing.chunked_labelling.main(imageArray, backgroundThreshold=220, maxFilterSize=1, chunkSize=16)
+        self.assertTrue(np.array_equal(expectedMask, mask))
+        self.assertFalse(mask[5, 40])
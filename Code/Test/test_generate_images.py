@@ -0,0 +1,122 @@
+"""Test the cleaning, saving and histogramming of the crops of WSIs.
+
+To run this unittest run the command "python -m unittest Test.test_generate_images" from the Code directory.
+
+"""
+
+# Python imports.
+import shutil
+import tempfile
+import unittest
+
+# 3rd party imports.
+import numpy as np
+try:
+    import openslide
+    import Preprocessing.generate_images
+except ImportError:
+    # OpenSlide isn't available, so the preprocessing can't be tested.
+    openslide = None
+
+# User imports.
+import Benchmark.synthetic_data
+import HistogramPrediction.image_histogram
+
+
+def clean_crop(greyImageArray, mask):
+    """Clean a greyscale crop in memory in the same way as Preprocessing.generate_images.process_image."""
+
+    colorImageArray = np.zeros(greyImageArray.shape + (4,), dtype=np.uint8)
+    greyImageArray = greyImageArray.copy()
+    Preprocessing.generate_images.clean_images(colorImageArray, greyImageArray, mask)
+    return greyImageArray[np.ix_(mask.any(axis=1), mask.any(axis=0))]
+
+
+@unittest.skipIf(openslide is None, "OpenSlide is not installed")
+class HistogramCropTest(unittest.TestCase):
+    """Test whether the histogram of a crop matches the histogram of the cleaned crop that would be saved."""
+
+    def test_in_memory(self):
+        # Pixels with value 0 in the regions of interest are turned into background by the cleaning.
+        greyImageArray = np.random.RandomState(0).randint(0, 256, (40, 50)).astype(np.uint8)
+        greyImageArray[5:10, 5:10] = 0
+        mask = np.zeros((40, 50), dtype="bool")
+        mask[3:12, 4:20] = True
+        mask[30:35, 40:45] = True
+        mask &= greyImageArray < 220
+        histogram = Preprocessing.generate_images.histogram_crop(None, (0, 0), 0, mask, 220, 16, greyImageArray)
+        np.testing.assert_array_equal(histogram, np.bincount(clean_crop(greyImageArray, mask).ravel(), minlength=256))
+
+    @unittest.skipIf(Benchmark.synthetic_data.tifffile is None, "tifffile is not installed")
+    def test_tiled(self):
+        # Histogramming a slide a tile at a time, with a mask that hasn't had the background removed, gives the same
+        # histogram as the crop cleaned in memory with the refined mask.
+        dirTest = tempfile.mkdtemp()
+        try:
+            Benchmark.synthetic_data.create_slide(dirTest + "/1_Her2.tif", 300, 260, seed=2)
+            slide = openslide.OpenSlide(dirTest + "/1_Her2.tif")
+            greyImageArray = np.asarray(slide.read_region((0, 0), 0, (260, 300)).convert(mode='L'))
+            mask = np.zeros((300, 260), dtype="bool")
+            mask[20:280, 10:250] = True
+            histogram = Preprocessing.generate_images.histogram_crop(slide, (0, 0), 0, mask, 220, 64)
+            slide.close()
+        finally:
+            shutil.rmtree(dirTest)
+        refinedMask = mask & (greyImageArray < 220)
+        self.assertLess(refinedMask.any(axis=1).sum(), mask.any(axis=1).sum())
+        np.testing.assert_array_equal(histogram, np.bincount(clean_crop(greyImageArray, refinedMask).ravel(),
+                                                             minlength=256))
+
+
+@unittest.skipIf(openslide is None, "OpenSlide is not installed")
+@unittest.skipIf(Benchmark.synthetic_data.tifffile is None, "tifffile is not installed")
+class TiledCropTest(unittest.TestCase):
+    """Test whether a crop saved as NPY arrays matches the same crop saved as PNG tiles."""
+
+    def setUp(self):
+        self.dirTest = tempfile.mkdtemp()
+        Benchmark.synthetic_data.create_slide(self.dirTest + "/1_Her2.tif", 300, 260, seed=3)
+        self.slide = openslide.OpenSlide(self.dirTest + "/1_Her2.tif")
+
+    def tearDown(self):
+        self.slide.close()
+        shutil.rmtree(self.dirTest)
+
+    def test_npy(self):
+        greyImageArray = np.asarray(self.slide.read_region((0, 0), 0, (260, 300)).convert(mode='L'))
+        mask = np.zeros((300, 260), dtype="bool")
+        mask[20:250, 15:200] = True
+        outputs = {}
+        for outputFormat in ["npy", "png"]:
+            outputs[outputFormat] = ["{0:s}/{1:s}_crop.{2:s}".format(self.dirTest, i, outputFormat)
+                                     for i in ["Color", "Grey", "GreyInverted"]]
+            Preprocessing.generate_images.write_tiled_crop(
+                self.slide, (0, 0), 0, mask, 220, 64, *outputs[outputFormat],
+                maskOutput="{0:s}/1_her2_mask.npy".format(self.dirTest), outputFormat=outputFormat)
+
+        # The tiled crop keeps the whole bounding box of the mask, with the background pixels removed from the mask that
+        # is saved alongside it.
+        boundingBox = (slice(20, 250), slice(15, 200))
+        refinedMask = mask[boundingBox] & (greyImageArray[boundingBox] < 220)
+        cleanedImageArray = greyImageArray[boundingBox].copy()
+        Preprocessing.generate_images.clean_images(np.zeros(refinedMask.shape + (4,), dtype=np.uint8),
+                                                   cleanedImageArray, refinedMask)
+        greyCrop = np.load(outputs["npy"][1], mmap_mode='r')
+        np.testing.assert_array_equal(greyCrop, cleanedImageArray)
+        np.testing.assert_array_equal(np.load("{0:s}/1_her2_mask.npy".format(self.dirTest)), refinedMask)
+        np.testing.assert_array_equal(np.load(outputs["npy"][2]), 255 - greyCrop)
+
+        # The histogram of the memory-mapped crop is the same as that of the crop saved as PNG tiles.
+        np.testing.assert_array_equal(HistogramPrediction.image_histogram.main(outputs["npy"][1]),
+                                      HistogramPrediction.image_histogram.main(outputs["png"][1]))
+
+
+@unittest.skipIf(openslide is None, "OpenSlide is not installed")
+class ParametersTest(unittest.TestCase):
+    """Test whether invalid preprocessing parameters are rejected."""
+
+    def test_mask_level(self):
+        arguments = {"RawImageLocation": "Raw", "CleanedImageLocation": "Cleaned", "CropParameters": {},
+                     "RawCropLevel": 2, "MaskLevel": 1}
+        with self.assertRaises(ValueError):
+            Preprocessing.generate_images.process_image("1_Her2.svs", arguments)
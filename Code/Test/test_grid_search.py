@@ -0,0 +1,81 @@
+"""Test the cross validated grid search.
+
+To run this unittest run the command "python -m unittest Test.test_grid_search" from the Code directory.
+
+"""
+
+# Python imports.
+import unittest
+
+# 3rd party imports.
+import numpy as np
+from sklearn.linear_model import ElasticNet
+
+# User imports.
+import HistogramPrediction.grid_search
+
+
+class GridSearchTest(unittest.TestCase):
+    """Test whether the grid search scores every combination of parameters and fold correctly."""
+
+    def setUp(self):
+        randomState = np.random.RandomState(0)
+        self.dataMatrix = randomState.rand(30, 5)
+        self.targetVector = self.dataMatrix.dot(np.arange(5)) + randomState.normal(0, 0.1, 30)
+        self.partition = np.arange(30) % 3
+        self.paramList = [{"alpha": 0.001, "l1_ratio": 0.5}, {"alpha": 0.1, "l1_ratio": 0.5}]
+
+    def test_serial(self):
+        results = HistogramPrediction.grid_search.main(self.dataMatrix, self.targetVector, self.partition, 3,
+                                                       ElasticNet, self.paramList)
+        self.assertEqual([(i["alpha"], i["Fold"]) for i in results],
+                         [(0.001, 0), (0.001, 1), (0.001, 2), (0.1, 0), (0.1, 1), (0.1, 2)])
+
+        # Check one of the scores against a model trained directly.
+        model = ElasticNet(alpha=0.1, l1_ratio=0.5).fit(self.dataMatrix[self.partition != 1],
+                                                        self.targetVector[self.partition != 1])
+        error = self.targetVector[self.partition == 1] - model.predict(self.dataMatrix[self.partition == 1])
+        self.assertAlmostEqual(results[4]["MSE"], np.mean(error ** 2))
+
+    def test_parallel(self):
+        serialResults = HistogramPrediction.grid_search.main(self.dataMatrix, self.targetVector, self.partition, 3,
+                                                             ElasticNet, self.paramList)
+        parallelResults = HistogramPrediction.grid_search.main(self.dataMatrix, self.targetVector, self.partition, 3,
+                                                               ElasticNet, self.paramList, numWorkers=2)
+        self.assertEqual(serialResults, parallelResults)
+
+    def test_path(self):
+        paramList = [{"alpha": i, "l1_ratio": j} for j in [0.2, 0.8] for i in [0.0001, 0.01, 0.1]]
+        results = HistogramPrediction.grid_search.main(self.dataMatrix, self.targetVector, self.partition, 3,
+                                                       ElasticNet, paramList)
+        pathResults = HistogramPrediction.grid_search.main(self.dataMatrix, self.targetVector, self.partition, 3,
+                                                           ElasticNet, paramList, usePath=True)
+        self.assertEqual([(i["alpha"], i["l1_ratio"], i["Fold"]) for i in results],
+                         [(i["alpha"], i["l1_ratio"], i["Fold"]) for i in pathResults])
+        for i, j in zip(results, pathResults):
+            self.assertAlmostEqual(i["MSE"], j["MSE"], places=3)
+
+    def test_path_parameters(self):
+        # Parameters that the path function doesn't take are handled (fit_intercept) or rule out path mode.
+        paramList = [{"alpha": i, "l1_ratio": 0.5, "fit_intercept": False} for i in [0.0001, 0.01, 0.1]]
+        results = HistogramPrediction.grid_search.main(self.dataMatrix, self.targetVector, self.partition, 3,
+                                                       ElasticNet, paramList)
+        pathResults = HistogramPrediction.grid_search.main(self.dataMatrix, self.targetVector, self.partition, 3,
+                                                           ElasticNet, paramList, usePath=True)
+        for i, j in zip(results, pathResults):
+            self.assertAlmostEqual(i["MSE"], j["MSE"], places=3)
+        self.assertTrue(HistogramPrediction.grid_search.supports_path(
+            {"alpha": [0.1], "l1_ratio": [0.5], "fit_intercept": [False], "max_iter": [500]}))
+        self.assertFalse(HistogramPrediction.grid_search.supports_path({"alpha": [0.1], "warm_start": [True]}))
+        self.assertFalse(HistogramPrediction.grid_search.supports_path({"l1_ratio": [0.5]}))
+
+    def test_augmentation(self):
+        # Augmented examples are trained on in every fold except the one their original example is tested in.
+        augmentedSources = np.array([0, 1, 2, 2])
+        augmentation = (self.dataMatrix[augmentedSources] + 0.01, self.targetVector[augmentedSources],
+                        self.partition[augmentedSources])
+        folds = HistogramPrediction.grid_search.slice_folds(self.dataMatrix, self.targetVector, self.partition, 3,
+                                                            augmentation)
+        self.assertEqual([i[0].shape[0] for i in folds], [23, 23, 22])
+        self.assertEqual([i[2].shape[0] for i in folds], [10, 10, 10])
+        np.testing.assert_array_equal(folds[0][0][-3:], augmentation[0][1:])
@@ -0,0 +1,44 @@
+"""Test the loading of the ground truth values.
+
+To run this unittest run the command "python -m unittest Test.test_ground_truth" from the Code directory.
+
+"""
+
+# Python imports.
+import os
+import tempfile
+import unittest
+
+# User imports.
+import HistogramPrediction.ground_truth
+
+
+class LookupTest(unittest.TestCase):
+    """Test whether the ground truth values are matched to the correct cases."""
+
+    def setUp(self):
+        fidGroundTruth, self.fileGroundTruth = tempfile.mkstemp(suffix=".tsv")
+        with os.fdopen(fidGroundTruth, 'w') as fidGroundTruth:
+            fidGroundTruth.write("CaseNo\tHeR2 SCORE\tPERCENTAGE CELLS WITH COMPLETE MEMBRANE STAINING\n")
+            fidGroundTruth.write("7\t3\t90.0\n")
+            fidGroundTruth.write("2\t0\t0.0\n")
+            fidGroundTruth.write("15\t2\t45.5\n")
+
+    def tearDown(self):
+        os.remove(self.fileGroundTruth)
+
+    def test_lookup(self):
+        caseGroundTruth = HistogramPrediction.ground_truth.main(self.fileGroundTruth, [15, 2, 7, 15])
+        self.assertEqual(caseGroundTruth["CaseID"].tolist(), [15, 2, 7, 15])
+        self.assertEqual(caseGroundTruth["Her2Score"].tolist(), [2, 0, 3, 2])
+        self.assertEqual(caseGroundTruth["StainingPercent"].tolist(), [45.5, 0.0, 90.0, 45.5])
+
+    def test_missing(self):
+        with self.assertRaisesRegex(ValueError, "missing.*: 1, 20"):
+            HistogramPrediction.ground_truth.main(self.fileGroundTruth, [20, 2, 1])
+
+    def test_duplicate(self):
+        with open(self.fileGroundTruth, 'a') as fidGroundTruth:
+            fidGroundTruth.write("2\t1\t10.0\n")
+        with self.assertRaisesRegex(ValueError, "Duplicate.*: 2"):
+            HistogramPrediction.ground_truth.main(self.fileGroundTruth, [2])
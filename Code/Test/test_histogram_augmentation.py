@@ -0,0 +1,73 @@
+"""Test the augmentation of the training images in histogram space.
+
+To run this unittest run the command "python -m unittest Test.test_histogram_augmentation" from the Code directory.
+
+"""
+
+# Python imports.
+import os
+import shutil
+import tempfile
+import unittest
+
+# 3rd party imports.
+import numpy as np
+from PIL import Image
+
+# User imports.
+import HistogramPrediction.histogram_augmentation
+import Utilities.image_permutation
+
+
+class AugmentationTest(unittest.TestCase):
+    """Test whether the histograms of transformed images match those of the rendered transformed images."""
+
+    def setUp(self):
+        self.imageArray = np.random.RandomState(0).randint(0, 220, (60, 80)).astype(np.uint8)
+        self.parameters = {"scale": (0.8, 1.1), "rotation": 17, "shear": (4, -3), "translation": (0, 0),
+                           "inversion": (True, False)}
+        renderedImage = Utilities.image_permutation.transform(self.imageArray, order=1, **self.parameters)
+        self.renderedHistogram = np.bincount(np.round(renderedImage).astype(np.intp).ravel(), minlength=256)
+
+    def test_every_pixel(self):
+        # With more samples than pixels every pixel is used, and the flip doesn't change the histogram.
+        histogram = HistogramPrediction.histogram_augmentation.augment_histogram(
+            self.imageArray, self.parameters, 10 ** 6, np.random.RandomState(0))
+        np.testing.assert_array_equal(histogram, self.renderedHistogram)
+
+    def test_sampled(self):
+        histogram = HistogramPrediction.histogram_augmentation.augment_histogram(
+            self.imageArray, self.parameters, 2000, np.random.RandomState(0))
+        self.assertAlmostEqual(histogram.sum(), self.renderedHistogram.sum())
+        sampledFractions = histogram[:220].sum() / histogram.sum()
+        renderedFractions = self.renderedHistogram[:220].sum() / self.renderedHistogram.sum()
+        self.assertAlmostEqual(sampledFractions, renderedFractions, delta=0.05)
+
+
+class LoadPixelsTest(unittest.TestCase):
+    """Test whether only greyscale images are loaded to be augmented."""
+
+    def setUp(self):
+        self.dirTest = tempfile.mkdtemp()
+        self.imageArray = np.random.RandomState(1).randint(0, 256, (20, 30)).astype(np.uint8)
+
+    def tearDown(self):
+        shutil.rmtree(self.dirTest)
+
+    def test_greyscale(self):
+        Image.fromarray(self.imageArray).save(self.dirTest + "/1_crop.png")
+        np.save(self.dirTest + "/2_crop.npy", self.imageArray)
+        for i in ["1_crop.png", "2_crop.npy"]:
+            np.testing.assert_array_equal(
+                HistogramPrediction.histogram_augmentation.load_pixels("{0:s}/{1:s}".format(self.dirTest, i)),
+                self.imageArray, i)
+
+    def test_rejected(self):
+        # Color images, saved histograms and directories of tiles can't be augmented.
+        Image.fromarray(np.dstack([self.imageArray] * 3)).save(self.dirTest + "/1_crop.png")
+        Image.fromarray(self.imageArray).convert("P").save(self.dirTest + "/2_crop.png")
+        np.save(self.dirTest + "/3_histogram.npy", np.bincount(self.imageArray.ravel(), minlength=256))
+        os.makedirs(self.dirTest + "/4_crop")
+        for i in ["1_crop.png", "2_crop.png", "3_histogram.npy", "4_crop"]:
+            with self.assertRaises(ValueError, msg=i):
+                HistogramPrediction.histogram_augmentation.load_pixels("{0:s}/{1:s}".format(self.dirTest, i))
@@ -0,0 +1,67 @@
+"""Test the caching of image histograms.
+
+To run this unittest run the command "python -m unittest Test.test_histogram_cache" from the Code directory.
+
+"""
+
+# Python imports.
+import os
+import shutil
+import tempfile
+import unittest
+
+# 3rd party imports.
+import numpy as np
+
+# User imports.
+import HistogramPrediction.histogram_cache
+
+
+class CacheTest(unittest.TestCase):
+    """Test whether cached histograms are reused, refreshed and evicted correctly."""
+
+    def setUp(self):
+        self.dirTest = tempfile.mkdtemp()
+        self.dirCache = self.dirTest + "/Cache"
+        self.filePaths = []
+        for i in range(3):
+            filePath = "{0:s}/{1:d}_crop.npy".format(self.dirTest, i)
+            np.save(filePath, np.full((10, 10), i * 50, dtype=np.uint8))
+            self.filePaths.append(filePath)
+
+    def tearDown(self):
+        shutil.rmtree(self.dirTest)
+
+    def test_reuse(self):
+        histograms = HistogramPrediction.histogram_cache.main(self.filePaths, self.dirCache)
+        self.assertEqual(histograms[:, [0, 50, 100]].tolist(), [[100, 0, 0], [0, 100, 0], [0, 0, 100]])
+
+        # Rewriting an image with the same contents keeps its cached histogram, while changing it doesn't.
+        np.save(self.filePaths[0], np.zeros((10, 10), dtype=np.uint8))
+        os.utime(self.filePaths[0], (0, 0))
+        np.save(self.filePaths[1], np.full((5, 10), 200, dtype=np.uint8))
+        histograms = HistogramPrediction.histogram_cache.main(self.filePaths, self.dirCache)
+        self.assertEqual(histograms[:, [0, 50, 100, 200]].tolist(),
+                         [[100, 0, 0, 0], [0, 0, 0, 50], [0, 0, 100, 0]])
+
+    def test_eviction(self):
+        HistogramPrediction.histogram_cache.main(self.filePaths, self.dirCache)
+        os.remove(self.filePaths[2])
+        HistogramPrediction.histogram_cache.main(self.filePaths[:2], self.dirCache)
+        index = HistogramPrediction.histogram_cache.load_index(self.dirCache)
+        self.assertEqual(sorted(index), sorted(os.path.abspath(i) for i in self.filePaths[:2]))
+
+    def test_append(self):
+        HistogramPrediction.histogram_cache.main(self.filePaths[:2], self.dirCache)
+        fileStore = "{0:s}/{1:s}".format(self.dirCache, HistogramPrediction.histogram_cache.STORE_FILE)
+        with open(fileStore, 'rb') as fidStore:
+            storedRows = fidStore.read()
+
+        # Adding an image appends its histogram without rewriting the existing rows.
+        histograms = HistogramPrediction.histogram_cache.main(self.filePaths, self.dirCache)
+        self.assertIsInstance(histograms, np.memmap)
+        self.assertEqual(histograms[:, [0, 50, 100]].tolist(), [[100, 0, 0], [0, 100, 0], [0, 0, 100]])
+        with open(fileStore, 'rb') as fidStore:
+            self.assertEqual(fidStore.read(len(storedRows)), storedRows)
+        index = HistogramPrediction.histogram_cache.load_index(self.dirCache)
+        self.assertEqual(sorted(i[:2] for i in index.values()), [(0, 0), (1, 1), (2, 2)])
@@ -0,0 +1,58 @@
+"""Test the histogramming of cleaned images.
+
+To run this unittest run the command "python -m unittest Test.test_image_histogram" from the Code directory.
+
+"""
+
+# Python imports.
+import os
+import shutil
+import tempfile
+import unittest
+
+# 3rd party imports.
+import numpy as np
+from PIL import Image
+
+# User imports.
+import HistogramPrediction.image_histogram
+
+
+class HistogramTest(unittest.TestCase):
+    """Test whether images saved in each format are histogrammed the same, both serially and in parallel."""
+
+    def setUp(self):
+        self.dirTest = tempfile.mkdtemp()
+        randomState = np.random.RandomState(0)
+        self.imageArrays = [randomState.randint(0, 256, (30 + i, 20), dtype=np.uint8) for i in range(3)]
+
+        # Save the first image as a PNG, the second as a NPY array and the third as a directory of tiles.
+        self.filePaths = ["{0:s}/0_crop.png".format(self.dirTest), "{0:s}/1_crop.npy".format(self.dirTest),
+                          "{0:s}/2_crop".format(self.dirTest)]
+        Image.fromarray(self.imageArrays[0]).save(self.filePaths[0])
+        np.save(self.filePaths[1], self.imageArrays[1])
+        os.makedirs(self.filePaths[2])
+        Image.fromarray(self.imageArrays[2][:16]).save("{0:s}/0_0.png".format(self.filePaths[2]))
+        Image.fromarray(self.imageArrays[2][16:]).save("{0:s}/16_0.png".format(self.filePaths[2]))
+
+    def tearDown(self):
+        shutil.rmtree(self.dirTest)
+
+    def test_formats(self):
+        for filePath, imageArray in zip(self.filePaths, self.imageArrays):
+            np.testing.assert_array_equal(HistogramPrediction.image_histogram.main(filePath),
+                                          np.bincount(imageArray.ravel(), minlength=256), filePath)
+
+    def test_parallel(self):
+        serialHistograms = HistogramPrediction.image_histogram.histogram_images(self.filePaths, numWorkers=1)
+        parallelHistograms = HistogramPrediction.image_histogram.histogram_images(self.filePaths, numWorkers=2)
+        np.testing.assert_array_equal(parallelHistograms, serialHistograms)
+        self.assertEqual(serialHistograms.sum(axis=1).tolist(), [i.size for i in self.imageArrays])
+
+    def test_palette(self):
+        # The histogram of a palette image is that of its colors, not of the indices into its palette.
+        filePath = "{0:s}/3_crop.png".format(self.dirTest)
+        paletteImage = Image.fromarray(self.imageArrays[0]).convert("RGB").quantize(8)
+        paletteImage.save(filePath)
+        np.testing.assert_array_equal(HistogramPrediction.image_histogram.main(filePath),
+                                      np.bincount(np.asarray(paletteImage.convert("RGB")).ravel(), minlength=256))
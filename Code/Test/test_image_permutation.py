@@ -28,3 +28,70 @@ class CompletionTest(unittest.TestCase):
                 scaleUpProb=runParams["ScaleUpProb"],jointScale=runParams["JointScale"],
                 inversionProb=runParams["InversionProb"])
 
+
+class TransformTest(unittest.TestCase):
+    """Test whether the composed affine transformation matches the individual transformations."""
+
+    def setUp(self):
+        self.imageArray = np.random.RandomState(0).randint(0, 255, (31, 40)).astype(np.uint8)
+
+    def test_identity(self):
+        image = Utilities.image_permutation.transform(self.imageArray)
+        np.testing.assert_allclose(image, self.imageArray, atol=1e-8)
+
+    def test_inversion_and_rotation(self):
+        image = Utilities.image_permutation.transform(self.imageArray, inversion=(True, True))
+        np.testing.assert_allclose(image, self.imageArray[::-1, ::-1], atol=1e-8)
+        image = Utilities.image_permutation.transform(self.imageArray, rotation=-90)
+        np.testing.assert_allclose(image, np.rot90(self.imageArray, -1), atol=1e-8)
+
+    def test_output_size(self):
+        # The output holds the whole transformed image, so a rotation or shear grows the image rather than clipping it.
+        self.assertEqual(Utilities.image_permutation.transform(self.imageArray, rotation=90).shape, (40, 31))
+        self.assertEqual(Utilities.image_permutation.transform(self.imageArray, shear=(0, 45)).shape, (71, 40))
+        self.assertEqual(Utilities.image_permutation.transform(self.imageArray, scale=(0.5, 0.5)).shape, (16, 20))
+        self.assertEqual(Utilities.image_permutation.transform(self.imageArray, scale=(2, 1)).shape, (31, 40))
+
+    def test_translation(self):
+        image = Utilities.image_permutation.transform(self.imageArray, translation=(3, 2), backgroundColor=255)
+        np.testing.assert_allclose(image[2:, 3:], self.imageArray[:-2, :-3], atol=1e-8)
+        self.assertTrue((image[:2] == 255).all() and (image[:, :3] == 255).all())
+
+
+class GeneratorTest(unittest.TestCase):
+    """Test whether the generated permutations are reproducible and returned with their transformations."""
+
+    def setUp(self):
+        self.imageArray = np.random.RandomState(0).randint(0, 255, (31, 40)).astype(np.uint8)
+        self.permutationRanges = {"maxRotation": 20, "maxShear": (5,), "maxTranslation": (3,), "maxScale": (1.5,),
+                                  "inversionProb": (0.5,)}
+
+    def test_seeded(self):
+        permutations = list(Utilities.image_permutation.generate(self.imageArray, 4, seed=1, **self.permutationRanges))
+        repeatPermutations = list(Utilities.image_permutation.generate(self.imageArray, 4, seed=1,
+                                                                       **self.permutationRanges))
+        self.assertEqual(len(permutations), 4)
+        for (image, parameters), (repeatImage, repeatParameters) in zip(permutations, repeatPermutations):
+            self.assertEqual(parameters, repeatParameters)
+            np.testing.assert_array_equal(image, repeatImage)
+            np.testing.assert_array_equal(image, Utilities.image_permutation.transform(self.imageArray, **parameters))
+
+    def test_parallel(self):
+        serialPermutations = Utilities.image_permutation.generate(self.imageArray, 4, seed=1, **self.permutationRanges)
+        parallelPermutations = Utilities.image_permutation.generate(self.imageArray, 4, seed=1, numWorkers=2,
+                                                                    **self.permutationRanges)
+        for (image, parameters), (parallelImage, parallelParameters) in zip(serialPermutations, parallelPermutations):
+            self.assertEqual(parameters, parallelParameters)
+            np.testing.assert_array_equal(image, parallelImage)
+
+    def test_close_early(self):
+        # Closing a parallel generator early returns straight away, without the rest of the permutations.
+        serialPermutations = Utilities.image_permutation.generate(self.imageArray, 2, seed=1, **self.permutationRanges)
+        parallelPermutations = Utilities.image_permutation.generate(self.imageArray, 500, seed=1, numWorkers=2,
+                                                                    **self.permutationRanges)
+        for (image, parameters), (parallelImage, parallelParameters) in zip(serialPermutations, parallelPermutations):
+            self.assertEqual(parameters, parallelParameters)
+            np.testing.assert_array_equal(image, parallelImage)
+        parallelPermutations.close()
+        with self.assertRaises(StopIteration):
+            next(parallelPermutations)
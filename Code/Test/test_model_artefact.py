@@ -0,0 +1,72 @@
+"""Test the saving and loading of trained model artefacts.
+
+To run this unittest run the command "python -m unittest Test.test_model_artefact" from the Code directory.
+
+"""
+
+# Python imports.
+import os
+import pickle
+import tempfile
+import unittest
+
+# 3rd party imports.
+import numpy as np
+from sklearn.linear_model import ElasticNet
+
+# User imports.
+import HistogramPrediction.model_artefact
+
+
+class ArtefactTest(unittest.TestCase):
+    """Test whether a saved model artefact scores images in the same way as the model it was saved from."""
+
+    def setUp(self):
+        fidArtefact, self.fileArtefact = tempfile.mkstemp(suffix=".pkl")
+        os.close(fidArtefact)
+
+    def tearDown(self):
+        os.remove(self.fileArtefact)
+
+    def test_round_trip(self):
+        randomState = np.random.RandomState(0)
+        histograms = randomState.randint(0, 100, (20, 256))
+        backgroundMask = np.arange(256) < 220
+        features = HistogramPrediction.model_artefact.create_features(histograms, backgroundMask)
+        self.assertEqual(features.shape, (20, 220))
+        np.testing.assert_allclose(features.sum(axis=1), 1)
+
+        model = ElasticNet(alpha=0.001).fit(features, randomState.rand(20))
+        HistogramPrediction.model_artefact.save(self.fileArtefact, model, backgroundMask, {"TargetHer2": True})
+        artefact = HistogramPrediction.model_artefact.load(self.fileArtefact)
+        self.assertEqual(artefact["FeatureSettings"], {"TargetHer2": True})
+        np.testing.assert_array_equal(artefact["BackgroundMask"], backgroundMask)
+        np.testing.assert_array_equal(artefact["Model"].predict(features), model.predict(features))
+
+    def test_version(self):
+        with open(self.fileArtefact, 'wb') as fidArtefact:
+            pickle.dump({"Version": 0}, fidArtefact)
+        with self.assertRaises(ValueError):
+            HistogramPrediction.model_artefact.load(self.fileArtefact)
+
+    def test_binning(self):
+        histograms = np.arange(512).reshape(2, 256)
+        backgroundMask = np.arange(256) < 10
+        binStarts = HistogramPrediction.model_artefact.bin_starts(10, binWidth=4)
+        features = HistogramPrediction.model_artefact.create_features(histograms, backgroundMask, binStarts,
+                                                                      np.float32)
+        self.assertEqual(features.dtype, np.float32)
+        np.testing.assert_allclose(features, [[6 / 45, 22 / 45, 17 / 45], [1030 / 2605, 1046 / 2605, 529 / 2605]],
+                                   rtol=1e-6)
+
+    def test_bin_count(self):
+        # A bin count that doesn't divide the number of pixel values gives exactly that many features.
+        histograms = np.random.RandomState(0).randint(0, 100, (5, 256))
+        backgroundMask = np.arange(256) < 220
+        binStarts = HistogramPrediction.model_artefact.bin_starts(220, binWidth=4, binCount=100)
+        features = HistogramPrediction.model_artefact.create_features(histograms, backgroundMask, binStarts)
+        self.assertEqual(features.shape[1], 100)
+        self.assertEqual(set(np.diff(np.append(binStarts, 220))), {2, 3})
+        np.testing.assert_allclose(features.sum(axis=1), 1)
+        with self.assertRaises(ValueError):
+            HistogramPrediction.model_artefact.bin_starts(220, binCount=221)
@@ -0,0 +1,34 @@
+"""Test the selection of objects to keep in a segmented image.
+
+To run this unittest run the command "python -m unittest Test.test_object_selection" from the Code directory.
+
+"""
+
+# Python imports.
+import unittest
+
+# 3rd party imports.
+import numpy as np
+
+# User imports.
+import Preprocessing.object_selection
+
+
+class SelectionTest(unittest.TestCase):
+    """Test whether the correct objects are selected."""
+
+    def test_ranking(self):
+        objectCounts = np.array([1000, 5, 50, 20, 300])
+        self.assertEqual(Preprocessing.object_selection.main(objectCounts, (1,)).tolist(),
+                         [False, False, False, False, True])
+        self.assertEqual(Preprocessing.object_selection.main(objectCounts, (0, 2)).tolist(),
+                         [True, False, True, False, False])
+        self.assertEqual(Preprocessing.object_selection.main(objectCounts, (1, 2, 3, 4)).tolist(),
+                         [False, True, True, True, True])
+
+    def test_min_size(self):
+        objectCounts = np.array([1000, 5, 50, 20, 300])
+        self.assertEqual(Preprocessing.object_selection.main(objectCounts, (1, 2, 3, 4), minObjectSize=20).tolist(),
+                         [False, False, True, True, True])
+        self.assertEqual(Preprocessing.object_selection.main(objectCounts, (1, 2), minObjectSize=301).tolist(),
+                         [False, False, False, False, False])
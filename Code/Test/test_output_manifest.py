@@ -0,0 +1,88 @@
+"""Test the decision of which preprocessing outputs are up to date.
+
+To run this unittest run the command "python -m unittest Test.test_output_manifest" from the Code directory.
+
+"""
+
+# Python imports.
+import os
+import shutil
+import tempfile
+import unittest
+
+# User imports.
+import Preprocessing.output_manifest
+
+
+class ParametersHashTest(unittest.TestCase):
+    """Test whether the parameter hash only changes when the cropped images would."""
+
+    def setUp(self):
+        self.cropParams = {"BackgroundThreshold": 220, "MaxFilter": 5, "ObjectsToKeep": [1], "Visualise": False}
+        self.arguments = {"RawCropLevel": 2, "CropParameters": {}, "Workers": 1}
+        self.baseHash = Preprocessing.output_manifest.parameters_hash(self.cropParams, self.arguments)
+
+    def test_unchanged(self):
+        # Settings that don't change the cropped images, and settings given their default value, don't change the hash.
+        for i in [{"Workers": 4}, {"MaskLevel": 2}, {"CropTileSize": 0}, {"OutputFormat": "PNG"}]:
+            self.assertEqual(Preprocessing.output_manifest.parameters_hash(self.cropParams, dict(self.arguments, **i)),
+                             self.baseHash, i)
+        self.assertEqual(Preprocessing.output_manifest.parameters_hash(dict(self.cropParams, Visualise=True),
+                                                                       self.arguments), self.baseHash)
+
+    def test_changed(self):
+        for i in [{"RawCropLevel": 1}, {"MaskLevel": 3}, {"CropTileSize": 1024}, {"OutputFormat": "npy"}]:
+            self.assertNotEqual(
+                Preprocessing.output_manifest.parameters_hash(self.cropParams, dict(self.arguments, **i)),
+                self.baseHash, i)
+        self.assertNotEqual(Preprocessing.output_manifest.parameters_hash(dict(self.cropParams, MaxFilter=7),
+                                                                          self.arguments), self.baseHash)
+        self.assertIsNone(Preprocessing.output_manifest.parameters_hash(None, self.arguments))
+
+
+class StaleOutputsTest(unittest.TestCase):
+    """Test whether the thumbnails and cropped images are regenerated when (and only when) needed."""
+
+    def setUp(self):
+        self.dirTest = tempfile.mkdtemp()
+        self.thumbnails = ["Color/Thumbnails/1_her2.png", "Greyscale/Thumbnails/1_her2.png"]
+        self.crops = ["Color/CroppedImages/1_her2_crop.png"]
+        for i in self.thumbnails + self.crops:
+            os.makedirs(os.path.dirname("{0:s}/{1:s}".format(self.dirTest, i)), exist_ok=True)
+            open("{0:s}/{1:s}".format(self.dirTest, i), 'w').close()
+        self.signature = {"Size": 100, "MTime": 1.5}
+        self.entry = {"Source": self.signature, "ParametersHash": "abc", "Thumbnails": self.thumbnails,
+                      "Crops": self.crops}
+
+    def tearDown(self):
+        shutil.rmtree(self.dirTest)
+
+    def test_up_to_date(self):
+        self.assertEqual(Preprocessing.output_manifest.stale_outputs(self.entry, self.signature, "abc", self.dirTest),
+                         (False, False))
+
+    def test_stale(self):
+        # A WSI with no entry, or that has changed, has all of its outputs regenerated.
+        self.assertEqual(Preprocessing.output_manifest.stale_outputs(None, self.signature, "abc", self.dirTest),
+                         (True, True))
+        self.assertEqual(Preprocessing.output_manifest.stale_outputs(
+            self.entry, {"Size": 100, "MTime": 2.5}, "abc", self.dirTest), (True, True))
+
+        # Changed crop parameters only make the cropped images stale.
+        self.assertEqual(Preprocessing.output_manifest.stale_outputs(self.entry, self.signature, "def", self.dirTest),
+                         (False, True))
+
+        # Missing outputs make only their own kind of output stale.
+        os.remove("{0:s}/{1:s}".format(self.dirTest, self.crops[0]))
+        self.assertEqual(Preprocessing.output_manifest.stale_outputs(self.entry, self.signature, "abc", self.dirTest),
+                         (False, True))
+        os.remove("{0:s}/{1:s}".format(self.dirTest, self.thumbnails[1]))
+        self.assertEqual(Preprocessing.output_manifest.stale_outputs(self.entry, self.signature, "abc", self.dirTest),
+                         (True, True))
+
+    def test_round_trip(self):
+        manifest = {"1_Her2.svs": self.entry}
+        Preprocessing.output_manifest.save(manifest, self.dirTest)
+        self.assertEqual(Preprocessing.output_manifest.load(self.dirTest), manifest)
+        self.assertFalse(os.path.exists("{0:s}/{1:s}.tmp".format(self.dirTest,
+                                                                Preprocessing.output_manifest.MANIFEST_FILE)))
@@ -0,0 +1,83 @@
+"""Test the saving of the preprocessing outputs in the background.
+
+To run this unittest run the command "python -m unittest Test.test_output_writer" from the Code directory.
+
+"""
+
+# Python imports.
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+
+# 3rd party imports.
+import numpy as np
+from PIL import Image
+
+# User imports.
+import Preprocessing.output_writer
+
+
+class OutputWriterTest(unittest.TestCase):
+    """Test whether images are saved, failures are reported and the number of pending images is bounded."""
+
+    def setUp(self):
+        self.dirTest = tempfile.mkdtemp()
+        self.imageArray = np.arange(200, dtype=np.uint8).reshape(10, 20)
+
+    def tearDown(self):
+        shutil.rmtree(self.dirTest)
+
+    def test_shutdown(self):
+        # Shutting down waits for every pending image to be saved.
+        writer = Preprocessing.output_writer.OutputWriter(numThreads=2)
+        fileNames = ["{0:s}/{1:d}_crop.{2:s}".format(self.dirTest, i, "npy" if i % 2 else "png") for i in range(10)]
+        for i in fileNames:
+            writer.save(self.imageArray, i)
+        writer.shutdown()
+        for i in fileNames:
+            savedArray = np.load(i) if i.endswith(".npy") else np.asarray(Image.open(i))
+            np.testing.assert_array_equal(savedArray, self.imageArray, i)
+
+    def test_failure(self):
+        # An exception raised while saving in the background is raised by wait.
+        writer = Preprocessing.output_writer.OutputWriter(numThreads=1)
+        writer.save(self.imageArray, "{0:s}/0_crop.png".format(self.dirTest))
+        writer.save(self.imageArray, "{0:s}/Missing/1_crop.png".format(self.dirTest))
+        pendingWrites = writer.take_pending()
+        self.assertEqual(len(pendingWrites), 2)
+        self.assertEqual(writer.take_pending(), [])
+        with self.assertRaises(FileNotFoundError):
+            Preprocessing.output_writer.wait(pendingWrites)
+        self.assertTrue(os.path.isfile("{0:s}/0_crop.png".format(self.dirTest)))
+        writer.shutdown()
+
+    def test_max_pending(self):
+        # Saving blocks while maxPending images are waiting to be saved, until one of them has been saved.
+        saveStarted = threading.Event()
+        allowSave = threading.Event()
+        savedFiles = []
+
+        def blocked_save(imageArray, fileName):
+            saveStarted.set()
+            allowSave.wait()
+            savedFiles.append(fileName)
+
+        with unittest.mock.patch.object(Preprocessing.output_writer, "_save_image", blocked_save):
+            writer = Preprocessing.output_writer.OutputWriter(numThreads=1, maxPending=1)
+            writer.save(self.imageArray, "0_crop.png")
+            self.assertTrue(saveStarted.wait(5))
+            saveThread = threading.Thread(target=writer.save, args=(self.imageArray, "1_crop.png"))
+            saveThread.start()
+            time.sleep(0.2)
+            self.assertTrue(saveThread.is_alive())
+            self.assertEqual(len(writer.take_pending()), 1)
+
+            allowSave.set()
+            saveThread.join(5)
+            self.assertFalse(saveThread.is_alive())
+            writer.shutdown()
+        self.assertEqual(savedFiles, ["0_crop.png", "1_crop.png"])
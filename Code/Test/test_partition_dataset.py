@@ -46,4 +46,39 @@ class CompletionTest(unittest.TestCase):
                     partitionsClassIn = np.unique(partition[targetArray == k])
                     numInEachPartition = {i: sum(partition[targetArray == k] == i) for i in partitionsClassIn}
                     totalExamplesPartitioned = sum([numInEachPartition[i] for i in numInEachPartition])
-                    self.assertEqual(numObservationsOfClass, totalExamplesPartitioned)
\ No newline at end of file
+                    self.assertEqual(numObservationsOfClass, totalExamplesPartitioned)
+
+
+class SeededTest(unittest.TestCase):
+    """Test whether seeded partitions are reproducible and balanced, and whether the fold indices match them."""
+
+    def setUp(self):
+        self.targetArray = np.random.RandomState(0).randint(4, size=1003)
+        self.dataset = np.empty((1003, 2))
+
+    def test_seeded(self):
+        partition = Utilities.partition_dataset.main(self.dataset, self.targetArray, 5, True, seed=1)
+        np.testing.assert_array_equal(partition,
+                                      Utilities.partition_dataset.main(self.dataset, self.targetArray, 5, True, seed=1))
+        self.assertFalse(np.array_equal(
+            partition, Utilities.partition_dataset.main(self.dataset, self.targetArray, 5, True, seed=2)))
+
+        # Each class, and the dataset as a whole, is spread across the partitions with at most one example difference.
+        self.assertLessEqual(np.ptp(np.bincount(partition)), 1)
+        for i in range(4):
+            self.assertLessEqual(np.ptp(np.bincount(partition[self.targetArray == i], minlength=5)), 1)
+
+    def test_repeated(self):
+        partitions = Utilities.partition_dataset.repeated(self.dataset, self.targetArray, 5, 3, True, seed=1)
+        self.assertEqual(len(partitions), 3)
+        self.assertFalse(np.array_equal(partitions[0], partitions[1]))
+        repeatPartitions = Utilities.partition_dataset.repeated(self.dataset, self.targetArray, 5, 3, True, seed=1)
+        for i, j in zip(partitions, repeatPartitions):
+            np.testing.assert_array_equal(i, j)
+
+    def test_fold_indices(self):
+        partition = Utilities.partition_dataset.main(self.dataset, self.targetArray, 5, False, seed=1)
+        folds = Utilities.partition_dataset.fold_indices(partition, 5)
+        for i, (trainingIndices, testingIndices) in enumerate(folds):
+            np.testing.assert_array_equal(trainingIndices, np.flatnonzero(partition != i))
+            np.testing.assert_array_equal(testingIndices, np.flatnonzero(partition == i))
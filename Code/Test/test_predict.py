@@ -0,0 +1,63 @@
+"""Test the scoring of new images with a saved model artefact.
+
+To run this unittest run the command "python -m unittest Test.test_predict" from the Code directory.
+
+"""
+
+# Python imports.
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+# 3rd party imports.
+import numpy as np
+from sklearn.linear_model import ElasticNet
+
+# User imports.
+import Benchmark.synthetic_data
+import HistogramPrediction.histogram_cache
+import HistogramPrediction.model_artefact
+import HistogramPrediction.predict
+
+
+class PredictTest(unittest.TestCase):
+    """Test whether the scores written for a directory of images are those of the model the artefact was saved from."""
+
+    def setUp(self):
+        self.dirTest = tempfile.mkdtemp()
+        self.dirImages = self.dirTest + "/Images"
+        Benchmark.synthetic_data.create_image_set(self.dirImages, self.dirTest + "/GroundTruth.tsv", 7, 30, 40, seed=5)
+        self.imageFiles = sorted(os.listdir(self.dirImages))
+
+        # Fit a model to the images, and save it along with the settings used to create its features.
+        histograms = HistogramPrediction.histogram_cache.main(
+            ["{0:s}/{1:s}".format(self.dirImages, i) for i in self.imageFiles], None)
+        backgroundMask = np.arange(256) < 220
+        binStarts = HistogramPrediction.model_artefact.bin_starts(220, binWidth=4)
+        self.features = HistogramPrediction.model_artefact.create_features(histograms, backgroundMask, binStarts,
+                                                                           np.float32)
+        self.model = ElasticNet(alpha=0.0001).fit(self.features, np.random.RandomState(0).rand(len(self.imageFiles)))
+        self.fileArtefact = self.dirTest + "/Model.pkl"
+        HistogramPrediction.model_artefact.save(self.fileArtefact, self.model, backgroundMask, {
+            "BinStarts": binStarts, "FeatureType": "float32", "TargetHer2": True})
+
+    def tearDown(self):
+        shutil.rmtree(self.dirTest)
+
+    def test_round_trip(self):
+        expectedScores = self.model.predict(self.features)
+        for batchSize, dirCache in [(256, None), (3, self.dirTest + "/Cache"), (3, self.dirTest + "/Cache")]:
+            fileScores = self.dirTest + "/Scores.tsv"
+            with contextlib.redirect_stdout(io.StringIO()):
+                HistogramPrediction.predict.main({
+                    "ImageLocation": self.dirImages, "ModelLocation": self.fileArtefact, "ScoresLocation": fileScores,
+                    "HistogramCacheLocation": dirCache, "BatchSize": batchSize})
+            with open(fileScores, 'r') as fidScores:
+                lines = [i.rstrip('\n').split('\t') for i in fidScores]
+            self.assertEqual(lines[0], ["Image", "Her2Score"])
+            self.assertEqual([i[0] for i in lines[1:]], self.imageFiles)
+            np.testing.assert_allclose([float(i[1]) for i in lines[1:]], expectedScores, atol=1e-6,
+                                       err_msg="batch size {0:d}".format(batchSize))
@@ -0,0 +1,55 @@
+"""Test the recording of the time and memory used by each stage of a pipeline.
+
+To run this unittest run the command "python -m unittest Test.test_profiling" from the Code directory.
+
+"""
+
+# Python imports.
+import csv
+import json
+import os
+import tempfile
+import unittest
+
+# User imports.
+import Utilities.profiling
+
+
+class ProfilerTest(unittest.TestCase):
+    """Test whether stages are recorded and reported correctly, and not recorded when profiling is disabled."""
+
+    def setUp(self):
+        self.dirTest = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for i in os.listdir(self.dirTest):
+            os.remove("{0:s}/{1:s}".format(self.dirTest, i))
+        os.rmdir(self.dirTest)
+
+    def test_record(self):
+        profiler = Utilities.profiling.Profiler()
+        profiler.item = "1.svs"
+        with profiler.stage("read_crop"):
+            sum(range(100000))
+        with self.assertRaises(ValueError):
+            with profiler.stage("label", "2.svs"):
+                raise ValueError()
+        self.assertEqual([(i["Item"], i["Stage"]) for i in profiler.records], [("1.svs", "read_crop"),
+                                                                              ("2.svs", "label")])
+        self.assertGreater(profiler.records[0]["WallTime"], 0)
+        self.assertGreaterEqual(profiler.records[0]["CPUTime"], 0)
+
+        # The stages can be written as JSON or CSV.
+        profiler.write(self.dirTest + "/Profile.json")
+        with open(self.dirTest + "/Profile.json", 'r') as fidReport:
+            self.assertEqual(json.load(fidReport), profiler.records)
+        profiler.write(self.dirTest + "/Profile.csv")
+        with open(self.dirTest + "/Profile.csv", 'r') as fidReport:
+            self.assertEqual([i["Stage"] for i in csv.DictReader(fidReport)], ["read_crop", "label"])
+
+    def test_disabled(self):
+        profiler = Utilities.profiling.Profiler(enabled=False)
+        with profiler.stage("read_crop"):
+            pass
+        profiler.extend([{"Item": "1.svs", "Stage": "label"}])
+        self.assertEqual(profiler.records, [])
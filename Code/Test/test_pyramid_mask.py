@@ -0,0 +1,52 @@
+"""Test the upsampling of masks created at a low resolution level of a WSI.
+
+To run this unittest run the command "python -m unittest Test.test_pyramid_mask" from the Code directory.
+
+"""
+
+# Python imports.
+import unittest
+
+# 3rd party imports.
+import numpy as np
+
+# User imports.
+import Preprocessing.pyramid_mask
+
+
+def dilate(mask):
+    """Grow a mask by one pixel in every direction (including diagonally)."""
+
+    paddedMask = np.pad(mask, 1)
+    return np.any([paddedMask[i:i + mask.shape[0], j:j + mask.shape[1]] for i in range(3) for j in range(3)], axis=0)
+
+
+class UpsampledMaskTest(unittest.TestCase):
+    """Test whether windows of the upsampled mask match the fully upsampled mask."""
+
+    def setUp(self):
+        self.coarseMask = np.zeros((7, 9), dtype="bool")
+        self.coarseMask[2, 3] = True
+        self.coarseMask[5:7, 7:9] = True
+
+    def test_full(self):
+        # With a whole number scale, each coarse pixel of the grown mask covers a block of fine pixels.
+        mask = Preprocessing.pyramid_mask.UpsampledMask(self.coarseMask, (28, 36))
+        fullMask = np.kron(dilate(self.coarseMask), np.ones((4, 4), dtype="bool")).astype("bool")
+        np.testing.assert_array_equal(mask[:, :], fullMask)
+        np.testing.assert_array_equal(mask.any(axis=1), fullMask.any(axis=1))
+        np.testing.assert_array_equal(mask.any(axis=0), fullMask.any(axis=0))
+
+    def test_windows(self):
+        # Windows at odd offsets, including those running past the edges of a fine shape that isn't a whole multiple of
+        # the coarse shape, are the same windows of the full mask.
+        mask = Preprocessing.pyramid_mask.UpsampledMask(self.coarseMask, (31, 38))
+        grownMask = dilate(self.coarseMask)
+        fullMask = np.array([[grownMask[i * 7 // 31, j * 9 // 38] for j in range(38)] for i in range(31)])
+        np.testing.assert_array_equal(mask[:, :], fullMask)
+        for rowSlice, colSlice in [(slice(0, 5), slice(3, 17)), (slice(13, 31), slice(29, 38)),
+                                   (slice(27, 40), slice(35, 50)), (slice(9, 10), slice(0, 1))]:
+            np.testing.assert_array_equal(mask[rowSlice, colSlice], fullMask[rowSlice, colSlice],
+                                          (rowSlice, colSlice))
+        np.testing.assert_array_equal(mask.any(axis=1), fullMask.any(axis=1))
+        np.testing.assert_array_equal(mask.any(axis=0), fullMask.any(axis=0))
@@ -0,0 +1,66 @@
+"""Test the preprocessing of WSIs in a pool of worker processes.
+
+To run this unittest run the command "python -m unittest Test.test_slide_pool" from the Code directory.
+
+"""
+
+# Python imports.
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+# 3rd party imports.
+try:
+    import openslide
+    import Preprocessing.generate_images
+except ImportError:
+    # OpenSlide isn't available, so the preprocessing can't be tested.
+    openslide = None
+
+# User imports.
+import Benchmark.synthetic_data
+import Preprocessing.output_manifest
+
+
+@unittest.skipIf(openslide is None, "OpenSlide is not installed")
+@unittest.skipIf(Benchmark.synthetic_data.tifffile is None, "tifffile is not installed")
+class SlidePoolTest(unittest.TestCase):
+    """Test whether a WSI that can't be processed is reported without stopping the others being processed."""
+
+    def setUp(self):
+        self.dirTest = tempfile.mkdtemp()
+        self.dirRaw = self.dirTest + "/Raw"
+        self.dirCleaned = self.dirTest + "/Cleaned"
+        os.makedirs(self.dirRaw)
+        for i in [1, 3]:
+            Benchmark.synthetic_data.create_slide("{0:s}/{1:d}_Her2.tif".format(self.dirRaw, i), 300, 260, seed=i)
+        with open(self.dirRaw + "/2_Her2.tif", 'wb') as fidSlide:
+            fidSlide.write(b"This is not a WSI." * 100)
+
+    def tearDown(self):
+        shutil.rmtree(self.dirTest)
+
+    def test_corrupt_slide(self):
+        cropParams = {"BackgroundThreshold": 220, "CropCoordinates": {"Left": {"X": 0.0, "Y": 0.0},
+                                                                      "Right": {"X": 1.0, "Y": 1.0}},
+                      "MaxFilter": 5, "ObjectsToKeep": [1, 2, 3], "Visualise": False}
+        arguments = {
+            "RawImageLocation": self.dirRaw, "CleanedImageLocation": self.dirCleaned,
+            "OpenSlideBinLocation": os.getcwd(), "RawCropLevel": 0, "Workers": 2,
+            "CropParameters": {"{0:d}_her2".format(i): cropParams for i in [1, 2, 3]}
+        }
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            Preprocessing.generate_images.main(arguments)
+        self.assertIn("Failed to process 1 of 3 images:\n\t2_Her2.tif: ", output.getvalue())
+
+        # The other WSIs are processed and recorded in the manifest, along with all of their outputs.
+        manifest = Preprocessing.output_manifest.load(self.dirCleaned)
+        self.assertEqual(sorted(manifest), ["1_Her2.tif", "3_Her2.tif"])
+        for i in manifest.values():
+            self.assertEqual(len(i["Crops"]), 3)
+            for j in i["Thumbnails"] + i["Crops"]:
+                self.assertTrue(os.path.isfile("{0:s}/{1:s}".format(self.dirCleaned, j)), j)
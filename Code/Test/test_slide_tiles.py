@@ -0,0 +1,68 @@
+"""Test the reading of regions of WSIs one tile at a time.
+
+To run this unittest run the command "python -m unittest Test.test_slide_tiles" from the Code directory.
+
+"""
+
+# Python imports.
+import shutil
+import tempfile
+import unittest
+
+# 3rd party imports.
+import numpy as np
+try:
+    import openslide
+except ImportError:
+    # OpenSlide isn't available, so WSIs can't be read.
+    openslide = None
+
+# User imports.
+import Benchmark.synthetic_data
+import Preprocessing.slide_tiles
+
+
+class TileGridTest(unittest.TestCase):
+    """Test whether the tiles cover a region exactly once."""
+
+    def test_grid(self):
+        tiles = list(Preprocessing.slide_tiles.tile_grid((10, 7), 4))
+        self.assertEqual(tiles, [(0, 0, 4, 4), (4, 0, 4, 4), (8, 0, 2, 4), (0, 4, 4, 3), (4, 4, 4, 3), (8, 4, 2, 3)])
+        self.assertEqual(list(Preprocessing.slide_tiles.tile_grid((8, 4), 4)), [(0, 0, 4, 4), (4, 0, 4, 4)])
+
+
+@unittest.skipIf(openslide is None, "OpenSlide is not installed")
+@unittest.skipIf(Benchmark.synthetic_data.tifffile is None, "tifffile is not installed")
+class ReadTilesTest(unittest.TestCase):
+    """Test whether reading a region of a WSI a tile at a time gives the same image as reading it in one go."""
+
+    def setUp(self):
+        self.dirTest = tempfile.mkdtemp()
+        Benchmark.synthetic_data.create_slide(self.dirTest + "/1_Her2.tif", 600, 700, seed=4)
+        self.slide = openslide.OpenSlide(self.dirTest + "/1_Her2.tif")
+
+    def tearDown(self):
+        self.slide.close()
+        shutil.rmtree(self.dirTest)
+
+    def test_regions(self):
+        regionStart = (10, 20)
+        for level in [0, 1]:
+            # Regions both made of whole tiles and with truncated tiles at the right and bottom edges.
+            for regionDimensions in [(256, 128), (250, 170)]:
+                regionImage = self.slide.read_region(regionStart, level, regionDimensions)
+                regionArray = np.asarray(regionImage)
+                message = "level {0:d}, region {1:s}".format(level, str(regionDimensions))
+
+                tiledArray = np.zeros_like(regionArray)
+                for x, y, width, height in Preprocessing.slide_tiles.tile_grid(regionDimensions, 64):
+                    tile = Preprocessing.slide_tiles.read_tile(self.slide, regionStart, level, (x, y), (width, height))
+                    tiledArray[y:y + height, x:x + width] = np.asarray(tile)
+                np.testing.assert_array_equal(tiledArray, regionArray, message)
+
+                np.testing.assert_array_equal(
+                    Preprocessing.slide_tiles.read_greyscale(self.slide, regionStart, level, regionDimensions, 64),
+                    np.asarray(regionImage.convert(mode='L')), message)
+                np.testing.assert_array_equal(
+                    Preprocessing.slide_tiles.histogram(self.slide, level, 64, regionStart, regionDimensions),
+                    np.bincount(regionArray.ravel(), minlength=256), message)
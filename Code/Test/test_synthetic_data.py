@@ -0,0 +1,55 @@
+"""Test the generation of the synthetic data used to benchmark the pipelines.
+
+To run this unittest run the command "python -m unittest Test.test_synthetic_data" from the Code directory.
+
+"""
+
+# Python imports.
+import shutil
+import tempfile
+import unittest
+
+# 3rd party imports.
+import numpy as np
+from PIL import Image
+
+# User imports.
+import Benchmark.synthetic_data
+import HistogramPrediction.ground_truth
+
+
+class SyntheticDataTest(unittest.TestCase):
+    """Test whether the synthetic WSIs and images are generated correctly and reproducibly."""
+
+    def setUp(self):
+        self.dirTest = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirTest)
+
+    def test_image_set(self):
+        Benchmark.synthetic_data.create_image_set(self.dirTest + "/Images", self.dirTest + "/GroundTruth.tsv", 8, 60,
+                                                  40, seed=0)
+        imageArray = np.asarray(Image.open(self.dirTest + "/Images/3_Her2.png"))
+        self.assertEqual((imageArray.shape, imageArray.dtype), ((60, 40), np.uint8))
+
+        # The ground truth can be loaded for the cases, and every Her2 score is used equally.
+        caseGroundTruth = HistogramPrediction.ground_truth.main(self.dirTest + "/GroundTruth.tsv", np.arange(1, 9))
+        self.assertEqual(sorted(caseGroundTruth["Her2Score"]), [0, 0, 1, 1, 2, 2, 3, 3])
+
+    def test_greyscale_image(self):
+        imageArray = Benchmark.synthetic_data.create_greyscale_image(50, 70, seed=1)
+        self.assertEqual(imageArray.shape, (50, 70))
+        np.testing.assert_array_equal(imageArray, Benchmark.synthetic_data.create_greyscale_image(50, 70, seed=1))
+
+    @unittest.skipIf(Benchmark.synthetic_data.tifffile is None, "tifffile is not installed")
+    def test_slide(self):
+        levelDimensions = Benchmark.synthetic_data.create_slide(self.dirTest + "/1_Her2.tif", 1100, 1500, seed=0)
+        self.assertEqual(levelDimensions, [(1500, 1100), (750, 550), (375, 275)])
+
+        # Each level is a rendering of the same blobs, so the lower levels look like shrunken copies of the first.
+        with Benchmark.synthetic_data.tifffile.TiffFile(self.dirTest + "/1_Her2.tif") as slide:
+            levels = [i.asarray() for i in slide.pages]
+        self.assertEqual([i.shape for i in levels], [(1100, 1500, 3), (550, 750, 3), (275, 375, 3)])
+        shrunkLevel = levels[0][:1100, :1500].reshape(550, 2, 750, 2, 3).mean(axis=(1, 3))
+        self.assertLess(np.abs(shrunkLevel - levels[1]).mean(), 15)
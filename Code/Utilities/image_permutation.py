@@ -1,38 +1,149 @@
 """Code to create a permuted image through affine transformations."""
 
 # Python imports.
-import random
+import collections
+import concurrent.futures
+import itertools
 
 # 3rd party imports.
 import numpy as np
+import PIL.Image
 import scipy.ndimage
 
-# Testing imports.
-from matplotlib import pyplot as plt
+# Globals.
+_workerImage = None  # The image being permuted by a worker process.
 
 
-def main(fileImage, maxRotation=0, maxShear=(0,), maxTranslation=(0,), maxScale=(1,), scaleUpProb=(0.5,),
-         jointScale=False, inversionProb=(0.0,), backgroundColor=255):
+def affine_mapping(imageShape, scale=(1, 1), rotation=0, shear=(0, 0), inversion=(False, False), translation=(0, 0)):
+    """Determine how the pixels of a transformed image map back to the original image (see transform).
+
+    :param imageShape:      The (rows, columns) of the image being transformed.
+    :type imageShape:       tuple
+    :param scale:           The scaling factor of the X and Y axes.
+    :type scale:            tuple
+    :param rotation:        The degrees to rotate the image by (positive is counterclockwise).
+    :type rotation:         float
+    :param shear:           The degrees to shear the X and Y axes by.
+    :type shear:            tuple
+    :param inversion:       Whether to invert (flip) the X and Y axes.
+    :type inversion:        tuple
+    :param translation:     The number of pixels to translate the image by along the X and Y axes.
+    :type translation:      tuple
+    :return :               The region of the image that is kept (as a tuple of slices), and the matrix, offset and
+                                output shape that map each (row, column) in the transformed image to its location in
+                                the kept region (as used by scipy.ndimage.affine_transform).
+    :rtype :                tuple, numpy array, numpy array, tuple
+
+    """
+
+    # Keep only the central part of the image that will remain once it's scaled up.
+    scaleX, scaleY = scale
+    numRows, numCols = imageShape
+    keptRows = min(numRows, int(np.ceil(numRows / scaleY)))
+    keptCols = min(numCols, int(np.ceil(numCols / scaleX)))
+    keptRegion = (slice((numRows - keptRows) // 2, (numRows - keptRows) // 2 + keptRows),
+                  slice((numCols - keptCols) // 2, (numCols - keptCols) // 2 + keptCols))
+
+    # Compose the matrix mapping (row, column) coordinates relative to the center of the image to their transformed
+    # location. The shear matrix maps transformed coordinates back to the image (as used by affine_transform), so its
+    # inverse is used.
+    radianRotation = np.deg2rad(rotation)
+    scaleMatrix = np.diag([scaleY, scaleX])
+    rotationMatrix = np.array([[np.cos(radianRotation), -np.sin(radianRotation)],
+                               [np.sin(radianRotation), np.cos(radianRotation)]])
+    shearMatrix = np.array([[1, np.tan(np.deg2rad(shear[1]))], [np.tan(np.deg2rad(shear[0])), 1]])
+    inversionMatrix = np.diag([-1 if inversion[1] else 1, -1 if inversion[0] else 1])
+    forwardMatrix = inversionMatrix.dot(np.linalg.inv(shearMatrix)).dot(rotationMatrix).dot(scaleMatrix)
+    forwardMatrix = np.round(forwardMatrix, 12)  # Stop rounding errors (e.g. cos(90) != 0) sampling past the edges.
+
+    # Determine the size of the output from the transformed locations of the outer corners of the image.
+    corners = np.array([[-keptRows, -keptCols], [-keptRows, keptCols], [keptRows, -keptCols], [keptRows, keptCols]]) / 2
+    transformedCorners = corners.dot(forwardMatrix.T)
+    outputShape = np.ceil(np.round(transformedCorners.max(axis=0) - transformedCorners.min(axis=0), 6)).astype(int)
+
+    # Map the output back to the kept region. The center of the region is mapped to the center of the output (before
+    # translating), so each output pixel at q came from the pixel at inverse(forwardMatrix) (q - outputCenter -
+    # translation) + imageCenter.
+    imageCenter = (np.array([keptRows, keptCols]) - 1) / 2
+    outputCenter = (outputShape - 1) / 2
+    inverseMatrix = np.linalg.inv(forwardMatrix)
+    offset = imageCenter - inverseMatrix.dot(outputCenter + np.array([translation[1], translation[0]]))
+    return keptRegion, inverseMatrix, offset, tuple(int(i) for i in outputShape)
+
+
+def transform(imageArray, scale=(1, 1), rotation=0, shear=(0, 0), inversion=(False, False), translation=(0, 0),
+              backgroundColor=255, order=3):
+    """Apply a set of affine transformations to a greyscale image with a single resampling.
+
+    The transformations are applied in the order scale, rotate, shear and invert (all about the center of the image),
+    followed by the translation. The first four are composed into a single matrix, and the size of the output is
+    determined in advance from where they move the corners of the image, so that the output holds the whole
+    transformed image with no rows or columns of only background around it. The translation then moves the image
+    within the output, clipping any part moved past its edges. When an axis is scaled up, only the central part of the
+    image that would fill the original image size once scaled is kept (i.e. the image is zoomed in on).
+
+    :param imageArray:      The greyscale image to transform.
+    :type imageArray:       numpy array
+    :param scale:           The scaling factor of the X and Y axes.
+    :type scale:            tuple
+    :param rotation:        The degrees to rotate the image by (positive is counterclockwise).
+    :type rotation:         float
+    :param shear:           The degrees to shear the X and Y axes by.
+    :type shear:            tuple
+    :param inversion:       Whether to invert (flip) the X and Y axes.
+    :type inversion:        tuple
+    :param translation:     The number of pixels to translate the image by along the X and Y axes.
+    :type translation:      tuple
+    :param backgroundColor: The value to give the pixels that don't come from the image.
+    :type backgroundColor:  int
+    :param order:           The order of the spline used to interpolate the image.
+    :type order:            int
+    :return :               The transformed image.
+    :rtype :                numpy array
+
     """
 
+    keptRegion, inverseMatrix, offset, outputShape = affine_mapping(
+        imageArray.shape, scale, rotation, shear, inversion, translation)
+    return scipy.ndimage.affine_transform(imageArray[keptRegion], inverseMatrix, offset=offset,
+                                          output_shape=outputShape, output=np.float64, order=order,
+                                          cval=backgroundColor)
+
+
+def load_image(fileImage):
+    """Load a greyscale image to permute.
+
+    :param fileImage:   The location of the image.
+    :type fileImage:    str
+    :return :           The image (converted to greyscale if needed).
+    :rtype :            numpy array
+
+    """
+
+    image = PIL.Image.open(fileImage)
+    return np.array(image if image.mode == 'L' else image.convert(mode='L'))
+
+
+def sample_parameters(randomState, maxRotation=0, maxShear=(0,), maxTranslation=(0,), maxScale=(1,),
+                      scaleUpProb=(0.5,), jointScale=False, inversionProb=(0.0,)):
+    """Randomly choose the transformations to permute an image with.
+
     Transformations are treated as symmetric. A maximum rotation of 45 degrees is therefore a maximum rotation
     of 45 degrees clockwise and 45 degrees counterclockwise, thereby giving you a maximum total rotation of 90 degrees.
 
     sacle up prob is the probability of scaling up compared to scaling down
 
-    we would need to center the image at (0, 0) first. However, at present
-    # doing this causes the image to clip, and so the full transformation is done in non-clipping steps.
-
     joint scaling will cause the x axis scalingto be calcualted and then used for both axes (any entry in the maxScale
     list/tuple except the first will be ignroed)
 
-    Perform operations sequentially in order to gain the desired control over the output.
+    :param randomState: The random number generator to choose the transformations with.
+    :type randomState:  numpy RandomState
+    :return :           The chosen transformations, as the keyword arguments of transform (scale, rotation, shear,
+                            translation and inversion).
+    :rtype :            dict
 
     """
 
-    # Load the image and determine its size.
-    imageArray = scipy.ndimage.imread(fileImage)
-
     # Create the scaling factors.
     # The difficulty with this is ensuring that the probability of scaling up and down is similar.
     # For example, if maxXScale == 5, then the probability of getting a scale value in (1, 5] is far greater
@@ -44,8 +155,8 @@ def main(fileImage, maxRotation=0, maxShear=(0,), maxTranslation=(0,), maxScale=
     scaleX = 1
     scaleY = 1
     if maxXScale > 1:
-        scaleX = random.uniform(1, maxXScale)
-        scaleXDown = random.random() < scaleUpProb[0]
+        scaleX = randomState.uniform(1, maxXScale)
+        scaleXDown = randomState.random_sample() < scaleUpProb[0]
         scaleX = (1. / scaleX) if scaleXDown else scaleX
     if maxYScale > 1:
         if jointScale:
@@ -53,104 +164,137 @@ def main(fileImage, maxRotation=0, maxShear=(0,), maxTranslation=(0,), maxScale=
             scaleY = scaleX
         else:
             # Potentially scale the axes differently.
-            scaleY = random.uniform(1, maxYScale)
-            scaleYDown = random.random() < (scaleUpProb[1] if len(scaleUpProb) > 1 else scaleUpProb[0])
+            scaleY = randomState.uniform(1, maxYScale)
+            scaleYDown = randomState.random_sample() < (scaleUpProb[1] if len(scaleUpProb) > 1 else scaleUpProb[0])
             scaleY = (1. / scaleY) if scaleYDown else scaleY
 
     # Calculate the degree of rotation.
-    degreeRotation = random.uniform(0, maxRotation * 2) - maxRotation
+    degreeRotation = randomState.uniform(0, maxRotation * 2) - maxRotation
 
-    # Create the shear matrix.
-    shearMatrix = np.identity(2)
+    # Calculate the degree of shear.
     maxXShear = maxShear[0]
     maxYShear = maxShear[1] if len(maxShear) > 1 else maxShear[0]
-    degreeShearX = random.uniform(0, maxXShear * 2) - maxXShear
-    degreeShearY = random.uniform(0, maxYShear * 2) - maxYShear
-    radianShearX = np.deg2rad(degreeShearX)
-    radianShearY = np.deg2rad(degreeShearY)
-    shearMatrix[0, 1] = np.tan(radianShearY)
-    shearMatrix[1, 0] = np.tan(radianShearX)
+    degreeShearX = randomState.uniform(0, maxXShear * 2) - maxXShear
+    degreeShearY = randomState.uniform(0, maxYShear * 2) - maxYShear
 
     # Create the translation.
     maxXTranslation = maxTranslation[0]
     maxYTranslation = maxTranslation[1] if len(maxTranslation) > 1 else maxTranslation[0]
-    translationX = random.randint(0, maxXTranslation)
-    translationY = random.randint(0, maxYTranslation)
+    translationX = randomState.randint(0, maxXTranslation + 1)
+    translationY = randomState.randint(0, maxYTranslation + 1)
 
     # Determine whether to invert the axes.
     xInversionProb = inversionProb[0]
     yInversionProb = inversionProb[1] if len(inversionProb) > 1 else inversionProb[0]
-    isXInverted = random.random() < xInversionProb
-    isYInverted = random.random() < yInversionProb
-
-    # Create the transformed image.
-    transformedImage = np.empty(imageArray.shape)  # Create the correctly sized transformed image.
-    transformedImage.fill(backgroundColor)  # Fill the transformed image with only background.
-
-    # Scale the image. The goal is to 'zoom' in or out of the image while keeping the array the same size.
-    # This works by first zooming, and then placing the portion of the zoomed image desired into a correctly sized
-    # (and possibly padded) array.
-    # For example, if the zoom factor is 2, then the result of scipy.ndimage.zoom will be an array that is twice
-    # the desired size. In order to resize this, the central portion of the zoomed array is taken and placed into
-    # the transformed array. If the zoom factor was a fraction, then the entire zoomed image would be placed into
-    # the transformed array with background padding around it.
-    zoomedImage = scipy.ndimage.zoom(imageArray, [scaleY, scaleX], cval=backgroundColor)  # Zoom.
-    transSlice = {'X': [0, transformedImage.shape[1]],
-                  'Y': [0, transformedImage.shape[0]]}  # Slice of the transformed image where the zoom will be placed.
-    zoomSlice = {'X': [0, zoomedImage.shape[1]],
-                 'Y': [0, zoomedImage.shape[0]]}  # Slice of the zoomed image to copy into the transformed image.
-    pixelDifference = [abs(i - j) for i, j in zip(imageArray.shape, zoomedImage.shape)]  # Image size difference.
-    if scaleX < 1:
-        # The zoomed image is smaller along the X axis than it should be. Take the zoomed image and center it along
-        # the transformed image's X axis.
-        transSlice['X'][0] = int(np.floor(pixelDifference[1] / 2))
-        transSlice['X'][1] = transSlice['X'][0] + zoomedImage.shape[1]
-    elif scaleX > 1:
-        # The zoomed image is larger along the X axis than it should be. Take the zoomed image and remove some of
-        # the left and right columns of pixels.
-        zoomSlice['X'][0] = int(np.floor(pixelDifference[1] / 2))
-        zoomSlice['X'][1] = zoomSlice['X'][0] + transformedImage.shape[1]
-    if scaleY < 1:
-        # The zoomed image is smaller along the Y axis than it should be. Take the zoomed image and center it along
-        # the transformed image's Y axis.
-        transSlice['Y'][0] = int(np.floor(pixelDifference[0] / 2))
-        transSlice['Y'][1] = transSlice['Y'][0] + zoomedImage.shape[0]
-    elif scaleY > 1:
-        # The zoomed image is larger along the Y axis than it should be. Take the zoomed image and remove some of
-        # the top and bottom of pixels.
-        zoomSlice['Y'][0] = int(np.floor(pixelDifference[0] / 2))
-        zoomSlice['Y'][1] = zoomSlice['Y'][0] + transformedImage.shape[0]
-    transformedImage[transSlice['Y'][0]:transSlice['Y'][1], transSlice['X'][0]:transSlice['X'][1]] = \
-        zoomedImage[zoomSlice['Y'][0]:zoomSlice['Y'][1], zoomSlice['X'][0]:zoomSlice['X'][1]]
-
-    # Rotate the image. This must be done with ndimage.rotate rather than ndimage.affine_transform as we want to rotate
-    # around the center of the image. If we used affine_transform, then the rotation would be performed around (0, 0).
-    # This could be countered by setting the center of the image to (0, 0), but then the rotation clips the image.
-    transformedImage = scipy.ndimage.rotate(transformedImage, degreeRotation, cval=backgroundColor)
-
-    # Shear the image. This can be done with affine_transform as we don't need it to occur at the center of the image.
-    transformedImage = scipy.ndimage.affine_transform(transformedImage, shearMatrix, cval=backgroundColor)
-
-    # Crop out any excess rows and columns that consist only of background pixels.
-    backgroundRows = np.all(transformedImage == backgroundColor, axis=1)
-    backgroundCols = np.all(transformedImage == backgroundColor, axis=0)
-    transformedImage = transformedImage[~backgroundRows, :][:, ~backgroundCols]
-
-    # Invert the image.
-    if isXInverted:
-        transformedImage = np.fliplr(transformedImage)
-    if isYInverted:
-        transformedImage = np.flipud(transformedImage)
-
-    # Translate the image.
-    transformedImage = scipy.ndimage.shift(transformedImage, [translationX, translationY], cval=backgroundColor)
-
-    print("Translation : ", translationX, translationY)
-    print("Inverserion : ", isXInverted, isYInverted)
-    print("Shear : ", degreeShearX, degreeShearY)
-    print("Scaled : ", scaleX, scaleY)
-    print("Rotation", degreeRotation)
-    plt.imshow(transformedImage, cmap="Greys_r")
-    plt.show()
+    isXInverted = randomState.random_sample() < xInversionProb
+    isYInverted = randomState.random_sample() < yInversionProb
+
+    return {"scale": (scaleX, scaleY), "rotation": degreeRotation, "shear": (degreeShearX, degreeShearY),
+            "translation": (int(translationX), int(translationY)), "inversion": (bool(isXInverted), bool(isYInverted))}
+
+
+def _initialise_worker(imageArray):
+    """Store the image being permuted in a newly started worker process, so that it's only sent to each worker once.
+
+    :param imageArray:  The image being permuted.
+    :type imageArray:   numpy array
+
+    """
+
+    global _workerImage
+    _workerImage = imageArray
+
+
+def _transform_worker_image(parameters, backgroundColor):
+    """Permute the image stored in a worker process (see transform)."""
+
+    return transform(_workerImage, backgroundColor=backgroundColor, **parameters)
+
+
+def generate(imageArray, numPermutations, seed=None, numWorkers=1, backgroundColor=255, **permutationRanges):
+    """Generate a set of randomly permuted versions of an image.
+
+    The transformations for every permutation are chosen up front from a random number generator seeded with the
+    given seed, so the same seed always gives the same permutations, however many workers are used. With more than one
+    worker, the permutations are created in a pool of processes that are each sent the image once, and are generated
+    in the order their transformations were chosen. At most twice as many permutations as there are workers are held
+    at once, and closing the generator early cancels the permutations that haven't been started.
+
+    :param imageArray:          The greyscale image to permute.
+    :type imageArray:           numpy array
+    :param numPermutations:     The number of permutations to generate.
+    :type numPermutations:      int
+    :param seed:                The seed for the random number generator. Defaults to a random seed.
+    :type seed:                 int
+    :param numWorkers:          The number of processes to create the permutations with.
+    :type numWorkers:           int
+    :param backgroundColor:     The value to give the pixels that don't come from the image.
+    :type backgroundColor:      int
+    :param permutationRanges:   The ranges to choose the transformations from (see sample_parameters).
+    :type permutationRanges:    keyword arguments
+    :return :                   Each permuted image along with the transformations that created it.
+    :rtype :                    generator of (numpy array, dict)
+
+    """
+
+    randomState = np.random.RandomState(seed)
+    parameterList = [sample_parameters(randomState, **permutationRanges) for _ in range(numPermutations)]
+    if numWorkers < 2 or numPermutations < 2:
+        for i in parameterList:
+            yield transform(imageArray, backgroundColor=backgroundColor, **i), i
+        return
+
+    # Only a window of permutations is in progress (or finished but not yet yielded) at any time, so that the memory
+    # used doesn't grow with the number of permutations. The window is topped up as each permutation is yielded.
+    numWorkers = min(numWorkers, numPermutations)
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=numWorkers, initializer=_initialise_worker,
+                                                      initargs=(imageArray,))
+    parameterIterator = iter(parameterList)
+    pendingPermutations = collections.deque()
+    try:
+        for i in itertools.islice(parameterIterator, 2 * numWorkers):
+            pendingPermutations.append((executor.submit(_transform_worker_image, i, backgroundColor), i))
+        while pendingPermutations:
+            permutation, parameters = pendingPermutations.popleft()
+            permutedImage = permutation.result()
+            for i in itertools.islice(parameterIterator, 1):
+                pendingPermutations.append((executor.submit(_transform_worker_image, i, backgroundColor), i))
+            yield permutedImage, parameters
+    finally:
+        # If the generator is closed early, then the permutations that haven't been started are abandoned rather than
+        # waited for.
+        for permutation, _ in pendingPermutations:
+            permutation.cancel()
+        executor.shutdown(wait=True)
+
+
+def main(fileImage, maxRotation=0, maxShear=(0,), maxTranslation=(0,), maxScale=(1,), scaleUpProb=(0.5,),
+         jointScale=False, inversionProb=(0.0,), backgroundColor=255, seed=None, visualise=False):
+    """Create a single randomly permuted version of an image file.
+
+    See sample_parameters for how the transformations are chosen. To create many permutations of the same image use
+    generate, which only loads the image once.
+
+    visualise prints the chosen transformations and displays the permuted image
+
+    """
+
+    # Load the image, and choose and apply the transformations.
+    imageArray = load_image(fileImage)
+    transformedImage, parameters = next(generate(
+        imageArray, 1, seed=seed, backgroundColor=backgroundColor, maxRotation=maxRotation, maxShear=maxShear,
+        maxTranslation=maxTranslation, maxScale=maxScale, scaleUpProb=scaleUpProb, jointScale=jointScale,
+        inversionProb=inversionProb))
+
+    if visualise:
+        # Only import matplotlib when it's needed, so that permutations can be created without a display.
+        from matplotlib import pyplot as plt
+        print("Translation : ", *parameters["translation"])
+        print("Inverserion : ", *parameters["inversion"])
+        print("Shear : ", *parameters["shear"])
+        print("Scaled : ", *parameters["scale"])
+        print("Rotation", parameters["rotation"])
+        plt.imshow(transformedImage, cmap="Greys_r")
+        plt.show()
 
     return transformedImage
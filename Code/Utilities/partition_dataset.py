@@ -2,24 +2,75 @@
 
 # Python imports.
 import numbers
-import random
-import sys
 
 # 3rd party imports.
 import numpy as np
 
 
-def main(dataset, target, numPartitions=1, isStratified=False):
+def fold_indices(partition, numPartitions):
+    """Determine the indices of the training and testing examples of each CV fold.
+
+    :param partition:       The partition (from 0..numPartitions-1) that each example belongs to.
+    :type partition:        numpy array
+    :param numPartitions:   The number of partitions.
+    :type numPartitions:    int
+    :return :               For each fold, the indices of the examples trained on (those not in the fold's partition)
+                                and tested on (those in the fold's partition). The indices are in increasing order.
+    :rtype :                list of (numpy array, numpy array) tuples
+
+    """
+
+    # Group the examples by partition. A stable sort keeps the examples in each partition in increasing order.
+    partition = np.asarray(partition, dtype=np.int64)
+    examplesByPartition = np.argsort(partition, kind="stable")
+    partitionBoundaries = np.concatenate([[0], np.cumsum(np.bincount(partition, minlength=numPartitions))])
+    return [(np.flatnonzero(partition != i), examplesByPartition[partitionBoundaries[i]:partitionBoundaries[i + 1]])
+            for i in range(numPartitions)]
+
+
+def repeated(dataset, target, numPartitions=1, numRepeats=1, isStratified=False, seed=None):
+    """Partition a dataset into CV folds multiple times, with a different shuffle of the examples each time.
+
+    :param dataset:         The dataset, with one row per example.
+    :type dataset:          numpy array
+    :param target:          The target value of each example, or the index of the column of the dataset containing them.
+    :type target:           numpy array or int
+    :param numPartitions:   The number of partitions to split the dataset into each time.
+    :type numPartitions:    int
+    :param numRepeats:      The number of times to partition the dataset.
+    :type numRepeats:       int
+    :param isStratified:    Whether each class should be spread evenly across the partitions.
+    :type isStratified:     bool
+    :param seed:            The seed for the random number generator used to shuffle the examples. Defaults to a
+                                random seed.
+    :type seed:             int
+    :return :               The partition of the dataset made each time (see main).
+    :rtype :                list of numpy arrays
+
+    """
+
+    randomState = np.random.RandomState(seed)
+    return [main(dataset, target, numPartitions, isStratified, randomState) for _ in range(numRepeats)]
+
+
+def main(dataset, target, numPartitions=1, isStratified=False, seed=None):
     """Partition a dataset into CV folds.
 
-    :param dataset:
-    :type dataset:
-    :param targetIndex:
-    :type targetIndex:
-    :param numPartitions:
-    :type numPartitions:
-    :param isStratified:
-    :type isStratified:
+    The examples are shuffled and then dealt out to the partitions in turn, so that the partitions differ in size by
+    at most one example. When stratifying, the examples are shuffled within each class, and the classes are dealt out
+    one after another, so that each class is also spread across the partitions with at most one example difference.
+
+    :param dataset:         The dataset, with one row per example.
+    :type dataset:          numpy array
+    :param target:          The target value of each example, or the index of the column of the dataset containing them.
+    :type target:           numpy array or int
+    :param numPartitions:   The number of partitions to split the dataset into.
+    :type numPartitions:    int
+    :param isStratified:    Whether each class should be spread evenly across the partitions.
+    :type isStratified:     bool
+    :param seed:            The seed for the random number generator used to shuffle the examples (or the random number
+                                generator itself). Defaults to a random seed.
+    :type seed:             int or numpy RandomState
     :return :               A 1 dimensional array containing the partition to which each example in the dataset belongs.
                                 Each entry records the partition (from 0..numPartitions-1) that the example
                                 belongs to.
@@ -27,52 +78,26 @@ def main(dataset, target, numPartitions=1, isStratified=False):
 
     """
 
-    # Perform the partitioning.
-    if isStratified:
-        # Used stratified partitioning.
+    numExamples = dataset.shape[0]
+    if numPartitions < 2:
+        # If no partitioning is requested, then stick every example in the same partition.
+        return np.zeros(numExamples, dtype=np.int64)
 
+    # Shuffle the examples.
+    randomState = seed if isinstance(seed, np.random.RandomState) else np.random.RandomState(seed)
+    exampleOrder = randomState.permutation(numExamples)
+
+    if isStratified:
         # Determine the target vector.
         if isinstance(target, numbers.Integral):
             # If the target provided is an integer, then treat it as the index of the column containing the targets.
             target = dataset[:, target]
 
-        # Create the array to hold the partition.
-        partition = np.empty(dataset.shape[0])
-        partition.fill(np.nan)
-
-        # Determine the different classes in the dataset.
-        differentClasses = np.unique(target)
-
-        # Perform the partitioning.
-        for i in differentClasses:
-            # Determine the indices of the examples in this class.
-            classExampleIndices = np.nonzero(target == i)[0]
-
-            # Partition the examples in this class.
-            for i in range(numPartitions):
-                # For each class, assign a roughly equal subset of the examples to each partition.
-                indicesInThisPartition = classExampleIndices[i::numPartitions]
-                partition[indicesInThisPartition] = i
-    else:
-        # Do not stratify the partitions.
-        # Create random partitions where each partition has an (almost) equal number of examples.
-
-        # Create the array to hold the partition.
-        partition = np.empty(dataset.shape[0])
-        partition.fill(np.nan)
-
-        # Create a permuted list of the indices of the examples in the dataset.
-        exampleIndices = np.random.permutation(dataset.shape[0])
-
-        if numPartitions < 2:
-            # If no partitioning is requested, then stick every example in the same partition.
-            partition.fill(0)
-        else:
-            # Partition the dataset.
-            for i in range(numPartitions):
-                # For each partition, select a roughly equal subset of the examples.
-                # These examples will then belong to partition i.
-                indicesInThisPartition = exampleIndices[i::numPartitions]
-                partition[indicesInThisPartition] = i
-
-    return partition
\ No newline at end of file
+        # Group the shuffled examples by class. A stable sort keeps the examples of each class in their shuffled order.
+        _, exampleClasses = np.unique(target, return_inverse=True)
+        exampleOrder = exampleOrder[np.argsort(exampleClasses.ravel()[exampleOrder], kind="stable")]
+
+    # Deal the examples out to the partitions in turn.
+    partition = np.empty(numExamples, dtype=np.int64)
+    partition[exampleOrder] = np.arange(numExamples) % numPartitions
+    return partition
@@ -0,0 +1,128 @@
+"""Code to record the time and memory used by each stage of a pipeline."""
+
+# Python imports.
+import contextlib
+import csv
+import json
+import sys
+import time
+try:
+    import resource
+except ImportError:
+    # The resource module is only available on Unix, so the peak memory use can't be recorded on Windows.
+    resource = None
+
+# Globals.
+REPORT_COLUMNS = ["Item", "Stage", "WallTime", "CPUTime", "PeakRSS"]  # The fields recorded for each stage.
+_DISABLED_STAGE = contextlib.nullcontext()  # The (reusable) stage returned when profiling is disabled.
+
+
+def peak_rss(children=False):
+    """Determine the peak resident set size of the current process.
+
+    :param children:    Whether to determine the peak of the (finished) child processes of the current process instead.
+                            This is the peak of the largest child, not the sum over the children.
+    :type children:     bool
+    :return :           The largest amount of memory (in bytes) that the process has held in RAM at any point so far,
+                            or None if this can't be determined on the current platform.
+    :rtype :            int
+
+    """
+
+    if resource is None:
+        return None
+    peakUsage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return peakUsage if sys.platform == "darwin" else peakUsage * 1024  # Linux reports kilobytes, macOS bytes.
+
+
+class Profiler(object):
+    """A recorder of the wall time, CPU time and peak memory use of the stages of a pipeline.
+
+    Each stage is timed by wrapping it in a with statement, and is recorded against the item (e.g. the WSI or image)
+    that it was run for. As the peak resident set size can only increase, the peak recorded for a stage is the peak
+    for the process up to the end of the stage. A stage that uses much more memory than the ones before it will
+    therefore show up as a jump in the recorded peak.
+
+    When the profiler is disabled, stages are not timed and nothing is recorded, so the profiler can be left in place
+    at (almost) no cost.
+
+    """
+
+    def __init__(self, enabled=True):
+        """Initialise the profiler.
+
+        :param enabled:     Whether the stages should be recorded.
+        :type enabled:      bool
+
+        """
+
+        self.enabled = enabled
+        self.item = None  # The item that stages are recorded against when no item is given.
+        self.records = []
+
+    def stage(self, stageName, item=None, threadCPUTime=False):
+        """Record the resources used by a stage.
+
+        Usage is: with profiler.stage("label"): ...
+
+        :param stageName:       The name of the stage.
+        :type stageName:        str
+        :param item:            The item that the stage is run for. Defaults to the profiler's current item.
+        :type item:             str
+        :param threadCPUTime:   Whether to record the CPU time of the current thread only, rather than of the whole
+                                    process. This should be used for stages run in background threads, so that the work
+                                    of the other threads isn't counted.
+        :type threadCPUTime:    bool
+        :return :               The context manager that records the stage.
+        :rtype :                context manager
+
+        """
+
+        if not self.enabled:
+            return _DISABLED_STAGE
+        return self._record_stage(stageName, self.item if item is None else item, threadCPUTime)
+
+    @contextlib.contextmanager
+    def _record_stage(self, stageName, item, threadCPUTime):
+        """Record the resources used by a stage (see stage)."""
+
+        cpuClock = time.thread_time if threadCPUTime else time.process_time
+        startWallTime = time.perf_counter()
+        startCPUTime = cpuClock()
+        try:
+            yield
+        finally:
+            # Appending to a list is atomic, so stages can be recorded from multiple threads.
+            self.records.append({
+                "Item": item, "Stage": stageName, "WallTime": time.perf_counter() - startWallTime,
+                "CPUTime": cpuClock() - startCPUTime, "PeakRSS": peak_rss()
+            })
+
+    def extend(self, records):
+        """Add the stages recorded by another profiler (e.g. one in a worker process).
+
+        :param records:     The stages to add.
+        :type records:      list of dict
+
+        """
+
+        if self.enabled:
+            self.records.extend(records)
+
+    def write(self, fileReport):
+        """Write the recorded stages to a report.
+
+        :param fileReport:  The location to write the report to. The report is written as CSV if this ends with .csv,
+                                and as JSON otherwise.
+        :type fileReport:   str
+
+        """
+
+        if fileReport.lower().endswith(".csv"):
+            with open(fileReport, 'w', newline='') as fidReport:
+                writer = csv.DictWriter(fidReport, fieldnames=REPORT_COLUMNS)
+                writer.writeheader()
+                writer.writerows(self.records)
+        else:
+            with open(fileReport, 'w') as fidReport:
+                json.dump(self.records, fidReport, indent=1)